@@ -0,0 +1,168 @@
+# admission.py
+from collections import OrderedDict
+from typing import Optional
+import logging
+import math
+import os
+import time
+
+import mcp_client
+from metrics import registry
+
+# Admission control shared by the chat and direct protocols. Requests that need
+# the MCP servers take tokens from a bucket whose refill rate follows what the
+# pool can actually serve (live call slots / average call latency); when the
+# bucket is empty or the pool queue is too deep they get an immediate "busy"
+# reply instead of queueing behind other scrapes. Requests the search cache
+# can answer skip the shared bucket. Each sender also has its own smaller bucket,
+# except relays listed in ADMISSION_EXEMPT_SENDERS, which get one per chat session.
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_BURST_FACTOR = float(os.getenv("ADMISSION_BURST_FACTOR", "2"))  # bucket size, in pool call slots
+ADMISSION_MAX_QUEUE_FACTOR = float(os.getenv("ADMISSION_MAX_QUEUE_FACTOR", "4"))  # queued calls allowed, in slots
+ADMISSION_MIN_RATE = float(os.getenv("ADMISSION_MIN_RATE", "0.2"))  # requests/second, whatever the latency
+ADMISSION_DEFAULT_LATENCY = float(os.getenv("ADMISSION_DEFAULT_LATENCY", "5"))  # seconds, before any call finished
+ADMISSION_SENDER_BURST = float(os.getenv("ADMISSION_SENDER_BURST", "10"))
+ADMISSION_SENDER_RATE_PER_MINUTE = float(os.getenv("ADMISSION_SENDER_RATE_PER_MINUTE", "30"))
+ADMISSION_MAX_SENDERS = int(os.getenv("ADMISSION_MAX_SENDERS", "10000"))
+# Senders that relay many users (such as ASI:One) share no per-sender bucket; their chat
+# sessions get one each instead, as new session ids come for free to any other sender
+ADMISSION_EXEMPT_SENDERS = {
+    address.strip() for address in os.getenv("ADMISSION_EXEMPT_SENDERS", "").split(",") if address.strip()
+}
+
+logger = logging.getLogger("admission")
+
+decisions_total = registry.counter(
+    "airbnb_admission_decisions_total", "Admission decisions by outcome (admitted, cached, shed) and reason")
+
+class TokenBucket:
+    """Token bucket whose rate and capacity can be changed between requests"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, cost: float = 1.0) -> bool:
+        self._refill()
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True
+        return False
+
+    def wait_time(self, cost: float = 1.0) -> float:
+        """Seconds until cost tokens will be available"""
+        self._refill()
+        missing = min(cost, self.capacity) - self.tokens
+        return 0.0 if missing <= 0 else missing / self.rate
+
+class Decision:
+    """Outcome of an admission check"""
+
+    __slots__ = ("admitted", "reason", "retry_after")
+
+    def __init__(self, admitted: bool, reason: str, retry_after: float = 0.0):
+        self.admitted = admitted
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def busy_message(self) -> str:
+        wait = max(1, math.ceil(self.retry_after))
+        return f"I'm handling a lot of requests right now. Please try again in about {wait} seconds."
+
+class AdmissionController:
+    """Decides whether a request may use the MCP servers now"""
+
+    def __init__(self):
+        self.bucket = TokenBucket(rate=1.0, capacity=1.0)
+        self._senders = OrderedDict()  # sender -> TokenBucket, least recently seen first
+
+    def _resize(self):
+        """Size the shared bucket to the pool's current capacity and latency"""
+        pool = mcp_client.mcp_pool
+        slots = pool.capacity() if pool is not None else 0
+        latency = (pool.latency_estimate if pool is not None else None) or ADMISSION_DEFAULT_LATENCY
+        capacity = max(1.0, slots * ADMISSION_BURST_FACTOR)
+        # Servers coming up (or back) add their burst right away; losing them caps what is left
+        self.bucket.tokens = min(capacity, self.bucket.tokens + max(0.0, capacity - self.bucket.capacity))
+        self.bucket.capacity = capacity
+        self.bucket.rate = max(ADMISSION_MIN_RATE, slots / latency)
+        return pool, slots, latency
+
+    def headroom(self) -> float:
+        """Share of the shared bucket available right now, from 0 (empty) to 1 (full)"""
+        self._resize()
+        self.bucket._refill()
+        return self.bucket.tokens / self.bucket.capacity
+
+    def _sender_bucket(self, sender: str, session: Optional[str] = None) -> Optional[TokenBucket]:
+        key = sender
+        if sender in ADMISSION_EXEMPT_SENDERS:
+            key = f"{sender}/{session}" if session else None
+        if not key:
+            return None
+        bucket = self._senders.get(key)
+        if bucket is None:
+            bucket = TokenBucket(ADMISSION_SENDER_RATE_PER_MINUTE / 60, ADMISSION_SENDER_BURST)
+            self._senders[key] = bucket
+            while len(self._senders) > ADMISSION_MAX_SENDERS:
+                self._senders.popitem(last=False)
+        else:
+            self._senders.move_to_end(key)
+        return bucket
+
+    def admit(self, sender: str, cost: float = 1.0, cached: bool = False, session: Optional[str] = None) -> Decision:
+        """Check a request costing `cost` MCP calls; cached requests skip the shared bucket
+
+        session only matters for exempt relays, whose per-sender bucket is kept per session.
+        """
+        if not ADMISSION_ENABLED:
+            return Decision(True, "disabled")
+
+        sender_bucket = self._sender_bucket(sender, session)
+        if sender_bucket is not None and not sender_bucket.try_take(1.0):
+            return self._record(Decision(False, "sender_rate", sender_bucket.wait_time(1.0)))
+
+        if cached:
+            return self._record(Decision(True, "cached"))
+
+        pool, slots, latency = self._resize()
+        if pool is None or slots == 0:
+            # Nothing to protect; the request fails fast with a connection error instead
+            return self._record(Decision(True, "no_pool"))
+
+        if pool.in_flight() >= slots * ADMISSION_MAX_QUEUE_FACTOR:
+            self._refund(sender_bucket)
+            return self._record(Decision(False, "queue_full", latency))
+
+        # A batch bigger than the whole bucket still gets in once the bucket is full
+        cost = min(cost, self.bucket.capacity)
+        if not self.bucket.try_take(cost):
+            self._refund(sender_bucket)
+            return self._record(Decision(False, "rate", self.bucket.wait_time(cost)))
+
+        return self._record(Decision(True, "admitted"))
+
+    @staticmethod
+    def _refund(sender_bucket: Optional[TokenBucket]):
+        # A shed request should not also use up the sender's allowance
+        if sender_bucket is not None:
+            sender_bucket.tokens = min(sender_bucket.capacity, sender_bucket.tokens + 1.0)
+
+    def _record(self, decision: Decision) -> Decision:
+        if decision.admitted:
+            outcome = "cached" if decision.reason == "cached" else "admitted"
+        else:
+            outcome = "shed"
+            logger.warning("Shedding request (%s), retry after %.1fs", decision.reason, decision.retry_after)
+        decisions_total.inc(outcome=outcome, reason=decision.reason)
+        return decision
+
+# Shared by every protocol handler
+admission = AdmissionController()
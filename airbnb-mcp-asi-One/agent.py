@@ -1,14 +1,23 @@
 # agent.py
 import os
 from enum import Enum
+from typing import Optional
 import asyncio
 
 from uagents import Agent, Context, Model
 from uagents.experimental.quota import QuotaProtocol, RateLimit
 from uagents_core.models import ErrorMessage
 
-from chat_proto import chat_proto, AirbnbRequest, AirbnbResponse, struct_output_client_proto
-from mcp_client import connect_to_airbnb_mcp, cleanup_mcp_connection, search_airbnb_listings
+from chat_proto import chat_proto, AirbnbRequest, AirbnbResponse, send_timed, struct_output_client_proto
+from metrics import start_metrics_server
+from mcp_client import (
+    connect_to_airbnb_mcp, cleanup_mcp_connection, search_airbnb_listings, get_airbnb_listing_details, is_search_cached,
+    normalize_date_windows
+)
+from admission import admission
+from listings import normalize_min_rating, normalize_sort_by
+from health import HEALTH_PROBE_INTERVAL_SECONDS, health_monitor
+from prewarm import PREWARM_INTERVAL_SECONDS, cache_prewarmer
 
 # Create the agent
 agent = Agent(
@@ -29,25 +38,25 @@ proto = QuotaProtocol(
 )
 
 # Health check implementation
-def agent_is_healthy() -> bool:
-    """Check if the agent's Airbnb capabilities are working"""
-    try:
-        from mcp_client import mcp_session
-        return mcp_session is not None
-    except Exception as e:
-        print(f"Health check failed: {e}")
-        return False
-
 class HealthCheck(Model):
     pass
 
 class HealthStatus(str, Enum):
     HEALTHY = "healthy"
+    DEGRADED = "degraded"
     UNHEALTHY = "unhealthy"
 
 class AgentHealth(Model):
     agent_name: str
     status: HealthStatus
+    servers_connected: int = 0
+    servers_total: int = 0
+    probe_latency_ms: Optional[float] = None
+    in_flight: int = 0
+    queue_depth: int = 0
+    cache_hit_rate: float = 0.0
+    last_error: Optional[str] = None
+    checked_at: Optional[str] = None
 
 # Health monitoring protocol
 health_protocol = QuotaProtocol(
@@ -56,17 +65,68 @@ health_protocol = QuotaProtocol(
 
 @health_protocol.on_message(HealthCheck, replies={AgentHealth})
 async def handle_health_check(ctx: Context, sender: str, msg: HealthCheck):
-    status = HealthStatus.UNHEALTHY
+    # Answered from the last probe result; the probe itself runs on an interval
+    health = AgentHealth(agent_name="airbnb_assistant", status=HealthStatus.UNHEALTHY)
     try:
-        if agent_is_healthy():
-            status = HealthStatus.HEALTHY
+        health = AgentHealth(agent_name="airbnb_assistant", **health_monitor.report())
     except Exception as err:
         ctx.logger.error(f"Health check error: {err}")
     finally:
-        await ctx.send(
-            sender, 
-            AgentHealth(agent_name="airbnb_assistant", status=status)
-        )
+        await send_timed(ctx, sender, health)
+
+@agent.on_interval(period=HEALTH_PROBE_INTERVAL_SECONDS)
+async def probe_health(ctx: Context):
+    """Probe the MCP servers in the background so health checks answer instantly"""
+    await health_monitor.probe()
+
+@agent.on_interval(period=PREWARM_INTERVAL_SECONDS)
+async def prewarm_search_cache(ctx: Context):
+    """Refresh popular searches before their cache entries expire, while the MCP servers are idle"""
+    await cache_prewarmer.run()
+
+# Direct requests may carry several locations or listing ids; they are looked up
+# concurrently, at most DIRECT_BATCH_CONCURRENCY at a time
+DIRECT_BATCH_CONCURRENCY = int(os.getenv("DIRECT_BATCH_CONCURRENCY", "4"))
+DIRECT_BATCH_MAX_ITEMS = int(os.getenv("DIRECT_BATCH_MAX_ITEMS", "20"))
+
+def batch_parameter(parameters: dict, single_names: tuple, list_names: tuple) -> list:
+    """Collect one or many values for a request parameter, without duplicates"""
+    values = []
+    for name in list_names + single_names:
+        value = parameters.get(name)
+        if isinstance(value, (list, tuple)):
+            values.extend(value)
+        elif value:
+            values.append(value)
+    values = list(dict.fromkeys(str(value).strip() for value in values if str(value).strip()))
+    if len(values) > DIRECT_BATCH_MAX_ITEMS:
+        raise ValueError(f"Too many items in one request ({len(values)}), the limit is {DIRECT_BATCH_MAX_ITEMS}")
+    return values
+
+async def gather_bounded(func, items: list) -> list:
+    """Run func for every item concurrently, at most DIRECT_BATCH_CONCURRENCY at a time"""
+    semaphore = asyncio.Semaphore(DIRECT_BATCH_CONCURRENCY)
+
+    async def run(item):
+        async with semaphore:
+            return await func(item)
+
+    return await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
+
+def format_search_result(location: str, limit: int, search_result) -> str:
+    if isinstance(search_result, Exception):
+        return f"Could not search Airbnb rentals in {location}: {search_result}\n"
+    if not search_result.get("success", False):
+        return f"Could not search Airbnb rentals in {location}: {search_result.get('message', 'Unknown error')}\n"
+    
+    return search_result["results"].render("summary", limit)
+
+def format_details_result(listing_id: str, details_result) -> str:
+    if isinstance(details_result, Exception):
+        return f"Could not get details for listing {listing_id}: {details_result}\n"
+    if not details_result.get("success", False):
+        return f"Could not get details for listing {listing_id}: {details_result.get('message', 'Unknown error')}\n"
+    return details_result.get("formatted_output", f"No details available for listing {listing_id}.\n")
 
 # Handle direct Airbnb requests
 @proto.on_message(
@@ -76,49 +136,83 @@ async def handle_airbnb_request(ctx: Context, sender: str, msg: AirbnbRequest):
     ctx.logger.info(f"Received direct Airbnb request of type: {msg.request_type}")
     try:
         if msg.request_type == "search":
-            location = msg.parameters.get("location")
-            if not location:
+            locations = batch_parameter(msg.parameters, ("location",), ("locations",))
+            if not locations:
                 raise ValueError("Missing location parameter")
             
             limit = msg.parameters.get("limit", 2)
+            # Date windows and filters are checked before any search; unusable values are rejected
+            date_windows = normalize_date_windows(msg.parameters.get("date_windows"))
+            sort_by = normalize_sort_by(msg.parameters.get("sort_by"))
+            min_rating = normalize_min_rating(msg.parameters.get("minRating"))
+            filters = {"minRating": min_rating} if min_rating is not None else {}
             
-            # Search for listings
-            search_result = await search_airbnb_listings(location, limit)
+            decision = admission.admit(
+                sender, cost=len(locations) * max(1, len(date_windows)),
+                cached=not date_windows and all(is_search_cached(location, limit, filters) for location in locations)
+            )
+            if not decision.admitted:
+                await send_timed(ctx, sender, ErrorMessage(error=decision.busy_message()))
+                return
             
-            # Format the results
-            result = f"Here are {limit} Airbnb rentals in {location}:\n\n"
+            # With several date windows or a sort order the searches are merged into one ranked list
+            if date_windows or sort_by:
+                search_result = await search_airbnb_listings(locations, limit, date_windows=date_windows, sort_by=sort_by,
+                                                             **filters)
+                result = format_search_result(" or ".join(locations), limit, search_result)
+                ctx.logger.info(f"Successfully processed merged Airbnb search for {', '.join(locations)}")
+                await send_timed(ctx, sender, AirbnbResponse(results=result))
+                return
             
-            listings = search_result.get("listings", [])
-            for i, listing in enumerate(listings[:limit], 1):
-                result += f"{i}. {listing.get('name', 'Unnamed Listing')}\n"
-                result += f"   Price: {listing.get('price', 'Price not available')}\n"
-                result += f"   Rating: {listing.get('rating', 'Not rated')}\n\n"
+            # Search every location, bounded by the batch concurrency cap
+            search_results = await gather_bounded(
+                lambda location: search_airbnb_listings(location, limit, **filters), locations
+            )
+            result = "\n".join(
+                format_search_result(location, limit, search_result)
+                for location, search_result in zip(locations, search_results)
+            )
             
             # Send the response
-            ctx.logger.info(f"Successfully processed Airbnb search request for {location}")
-            await ctx.send(sender, AirbnbResponse(results=result))
+            ctx.logger.info(f"Successfully processed Airbnb search request for {', '.join(locations)}")
+            await send_timed(ctx, sender, AirbnbResponse(results=result))
             
         elif msg.request_type == "details":
-            listing_id = msg.parameters.get("listing_id")
-            if not listing_id:
+            listing_ids = batch_parameter(msg.parameters, ("listing_id", "id"), ("listing_ids", "ids"))
+            if not listing_ids:
                 raise ValueError("Missing listing_id parameter")
             
-            # This would call a function to get listing details
-            # For now, just return a placeholder message
-            result = f"Details for listing {listing_id} are not available yet."
+            decision = admission.admit(sender, cost=len(listing_ids))
+            if not decision.admitted:
+                await send_timed(ctx, sender, ErrorMessage(error=decision.busy_message()))
+                return
+            
+            # Dates apply to every listing in the batch
+            kwargs = {}
+            for param in ["checkin", "checkout"]:
+                if param in msg.parameters:
+                    kwargs[param] = msg.parameters[param]
+            
+            details_results = await gather_bounded(
+                lambda listing_id: get_airbnb_listing_details(listing_id, **kwargs), listing_ids
+            )
+            result = "\n".join(
+                format_details_result(listing_id, details_result)
+                for listing_id, details_result in zip(listing_ids, details_results)
+            )
             
             # Send the response
-            ctx.logger.info(f"Processed listing details request for {listing_id}")
-            await ctx.send(sender, AirbnbResponse(results=result))
+            ctx.logger.info(f"Processed listing details request for {', '.join(listing_ids)}")
+            await send_timed(ctx, sender, AirbnbResponse(results=result))
             
         else:
             result = f"Unknown request type: {msg.request_type}"
             ctx.logger.error(result)
-            await ctx.send(sender, ErrorMessage(error=result))
+            await send_timed(ctx, sender, ErrorMessage(error=result))
             
     except Exception as err:
         ctx.logger.error(f"Error in handle_airbnb_request: {err}")
-        await ctx.send(sender, ErrorMessage(error=str(err)))
+        await send_timed(ctx, sender, ErrorMessage(error=str(err)))
 
 # Include all protocols
 agent.include(health_protocol, publish_manifest=True)
@@ -126,16 +220,39 @@ agent.include(chat_proto, publish_manifest=True)
 agent.include(struct_output_client_proto, publish_manifest=True)
 agent.include(proto, publish_manifest=True)
 
+# Background task that brings up the MCP servers
+mcp_startup_task = None
+
+# Local HTTP server exposing /metrics (METRICS_PORT=0 disables it)
+metrics_server = None
+
 # Initialize MCP connection on startup
 @agent.on_event("startup")
 async def on_startup(ctx: Context):
-    """Connect to MCP server on startup"""
+    """Start the MCP servers in the background so agent registration is not blocked"""
+    global mcp_startup_task, metrics_server
+    try:
+        metrics_server = await start_metrics_server()
+    except OSError as e:
+        ctx.logger.error(f"Could not start metrics endpoint: {e}")
+    
     ctx.logger.info("Connecting to Airbnb MCP server on startup")
-    success = await connect_to_airbnb_mcp()
-    if success:
-        ctx.logger.info("Successfully connected to Airbnb MCP server")
-    else:
-        ctx.logger.error("Failed to connect to Airbnb MCP server")
+
+    def on_connected(task: asyncio.Task):
+        if task.cancelled():
+            return
+        if task.exception() is None and task.result():
+            from mcp_client import mcp_time_to_ready
+            ctx.logger.info(f"Successfully connected to Airbnb MCP server (ready in {mcp_time_to_ready:.2f}s)")
+            # Report the new servers without waiting for the next probe interval
+            asyncio.create_task(health_monitor.probe())
+            # Warm any PREWARM_SEARCHES before the first user asks
+            asyncio.create_task(cache_prewarmer.run())
+        else:
+            ctx.logger.error("Failed to connect to Airbnb MCP server, will keep retrying in the background")
+
+    mcp_startup_task = asyncio.create_task(connect_to_airbnb_mcp())
+    mcp_startup_task.add_done_callback(on_connected)
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,66 @@
+# fake_context.py
+"""uAgents Context stand-in for driving the chat handlers without the Fetch network"""
+from typing import Any, Dict, Optional
+from uuid import uuid4
+import asyncio
+import logging
+import time
+
+from uagents_core.contrib.protocols.chat import ChatMessage, EndSessionContent
+
+class FakeStorage(dict):
+    """In-memory replacement for ctx.storage"""
+
+    def set(self, key: str, value: Any):
+        self[key] = value
+
+class FakeContext:
+    """Records what the handlers send and plays the structured-output agent
+
+    A StructuredOutputPrompt sent to the AI agent is answered with
+    `ai_output` after `llm_latency` seconds by calling the registered
+    structured-output handler, as the real agent's reply would. The turn is
+    complete once the user gets a final answer: a chat message that ends the
+    session, or an AirbnbResponse.
+    """
+
+    def __init__(self, ai_agent_address: str, structured_output_handler, ai_output: Optional[Dict[str, Any]] = None,
+                 llm_latency: float = 0.0):
+        self.session = uuid4()
+        self.logger = logging.getLogger("bench.ctx")
+        self.storage = FakeStorage()
+        self.sent = []
+        self.ai_agent_address = ai_agent_address
+        self.structured_output_handler = structured_output_handler
+        self.ai_output = ai_output
+        self.llm_latency = llm_latency
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        self.done = asyncio.Event()
+        self._tasks = set()
+
+    async def send(self, destination: str, message: Any):
+        self.sent.append((destination, message))
+        if destination == self.ai_agent_address:
+            task = asyncio.create_task(self._reply_as_ai_agent())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        elif self._is_final(message) and not self.done.is_set():
+            self.finished_at = time.perf_counter()
+            self.done.set()
+
+    @staticmethod
+    def _is_final(message: Any) -> bool:
+        if isinstance(message, ChatMessage):
+            return any(isinstance(item, EndSessionContent) for item in message.content)
+        return type(message).__name__ == "AirbnbResponse"
+
+    async def _reply_as_ai_agent(self):
+        from chat_proto import StructuredOutputResponse
+        await asyncio.sleep(self.llm_latency)
+        await self.structured_output_handler(
+            self, self.ai_agent_address, StructuredOutputResponse(output=self.ai_output or {})
+        )
+
+    def latency(self) -> Optional[float]:
+        return None if self.finished_at is None else self.finished_at - self.started_at
@@ -0,0 +1,190 @@
+# run_benchmark.py
+"""Offline load benchmark for the chat path
+
+Runs mcp_client against benchmarks/stub_mcp_server.py (recorded payloads,
+configurable size and latency) and drives chat_proto.handle_message with
+FakeContext sessions, which also play the structured-output agent. For each
+concurrency level it reports p50/p99 turn latency, throughput and RSS.
+
+    python benchmarks/run_benchmark.py --sessions 1,10,100,1000 --mode mixed
+    python benchmarks/run_benchmark.py --sessions 100 --max-p99-ms 3000 --json results.json
+
+--max-p99-ms makes the run exit non-zero when any level is slower, so it can
+gate a deploy.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+benchmark_dir = os.path.dirname(os.path.abspath(__file__))
+agent_dir = os.path.dirname(benchmark_dir)
+
+LOCATIONS = [
+    "Lisbon", "Porto", "Barcelona", "Madrid", "Paris", "Nice", "Rome", "Florence", "Venice", "Milan",
+    "Berlin", "Munich", "Vienna", "Prague", "Budapest", "Amsterdam", "Copenhagen", "Stockholm", "Oslo", "Dublin",
+    "Edinburgh", "London", "Reykjavik", "Athens", "Istanbul", "Dubrovnik", "Split", "Krakow", "Zurich", "Geneva",
+    "Tokyo", "Kyoto", "Seoul", "Bangkok", "Bali", "Sydney", "Melbourne", "Auckland", "Vancouver", "Toronto",
+    "Montreal", "Boston", "Chicago", "Austin", "Denver", "Seattle", "Miami", "Honolulu", "Mexico City", "Cancun",
+]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", default="1,10,100,1000", help="comma-separated concurrency levels")
+    parser.add_argument("--mode", choices=("local", "remote", "mixed"), default="mixed",
+                        help="local: messages the local parser answers; remote: messages that go through the AI agent")
+    parser.add_argument("--locations", type=int, default=20, help="distinct locations the sessions ask about")
+    parser.add_argument("--results", type=int, default=18, help="search results per recorded payload")
+    parser.add_argument("--mcp-latency-ms", type=float, default=800)
+    parser.add_argument("--mcp-jitter-ms", type=float, default=200)
+    parser.add_argument("--llm-latency-ms", type=float, default=1500, help="simulated structured-output agent latency")
+    parser.add_argument("--pool-size", type=int, default=None, help="MCP_POOL_SIZE for the run")
+    parser.add_argument("--warm-cache", action="store_true", help="keep caches between concurrency levels")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for a level to finish")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--max-p99-ms", type=float, help="exit with status 1 if any level's p99 exceeds this")
+    return parser.parse_args()
+
+def configure_environment(args, data_dir: str):
+    # Read by the agent modules at import time
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["METRICS_PORT"] = "0"
+    # Measure the pipeline itself; set ADMISSION_ENABLED=true to include load shedding
+    os.environ.setdefault("ADMISSION_ENABLED", "false")
+    os.environ["DETAILS_CACHE_PATH"] = os.path.join(data_dir, "listing_details.sqlite3")
+    if args.pool_size:
+        os.environ["MCP_POOL_SIZE"] = str(args.pool_size)
+    sys.path.insert(0, agent_dir)
+    sys.path.insert(0, benchmark_dir)
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+def rss_mb() -> float:
+    """Current resident set size; falls back to the peak where /proc is unavailable"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def build_message(index: int, location: str, mode: str):
+    """Return (message text, structured output the fake AI agent replies with)"""
+    output = {"request_type": "search", "parameters": {"location": location}}
+    if mode == "local" or (mode == "mixed" and index % 2 == 0):
+        return f"Find Airbnb rentals in {location} for 2 adults", output
+    # Lowercase location: not confident enough for the local parser, so it goes to the AI agent
+    return f"any nice places in {location.lower()}?", output
+
+async def run_level(sessions: int, args, chat_proto, mcp_client, metrics):
+    from fake_context import FakeContext
+    from uagents_core.contrib.protocols.chat import ChatMessage, TextContent
+
+    if not args.warm_cache:
+        mcp_client.search_cache.clear()
+        mcp_client.search_index.clear()
+        chat_proto.intent_cache.clear()
+    timeouts_before = metrics.ai_timeouts_total.value()
+
+    contexts = []
+    locations = LOCATIONS[:max(1, min(args.locations, len(LOCATIONS)))]
+
+    async def run_session(index: int):
+        location = locations[index % len(locations)]
+        text, output = build_message(index, location, args.mode)
+        ctx = FakeContext(chat_proto.AI_AGENT_ADDRESS, chat_proto.handle_structured_output_response,
+                          output, args.llm_latency_ms / 1000)
+        contexts.append(ctx)
+        message = ChatMessage(timestamp=datetime.utcnow(), msg_id=uuid.uuid4(),
+                              content=[TextContent(type="text", text=text)])
+        await chat_proto.handle_message(ctx, f"user-{index}", message)
+        await ctx.done.wait()
+
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(asyncio.gather(*(run_session(i) for i in range(sessions))), args.timeout)
+    except asyncio.TimeoutError:
+        pass
+    wall = time.perf_counter() - start
+
+    latencies = [ctx.latency() for ctx in contexts if ctx.latency() is not None]
+    return {
+        "sessions": sessions,
+        "completed": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1) if latencies else float("nan"),
+        "throughput_per_s": round(len(latencies) / wall, 2) if wall else 0.0,
+        "ai_timeouts": int(metrics.ai_timeouts_total.value() - timeouts_before),
+        "rss_mb": round(rss_mb(), 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+COLUMNS = ("sessions", "completed", "p50_ms", "p99_ms", "max_ms", "throughput_per_s", "ai_timeouts",
+           "rss_mb", "peak_rss_mb")
+
+async def main(args):
+    import chat_proto
+    import mcp_client
+    import metrics
+
+    logging.getLogger("bench.ctx").setLevel(logging.WARNING)
+
+    # Launch the stub instead of the real Airbnb server
+    mcp_client.server_command = (sys.executable, [
+        os.path.join(benchmark_dir, "stub_mcp_server.py"),
+        "--results", str(args.results),
+        "--latency-ms", str(args.mcp_latency_ms),
+        "--jitter-ms", str(args.mcp_jitter_ms),
+    ])
+    if not await mcp_client.connect_to_airbnb_mcp():
+        print("Could not start the stub MCP server", file=sys.stderr)
+        return 2
+    print(f"MCP pool ready in {mcp_client.mcp_time_to_ready:.2f}s "
+          f"({len(mcp_client.mcp_pool.connections)} servers, mode={args.mode}, locations={args.locations})")
+
+    results = []
+    print(" ".join(f"{column:>16}" for column in COLUMNS))
+    try:
+        for sessions in (int(level) for level in args.sessions.split(",") if level.strip()):
+            result = await run_level(sessions, args, chat_proto, mcp_client, metrics)
+            results.append(result)
+            print(" ".join(f"{result[column]:>16}" for column in COLUMNS), flush=True)
+    finally:
+        await mcp_client.cleanup_mcp_connection()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+    if args.max_p99_ms is not None:
+        slow = [result for result in results if not result["p99_ms"] <= args.max_p99_ms]
+        incomplete = [result for result in results if result["completed"] < result["sessions"]]
+        if slow or incomplete:
+            print(f"FAILED: p99 above {args.max_p99_ms}ms or sessions not completed", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        configure_environment(arguments, temporary_dir)
+        sys.exit(asyncio.run(main(arguments)))
@@ -0,0 +1,70 @@
+# stub_mcp_server.py
+"""Stand-in for @openbnb/mcp-server-airbnb that replays recorded payloads over stdio
+
+airbnb_search returns the recorded search payload with its results repeated up
+to --results entries (ids and names made unique per location); airbnb_listing_details
+returns the recorded details payload for the requested id. Every call waits
+--latency-ms plus up to --jitter-ms before answering.
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import random
+import zlib
+
+from mcp.server.fastmcp import FastMCP
+
+payload_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "payloads")
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--payload-dir", default=payload_dir)
+parser.add_argument("--results", type=int, default=18, help="search results per airbnb_search payload")
+parser.add_argument("--latency-ms", type=float, default=800, help="base latency of every tool call")
+parser.add_argument("--jitter-ms", type=float, default=200, help="extra random latency of every tool call")
+# The agent launches the server with --ignore-robots-txt; unknown flags are ignored
+args, _ = parser.parse_known_args()
+
+def load_payload(name: str):
+    with open(os.path.join(args.payload_dir, f"{name}.json")) as f:
+        return json.load(f)
+
+search_payload = load_payload("airbnb_search")
+details_payload = load_payload("airbnb_listing_details")
+recorded_results = search_payload["searchResults"]
+
+def build_search_response(location: str) -> str:
+    results = []
+    for i in range(args.results):
+        listing = copy.deepcopy(recorded_results[i % len(recorded_results)])
+        listing_id = str(10_000_000 + (zlib.crc32(location.encode()) % 1_000_000) * 100 + i)
+        listing["id"] = listing_id
+        listing["url"] = f"https://www.airbnb.com/rooms/{listing_id}"
+        name = listing["demandStayListing"]["description"]["name"]
+        name["localizedStringWithTranslationPreference"] = f"{location} stay #{i + 1}"
+        results.append(listing)
+    return json.dumps({**search_payload, "searchResults": results})
+
+async def simulate_latency():
+    await asyncio.sleep((args.latency_ms + random.uniform(0, args.jitter_ms)) / 1000)
+
+server = FastMCP("airbnb-stub", log_level="WARNING")
+
+@server.tool()
+async def airbnb_search(location: str, placeId: str = None, checkin: str = None, checkout: str = None,
+                        adults: int = None, children: int = None, infants: int = None, pets: int = None,
+                        minPrice: int = None, maxPrice: int = None, cursor: str = None) -> str:
+    """Search recorded Airbnb listings"""
+    await simulate_latency()
+    return build_search_response(location)
+
+@server.tool()
+async def airbnb_listing_details(id: str, checkin: str = None, checkout: str = None, adults: int = None,
+                                 children: int = None, infants: int = None, pets: int = None) -> str:
+    """Recorded details for a listing"""
+    await simulate_latency()
+    return json.dumps({**details_payload, "listingUrl": f"https://www.airbnb.com/rooms/{id}"})
+
+if __name__ == "__main__":
+    server.run()
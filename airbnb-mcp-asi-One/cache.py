@@ -0,0 +1,212 @@
+# cache.py
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+import json
+import os
+import sqlite3
+import time
+
+class TTLCache:
+    """In-process cache with a per-entry time-to-live and LRU eviction"""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for key, or default if it is missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def contains(self, key: Hashable) -> bool:
+        """Whether key has a live entry, without counting a hit or miss or touching LRU order"""
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def expires_in(self, key: Hashable) -> Optional[float]:
+        """Seconds until key expires, or None if it has no live entry (not counted as a lookup)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        remaining = entry[0] - time.monotonic()
+        return remaining if remaining > 0 else None
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: float = None):
+        """Store value under key, evicting the least recently used entries if full"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+class PopularityCounter:
+    """Request counts per key that halve every half_life_seconds, with the arguments last seen
+
+    The least recently requested keys are dropped once max_entries is reached.
+    """
+
+    def __init__(self, max_entries: int = 1024, half_life_seconds: float = 3600.0):
+        self.max_entries = max_entries
+        self.half_life_seconds = half_life_seconds
+        self._entries = OrderedDict()  # key -> (score, updated_at, args)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _decayed(self, score: float, updated_at: float, now: float) -> float:
+        return score * 0.5 ** ((now - updated_at) / self.half_life_seconds)
+
+    def record(self, key: Hashable, args: Any):
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        score = self._decayed(entry[0], entry[1], now) if entry is not None else 0.0
+        self._entries[key] = (score + 1, now, args)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def top(self, count: int, min_score: float = 0.0) -> List[Tuple[Hashable, Any, float]]:
+        """The count most requested keys as (key, args, score), most requested first"""
+        now = time.monotonic()
+        scored = [(key, args, self._decayed(score, updated_at, now))
+                  for key, (score, updated_at, args) in self._entries.items()]
+        scored = [item for item in scored if item[2] >= min_score]
+        scored.sort(key=lambda item: item[2], reverse=True)
+        return scored[:count]
+
+def _canonical_value(value: Any) -> Any:
+    """Normalize a parameter value so equivalent inputs produce the same key"""
+    if isinstance(value, str):
+        value = value.strip()
+        if value.isdigit():
+            return int(value)
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(_canonical_value(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _canonical_value(v)) for k, v in value.items()))
+    return value
+
+def canonical_params(params: Dict[str, Any], defaults: Dict[str, Any] = None) -> tuple:
+    """Build a hashable, order-independent key from tool parameters"""
+    merged = dict(defaults or {})
+    merged.update({k: v for k, v in params.items() if v is not None and v != ""})
+    return tuple(sorted((k, _canonical_value(v)) for k, v in merged.items()))
+
+def canonical_search_key(location: str, limit: int, params: Dict[str, Any]) -> tuple:
+    """Cache key for an airbnb_search call: case-folded location, sorted params, defaulted adults"""
+    normalized_location = " ".join(location.split()).casefold()
+    return (normalized_location, limit, canonical_params(params, defaults={"adults": 2}))
+
+def canonical_message_key(text: str) -> str:
+    """Cache key for a chat message: case-folded with whitespace and trailing punctuation collapsed"""
+    return " ".join(text.split()).casefold().rstrip(" .!?")
+
+class PersistentCache:
+    """SQLite-backed cache of JSON values that serves stale entries while they are refreshed
+
+    Entries younger than fresh_seconds are fresh. Entries older than that but younger
+    than max_stale_seconds are still returned, flagged as stale so the caller can
+    refresh them in the background. Anything older is treated as missing.
+    """
+
+    def __init__(self, path: str, fresh_seconds: float = 6 * 3600, max_stale_seconds: float = 7 * 86400):
+        self.path = path
+        self.fresh_seconds = fresh_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+
+    def get(self, key: str):
+        """Return (value, is_fresh) for key, or None if it is missing or too old"""
+        row = self._db.execute("SELECT value, stored_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        age = time.time() - row[1]
+        if age > self.max_stale_seconds:
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+
+        is_fresh = age <= self.fresh_seconds
+        if is_fresh:
+            self.hits += 1
+        else:
+            self.stale_hits += 1
+        return json.loads(row[0]), is_fresh
+
+    def set(self, key: str, value: Any):
+        self._db.execute(
+            "INSERT OR REPLACE INTO entries (key, value, stored_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), time.time()),
+        )
+
+    def invalidate(self, key: str):
+        self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.stale_hits) / total, 4) if total else 0.0,
+        }
+
+    def close(self):
+        self._db.close()
+
+def details_cache_key(listing_id: str, params: Dict[str, Any]) -> str:
+    """Cache key for an airbnb_listing_details call: listing id plus stay dates"""
+    return f"{str(listing_id).strip()}|{params.get('checkin') or ''}|{params.get('checkout') or ''}"
@@ -4,26 +4,11 @@ from uuid import uuid4
 from typing import Any, Dict
 from textwrap import dedent
 import logging
-import time
 import asyncio
 import os
+import time
 from datetime import datetime
 
-# Set up file logging for chat protocol
-log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
-os.makedirs(log_dir, exist_ok=True)
-log_file = os.path.join(log_dir, f"chat_proto_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
-
-# Configure file logger
-file_handler = logging.FileHandler(log_file)
-file_handler.setLevel(logging.DEBUG)
-file_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(file_formatter)
-
-# Get the logger and add the file handler
-proto_logger = logging.getLogger("chat_proto")
-proto_logger.setLevel(logging.DEBUG)
-
 from uagents import Context, Model, Protocol
 
 # Import the necessary components of the chat protocol
@@ -36,22 +21,27 @@ from uagents_core.contrib.protocols.chat import (
     chat_protocol_spec,
 )
 
-from mcp_client import search_airbnb_listings, get_airbnb_listing_details
-
-# Set up logging
-log_dir = os.path.join(os.path.dirname(__file__), "logs")
-os.makedirs(log_dir, exist_ok=True)
+from mcp_client import (
+    SearchFailed, search_airbnb_listings, get_airbnb_listing_details, is_search_cached, normalize_date_windows,
+    stream_search_listings
+)
+from admission import admission
+from cache import TTLCache, canonical_message_key, canonical_search_key
+from listings import normalize_min_rating, normalize_sort_by
+from pending_requests import DeadlineScheduler, PendingRequest, PendingRequestRegistry
+from intent_parser import IntentStats, parse_intent
+from log_pipeline import LOG_LEVEL, attach_file_logging, current_request_id
+from metrics import ai_timeouts_total, chat_turn_seconds, fallbacks_total, intent_seconds, registry, send_seconds
 
-# Get the current date and time for the log filename
-log_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-log_file = os.path.join(log_dir, f"chat_proto_{log_timestamp}.log")
+# Set up file logging for chat protocol through the background log writer
+proto_logger = logging.getLogger("chat_proto")
+proto_logger.setLevel(LOG_LEVEL)
+file_logger = attach_file_logging(proto_logger, "chat_proto")
 
 # Function to log to file
-def log_to_file(message: str):
-    """Log a message to a file"""
-    with open(log_file, "a") as f:
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        f.write(f"[{timestamp}] {message}\n")
+def log_to_file(message: str, *args):
+    """Queue a debug trace for the log file; it is only formatted when DEBUG is enabled"""
+    file_logger.debug(message, *args)
 
 # OpenAI Agent address for structured output
 AI_AGENT_ADDRESS = 'agent1qtlpfshtlcxekgrfcpmv7m9zpajuwu7d5jfyachvpa4u3dkt6k0uwwp2lct'
@@ -76,154 +66,172 @@ def create_text_chat(text: str, end_session: bool = True) -> ChatMessage:
         content=content,
     )
 
+async def send_timed(ctx: Context, destination: str, message: Model):
+    """ctx.send that records how long the send took, per message type"""
+    with send_seconds.time(message=type(message).__name__):
+        await ctx.send(destination, message)
+
 # Define the Airbnb request and response models
 class AirbnbRequest(Model):
     """Model for requesting Airbnb information"""
     request_type: str  # "search" or "details"
-    parameters: dict
+    parameters: Dict[str, Any]
 
 class AirbnbResponse(Model):
     """Response with Airbnb information"""
     results: str
 
+# Prompt for the structured-output agent, built once; only the message changes per request
+STRUCTURED_OUTPUT_PROMPT = dedent("""
+    Extract the Airbnb request information from this message:
+
+    "{message}"
+    
+    The user wants to get Airbnb information. Extract:
+    1. The request_type: One of "search" or "details"
+    2. The parameters required for that request type:
+       
+       For search requests:
+       - location: The location to search for listings
+       - checkin: Check-in date (YYYY-MM-DD) if specified
+       - checkout: Check-out date (YYYY-MM-DD) if specified
+       - adults: Number of adults if specified (default: 2)
+       - children: Number of children if specified
+       - infants: Number of infants if specified
+       - pets: Number of pets if specified
+       - minPrice: Minimum price if specified
+       - maxPrice: Maximum price if specified
+       - minRating: Minimum average rating (out of 5) if specified
+       - locations: List of locations if the user compares several places (instead of location)
+       - date_windows: List of {{"checkin": ..., "checkout": ...}} if the user gives alternative dates
+       - sort_by: "price" for the cheapest or "rating" for the best rated, when comparing
+       
+       For details requests:
+       - id: The ID of the Airbnb listing
+       - checkin: Check-in date (YYYY-MM-DD) if specified
+       - checkout: Check-out date (YYYY-MM-DD) if specified
+    
+    Only include parameters that are mentioned or can be reasonably inferred.
+    
+    If the user asks for details about a specific listing, classify as "details".
+    If the user is looking for listings in a location, classify as "search".
+""")
+
+# The output schema never changes, so generate it once instead of for every message
+AIRBNB_REQUEST_SCHEMA = AirbnbRequest.schema()
+
+# Chat requests waiting for the structured-output agent, keyed by session id
+AI_RESPONSE_TIMEOUT_SECONDS = 15
+pending_requests = PendingRequestRegistry()
+
+# How often messages were parsed locally instead of by the AI agent
+intent_stats = IntentStats()
+
+# Listings shown per search
+SEARCH_LIMIT = 4
+
+# Fetch details (bedrooms, amenities) for the listings of every chat search up front
+ENRICH_SEARCH_RESULTS = os.getenv("ENRICH_SEARCH_RESULTS", "false").lower() == "true"
+
+# Send search listings in parts as they become ready instead of one block at the end
+STREAM_SEARCH_RESULTS = os.getenv("STREAM_SEARCH_RESULTS", "true").lower() == "true"
+
+# Start the MCP search while the AI agent is still parsing, whenever the local
+# parser can guess the location; the result is reused if the agent agrees
+SPECULATIVE_SEARCH = os.getenv("SPECULATIVE_SEARCH", "true").lower() == "true"
+speculation_stats = {"started": 0, "reused": 0, "cancelled": 0}
+
+# Intents the AI agent already parsed, keyed by normalized message text, so
+# repeated messages (ASI:One retries them often) skip the agent entirely
+INTENT_CACHE_MAX_ENTRIES = int(os.getenv("INTENT_CACHE_MAX_ENTRIES", "1024"))
+INTENT_CACHE_TTL_SECONDS = float(os.getenv("INTENT_CACHE_TTL_SECONDS", "900"))
+intent_cache = TTLCache(INTENT_CACHE_MAX_ENTRIES, INTENT_CACHE_TTL_SECONDS)
+
 # Set up the protocols
 chat_proto = Protocol(spec=chat_protocol_spec)
 struct_output_client_proto = Protocol(
     name="StructuredOutputClientProtocol", version="0.1.0"
 )
 
-# Timeout check function for AI agent response
-async def check_ai_response_timeout(ctx: Context, session_sender: str, timeout_seconds: int = 15):
-    """Check if we've received a response from the AI agent within the timeout period"""
-    # Wait for the timeout period
-    await asyncio.sleep(timeout_seconds)
+# Timeout check function for AI agent response, run by the deadline scheduler
+async def check_ai_response_timeout(session_id: str, deadline_payload):
+    """Fall back to the locally parsed request when the AI agent missed the session's deadline
+
+    The speculative search, if it asked for the same thing, is reused rather than cancelled.
+    Without a location (or listing id) to go on, the user is told the request failed.
+    """
+    ctx, msg_id = deadline_payload
     
-    # Check if we're still waiting for a response
-    waiting_flag = ctx.storage.get("waiting_for_ai_response")
-    request_time = ctx.storage.get("ai_request_time")
+    # Only act if this exact request is still pending for the session
+    pending = pending_requests.expire(session_id, msg_id)
+    if pending is None:
+        return
+    ai_timeouts_total.inc()
+    fallbacks_total.inc(reason="timeout")
     
-    if waiting_flag == "true":
-        elapsed = "unknown"
-        if request_time:
-            try:
-                elapsed = round(time.time() - float(request_time), 2)
-            except ValueError:
-                pass
+    elapsed = round(pending.elapsed(), 2)
+    session_sender = pending.sender
+    
+    ctx.logger.warning(f"No response received from AI agent after {elapsed} seconds")
+    ctx.logger.warning(f"This may indicate a communication issue with the AI agent: {AI_AGENT_ADDRESS}")
+    
+    try:
+        intent = parse_intent(pending.query_text)
+        if intent.request_type == "search":
+            target = search_location(intent.parameters)
+        elif intent.request_type == "details":
+            target = intent.parameters.get("id")
+        else:
+            target = None
         
-        ctx.logger.warning(f"No response received from AI agent after {elapsed} seconds")
-        ctx.logger.warning(f"This may indicate a communication issue with the AI agent: {AI_AGENT_ADDRESS}")
+        if not target:
+            ctx.logger.info("Local parse found nothing to search for, reporting the failure")
+            log_to_file("FALLBACK: no location or listing id in %r", pending.query_text)
+            await send_timed(ctx, session_sender, create_text_chat(
+                "I'm having trouble getting a response from my AI assistant, and I couldn't tell where you want "
+                "to stay. Please try again, naming the city or the listing.", end_session=True))
+            return
         
-        # Send a message to the user
-        try:
-            await ctx.send(
-                session_sender,
-                create_text_chat(
-                    "I'm having trouble getting a response from my AI assistant. Let me try a direct search instead."
-                )
-            )
-            
-            # Attempt a direct search with the default parameters
-            ctx.logger.info("Attempting direct search as fallback")
-            location = "San Francisco"
-            limit = 2
-            
-            # Call search function directly with detailed logging
-            ctx.logger.info(f"Calling search_airbnb_listings with location={location}, limit={limit}")
-            log_to_file(f"FALLBACK: Calling search_airbnb_listings with location={location}, limit={limit}")
-            
-            try:
-                result_dict = await search_airbnb_listings(location, limit=limit)
-                
-                # Log the search results
-                ctx.logger.info(f"Fallback search result: {result_dict}")
-                log_to_file(f"FALLBACK SEARCH RESULT: {result_dict}")
-                
-                if result_dict.get("success", False):
-                    formatted_output = result_dict.get("formatted_output", "No results available")
-                    ctx.logger.info(f"Sending formatted output to user (length: {len(formatted_output)})")
-                    log_to_file(f"SENDING FORMATTED OUTPUT TO USER (length: {len(formatted_output)})")
-                    log_to_file(f"OUTPUT SAMPLE: {formatted_output[:200]}...")
-                    
-                    # Use the AirbnbResponse model to send results to ASI1
-                    try:
-                        # Verify we have a valid session sender
-                        if not session_sender:
-                            ctx.logger.error("No session sender found for sending results")
-                            log_to_file("ERROR: No session sender found for sending results")
-                            return
-                            
-                        # Create a simple message with just the essential information
-                        result = "Here are 2 Airbnb rentals in San Francisco for May 10th, 2025:\n\n"
-                        
-                        # Extract just the essential listing information
-                        listings = result_dict.get("listings", [])
-                        for i, listing in enumerate(listings[:2], 1):
-                            result += f"{i}. {listing.get('name', 'Unnamed Listing')}\n"
-                            result += f"   Price: {listing.get('price', 'Price not available')}\n"
-                            result += f"   Rating: {listing.get('rating', 'Not rated')}\n\n"
-                        
-                        # Log the message we're about to send
-                        ctx.logger.info(f"Creating AirbnbResponse with results (length: {len(result)})")
-                        log_to_file(f"CREATING AIRBNB RESPONSE: {result}")
-                        
-                        # First try sending a structured response
-                        try:
-                            # Create an AirbnbResponse with the results
-                            airbnb_response = AirbnbResponse(results=result)
-                            ctx.logger.info(f"Sending AirbnbResponse to: {session_sender}")
-                            await ctx.send(session_sender, airbnb_response)
-                            ctx.logger.info("AirbnbResponse sent successfully")
-                            log_to_file("AIRBNB RESPONSE SENT SUCCESSFULLY")
-                        except Exception as struct_err:
-                            # If structured response fails, fall back to text chat
-                            ctx.logger.error(f"Error sending structured response: {struct_err}")
-                            log_to_file(f"ERROR SENDING STRUCTURED RESPONSE: {str(struct_err)}")
-                            
-                            # Create a chat message with end_session=True
-                            message = create_text_chat(result, end_session=True)
-                            ctx.logger.info(f"Falling back to text chat message to: {session_sender}")
-                            await ctx.send(session_sender, message)
-                            ctx.logger.info("Text chat message sent successfully")
-                            log_to_file("TEXT CHAT MESSAGE SENT SUCCESSFULLY")
-                        
-                        # Send a follow-up message to ensure receipt
-                        await asyncio.sleep(1)
-                        await ctx.send(session_sender, create_text_chat("Thank you for using Airbnb Assistant.", end_session=True))
-                        ctx.logger.info("Sent follow-up message")
-                        log_to_file("SENT FOLLOW-UP MESSAGE")
-                    
-                    except Exception as send_err:
-                        ctx.logger.error(f"Error sending results to user: {send_err}")
-                        log_to_file(f"ERROR SENDING RESULTS TO USER: {str(send_err)}")
-                        import traceback
-                        log_to_file(f"SEND ERROR TRACEBACK: {traceback.format_exc()}")
-                else:
-                    error_msg = result_dict.get("message", "Unknown error")
-                    ctx.logger.error(f"Search failed: {error_msg}")
-                    log_to_file(f"SEARCH FAILED: {error_msg}")
-                    
-                    await ctx.send(
-                        session_sender,
-                        create_text_chat(
-                            f"I'm sorry, I couldn't search for Airbnb listings at this time. Error: {error_msg}"
-                        )
-                    )
-            except Exception as search_err:
-                ctx.logger.error(f"Error in fallback search: {search_err}")
-                log_to_file(f"ERROR IN FALLBACK SEARCH: {str(search_err)}")
-                import traceback
-                log_to_file(f"FALLBACK ERROR TRACEBACK: {traceback.format_exc()}")
-        except Exception as e:
-            ctx.logger.error(f"Error in timeout handler: {e}")
+        await send_timed(ctx, session_sender, create_text_chat(
+            "I'm having trouble getting a response from my AI assistant. Let me try a direct search instead."))
+        
+        ctx.logger.info(f"Attempting direct {intent.request_type} as fallback with parameters: {intent.parameters}")
+        log_to_file("FALLBACK: %s with parameters %s", intent.request_type, intent.parameters)
+        request = AirbnbRequest(request_type=intent.request_type, parameters=intent.parameters)
+        await process_airbnb_request(ctx, session_sender, request, pending)
+    except Exception as e:
+        ctx.logger.error(f"Error in timeout handler: {e}")
+        log_to_file("ERROR IN FALLBACK: %s", str(e))
+    finally:
+        # A speculative search the fallback did not use must not keep an MCP session busy
+        if pending.cancel_speculation():
+            speculation_stats["cancelled"] += 1
+        chat_turn_seconds.observe(pending.elapsed(), source="timeout")
+
+# One timer for every pending AI response deadline
+ai_response_deadlines = DeadlineScheduler(check_ai_response_timeout)
+
+# Chat-side state read when the metrics endpoint is scraped
+registry.callback("airbnb_intent_sources_total", "Chat messages by where their intent came from", "counter", lambda: [
+    ({"source": "local"}, intent_stats.local),
+    ({"source": "cached"}, intent_cache.hits),
+    ({"source": "remote"}, intent_stats.remote),
+])
+registry.callback("airbnb_speculative_searches_total", "Speculative searches by outcome", "counter",
+                  lambda: [({"outcome": outcome}, count) for outcome, count in speculation_stats.items()])
+registry.callback("airbnb_pending_ai_requests", "Chat requests waiting for the AI agent", "gauge",
+                  lambda: [({}, len(pending_requests))])
+
+def discard_pending(session_id: str):
+    """Drop the session's pending request along with its deadline and speculative search"""
+    pending = pending_requests.resolve(session_id)
+    ai_response_deadlines.cancel(session_id)
+    if pending is not None and pending.cancel_speculation():
+        speculation_stats["cancelled"] += 1
 
 # We can't add a general message handler because the protocol is already locked
 # Instead, we'll enhance the existing handlers
 
-class AirbnbRequest(Model):
-    """Model for requesting Airbnb information"""
-    request_type: str  # "search" or "details"
-    parameters: Dict[str, Any]
-
 class StructuredOutputPrompt(Model):
     prompt: str
     output_schema: dict[str, Any]
@@ -234,6 +242,7 @@ class StructuredOutputResponse(Model):
 @chat_proto.on_message(ChatMessage)
 async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
     """Handle incoming chat messages from users"""
+    current_request_id.set(str(ctx.session))
     # Extract text content from the message
     text_content = None
     if msg.content:
@@ -241,14 +250,10 @@ async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
         if text_content:
             ctx.logger.info(f"Got a message from {sender}: {text_content}")
     
-    # Store the sender for this session
-    ctx.storage.set(str(ctx.session), sender)
+    session_id = str(ctx.session)
     
     # Send acknowledgement
-    await ctx.send(
-        sender,
-        ChatAcknowledgement(timestamp=datetime.utcnow(), acknowledged_msg_id=msg.msg_id),
-    )
+    await send_timed(ctx, sender, ChatAcknowledgement(timestamp=datetime.utcnow(), acknowledged_msg_id=msg.msg_id))
 
     # Process message content
     for item in msg.content:
@@ -257,80 +262,71 @@ async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
             continue
         elif isinstance(item, TextContent):
             ctx.logger.info(f"Processing text message: {item.text}")
+            turn_start = time.perf_counter()
+            
+            # Repeated messages reuse the intent the AI agent parsed last time
+            cached_intent = intent_cache.get(canonical_message_key(item.text))
+            if cached_intent is not None:
+                intent_seconds.observe(time.perf_counter() - turn_start, source="cached")
+                ctx.logger.info(f"Using cached intent: {cached_intent['request_type']} with parameters: {cached_intent['parameters']}")
+                discard_pending(session_id)
+                if not await admit_chat_request(ctx, sender, cached_intent):
+                    continue
+                await process_airbnb_request(ctx, sender, AirbnbRequest.parse_obj(cached_intent))
+                chat_turn_seconds.observe(time.perf_counter() - turn_start, source="cached")
+                continue
+            
+            # Answer clear-cut requests from the local parser without the AI agent round trip
+            intent = parse_intent(item.text)
+            intent_stats.record(intent.confident)
+            if intent.confident:
+                intent_seconds.observe(time.perf_counter() - turn_start, source="local")
+                ctx.logger.info(
+                    f"Parsed locally ({intent.confidence}): {intent.request_type} with parameters: {intent.parameters} "
+                    f"(local hit rate {intent_stats.hit_rate():.0%})"
+                )
+                discard_pending(session_id)
+                if not await admit_chat_request(ctx, sender, intent.to_request_dict()):
+                    continue
+                await process_airbnb_request(ctx, sender, AirbnbRequest.parse_obj(intent.to_request_dict()))
+                chat_turn_seconds.observe(time.perf_counter() - turn_start, source="local")
+                continue
+            ctx.logger.info(f"Local parse not confident enough ({intent.confidence}: {', '.join(intent.reasons)})")
+            if not await admit_chat_request(ctx, sender):
+                discard_pending(session_id)
+                continue
             
             # Create prompt for AI agent
-            prompt_text = dedent(f"""
-                Extract the Airbnb request information from this message:
-
-                "{item.text}"
-                
-                The user wants to get Airbnb information. Extract:
-                1. The request_type: One of "search" or "details"
-                2. The parameters required for that request type:
-                   
-                   For search requests:
-                   - location: The location to search for listings
-                   - checkin: Check-in date (YYYY-MM-DD) if specified
-                   - checkout: Check-out date (YYYY-MM-DD) if specified
-                   - adults: Number of adults if specified (default: 2)
-                   - children: Number of children if specified
-                   - infants: Number of infants if specified
-                   - pets: Number of pets if specified
-                   - minPrice: Minimum price if specified
-                   - maxPrice: Maximum price if specified
-                   
-                   For details requests:
-                   - id: The ID of the Airbnb listing
-                   - checkin: Check-in date (YYYY-MM-DD) if specified
-                   - checkout: Check-out date (YYYY-MM-DD) if specified
-                
-                Only include parameters that are mentioned or can be reasonably inferred.
-                
-                If the user asks for details about a specific listing, classify as "details".
-                If the user is looking for listings in a location, classify as "search".
-            """)
+            prompt_text = STRUCTURED_OUTPUT_PROMPT.format(message=item.text)
             
             ctx.logger.info(f"Preparing to send prompt to AI agent: {AI_AGENT_ADDRESS}")
             
             try:
-                # Set a flag in storage to track that we're waiting for AI response
-                ctx.storage.set("waiting_for_ai_response", "true")
-                ctx.storage.set("ai_request_time", str(time.time()))
+                # Track that this session is waiting for an AI response
+                pending = pending_requests.register(session_id, msg.msg_id, sender, item.text, AI_RESPONSE_TIMEOUT_SECONDS)
+                if SPECULATIVE_SEARCH and intent.request_type == "search":
+                    start_speculative_search(ctx, pending, intent.parameters)
                 
                 # Send the prompt to the AI agent
                 ctx.logger.info("Sending prompt to AI agent...")
-                await ctx.send(
-                    AI_AGENT_ADDRESS,
-                    StructuredOutputPrompt(
-                        prompt=prompt_text,
-                        output_schema=AirbnbRequest.schema()
-                    )
-                )
+                await send_timed(ctx, AI_AGENT_ADDRESS, StructuredOutputPrompt(prompt=prompt_text, output_schema=AIRBNB_REQUEST_SCHEMA))
                 
                 ctx.logger.info("Successfully sent prompt to AI agent")
                 ctx.logger.info(f"Now waiting for response from: {AI_AGENT_ADDRESS}")
-                
-                # Get the session sender from storage
-                session_sender = ctx.storage.get(str(ctx.session))
-                if session_sender:
-                    ctx.logger.info(f"Using session sender: {session_sender}")
-                else:
-                    ctx.logger.warning("No session sender found in storage")
                     
                 # Schedule a check for AI response timeout
-                ctx.logger.info("Scheduling timeout check for AI response")
-                asyncio.create_task(check_ai_response_timeout(ctx, session_sender))
+                ai_response_deadlines.schedule(session_id, pending.deadline, (ctx, msg.msg_id))
+                ctx.logger.info(f"Scheduled AI response deadline ({len(ai_response_deadlines)} pending)")
                 
             except Exception as e:
                 ctx.logger.error(f"Error sending to AI agent: {e}")
-                session_sender = ctx.storage.get(str(ctx.session))
+                discard_pending(session_id)
+                fallbacks_total.inc(reason="send_error")
                 
-                # If we have a session sender, attempt fallback search
-                if session_sender:
-                    ctx.logger.warning("Attempting direct search as fallback")
-                    await handle_fallback_search(ctx, session_sender, item.text)
-                else:
-                    ctx.logger.error("Cannot perform fallback: No session sender found")
+                # Attempt fallback search directly for the sender
+                ctx.logger.warning("Attempting direct search as fallback")
+                await handle_fallback_search(ctx, sender, item.text)
+                chat_turn_seconds.observe(time.perf_counter() - turn_start, source="fallback")
         else:
             ctx.logger.info(f"Got unexpected content type: {type(item)}")
 
@@ -340,195 +336,280 @@ async def handle_ack(ctx: Context, sender: str, msg: ChatAcknowledgement):
         f"Got an acknowledgement from {sender} for {msg.acknowledged_msg_id}"
     )
 
+async def admit_chat_request(ctx: Context, sender: str, request: Dict[str, Any] = None) -> bool:
+    """Run admission control for a chat request, replying "busy" if it is shed
+
+    request is the parsed intent when it is already known; searches the cache
+    can answer are let through ahead of everything else.
+    """
+    cached = False
+    cost = 1 + (SEARCH_LIMIT if ENRICH_SEARCH_RESULTS else 0)
+    if request is not None and request.get("request_type") == "search":
+        parameters = request.get("parameters") or {}
+        location = search_location(parameters)
+        windows = parameters.get("date_windows")
+        windows = windows if isinstance(windows, list) else ()
+        if isinstance(location, list) or windows:
+            # A fan-out runs one MCP search per location and date window
+            locations = len(location) if isinstance(location, list) else 1
+            cost *= locations * max(1, len(windows))
+        else:
+            cached = bool(location) and not ENRICH_SEARCH_RESULTS and is_search_cached(
+                location, SEARCH_LIMIT, build_search_kwargs(parameters)
+            )
+    decision = admission.admit(sender, cost=cost, cached=cached, session=str(ctx.session))
+    if not decision.admitted:
+        ctx.logger.warning(f"Request from {sender} shed by admission control ({decision.reason})")
+        await send_timed(ctx, sender, create_text_chat(decision.busy_message()))
+    return decision.admitted
+
+def search_location(parameters: Dict[str, Any]):
+    """The location to search, or the list of locations to compare"""
+    locations = parameters.get("locations")
+    if isinstance(locations, list) and len(locations) > 1:
+        return locations
+    if isinstance(locations, list) and locations and not parameters.get("location"):
+        return locations[0]
+    return parameters.get("location")
+
+def build_search_kwargs(parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """Optional airbnb_search arguments from request parameters (adults defaults to 2)"""
+    checkin = parameters.get("checkin")
+    checkout = parameters.get("checkout")
+    adults = parameters.get("adults", 2)
+    children = parameters.get("children")
+    infants = parameters.get("infants")
+    pets = parameters.get("pets")
+    min_price = parameters.get("minPrice")
+    max_price = parameters.get("maxPrice")
+    
+    kwargs = {}
+    if checkin: kwargs["checkin"] = checkin
+    if checkout: kwargs["checkout"] = checkout
+    if adults: kwargs["adults"] = adults
+    if children: kwargs["children"] = children
+    if infants: kwargs["infants"] = infants
+    if pets: kwargs["pets"] = pets
+    if min_price: kwargs["minPrice"] = min_price
+    if max_price: kwargs["maxPrice"] = max_price
+    # Filters the model made up in a form we cannot use are dropped rather than failing the search
+    for name, normalize in (("minRating", normalize_min_rating), ("sort_by", normalize_sort_by)):
+        try:
+            value = normalize(parameters.get(name))
+        except ValueError as err:
+            proto_logger.warning("Ignoring %s: %s", name, err)
+            continue
+        if value is not None: kwargs[name] = value
+    # Several date windows, searched alongside each other
+    try:
+        date_windows = normalize_date_windows(parameters.get("date_windows"))
+    except ValueError as err:
+        proto_logger.warning("Ignoring date_windows: %s", err)
+        date_windows = None
+    if date_windows: kwargs["date_windows"] = date_windows
+    return kwargs
+
+async def stream_search_to_chat(ctx: Context, session_sender: str, location: str, limit: int,
+                                style: str = "full", enrich: bool = False, **kwargs) -> int:
+    """Send a search's listings to the user in parts, as stream_search_listings yields them
+
+    The header goes with the first part and only the last part ends the session.
+    Returns the number of listings sent; raises SearchFailed if the search fails.
+    """
+    sent = 0
+    async for results, chunk in stream_search_listings(location, limit, enrich=enrich, **kwargs):
+        if chunk is results.listings:
+            # Everything at once: the memoized text cached with the result
+            text = results.render(style)
+        else:
+            text = results.render_listings(chunk, style, start=sent + 1)
+            if sent == 0:
+                text = results.render_header(style) + text
+        sent += len(chunk)
+        await send_timed(ctx, session_sender, create_text_chat(text, end_session=sent >= len(results.listings)))
+    return sent
+
+def start_speculative_search(ctx: Context, pending: PendingRequest, parameters: Dict[str, Any]):
+    """Search for the locally guessed location while the AI agent parses the message"""
+    location = parameters["location"]
+    kwargs = build_search_kwargs(parameters)
+    key = canonical_search_key(location, SEARCH_LIMIT, kwargs)
+    task = asyncio.create_task(search_airbnb_listings(location, SEARCH_LIMIT, enrich=ENRICH_SEARCH_RESULTS, **kwargs))
+    pending.speculation = (key, task)
+    speculation_stats["started"] += 1
+    ctx.logger.info(f"Started speculative search for {location} with kwargs: {kwargs}")
+
+async def process_airbnb_request(ctx: Context, session_sender: str, request: AirbnbRequest,
+                                 pending: PendingRequest = None):
+    """Run a parsed search or details request and send the result to the user
+
+    If the pending request carries a speculative search for the same key, its
+    result is awaited instead of searching again.
+    """
+    speculation = pending.speculation if pending is not None else None
+    try:
+        if request.request_type == "search":
+            ctx.logger.info("Processing search request")
+            # Get search parameters
+            location = search_location(request.parameters)
+            
+            if not location:
+                ctx.logger.info("No location provided, asking for clarification")
+                await send_timed(ctx, session_sender, create_text_chat("I need a location to search for Airbnb listings. Please specify where you want to stay."))
+                return
+            
+            # Set default limit and extract optional parameters
+            limit = SEARCH_LIMIT
+            kwargs = build_search_kwargs(request.parameters)
+            
+            if (speculation is not None and isinstance(location, str)
+                    and speculation[0] == canonical_search_key(location, limit, kwargs)):
+                # The speculative search asked for exactly this, so use its result
+                ctx.logger.info(f"Reusing speculative search for {location}")
+                speculation_stats["reused"] += 1
+                search_result = await speculation[1]
+            else:
+                if pending is not None and pending.cancel_speculation():
+                    ctx.logger.info("Cancelled speculative search that does not match the parsed request")
+                    speculation_stats["cancelled"] += 1
+                
+                ctx.logger.info(f"Calling search_airbnb_listings with location: {location}, limit: {limit}, kwargs: {kwargs}")
+                
+                if STREAM_SEARCH_RESULTS:
+                    try:
+                        sent = await stream_search_to_chat(ctx, session_sender, location, limit,
+                                                           enrich=ENRICH_SEARCH_RESULTS, **kwargs)
+                        ctx.logger.info(f"Streamed {sent} listings successfully")
+                    except SearchFailed as search_err:
+                        ctx.logger.error(f"Search failed: {search_err}")
+                        await send_timed(ctx, session_sender, create_text_chat(f"Sorry, I couldn't find any listings: {search_err}"))
+                    return
+                
+                # Call the search function
+                search_result = await search_airbnb_listings(location, limit, enrich=ENRICH_SEARCH_RESULTS, **kwargs)
+            
+            # Process the search result
+            if search_result.get("success", False):
+                formatted_output = search_result.get("formatted_output", "")
+                ctx.logger.info(f"Sending successful search result (length: {len(formatted_output)})")
+                await send_timed(ctx, session_sender, create_text_chat(formatted_output))
+                ctx.logger.info("Response sent successfully")
+            else:
+                error_message = search_result.get("message", "An error occurred while searching for listings.")
+                ctx.logger.error(f"Search failed: {error_message}")
+                await send_timed(ctx, session_sender, create_text_chat(f"Sorry, I couldn't find any listings: {error_message}"))
+        
+        elif request.request_type == "details":
+            # Get required listing ID parameter
+            listing_id = request.parameters.get("id")
+            if not listing_id:
+                await send_timed(ctx, session_sender, create_text_chat("I need a listing ID to get details. Please provide the ID of the Airbnb listing you're interested in."))
+                return
+            
+            # Extract other parameters
+            kwargs = {}
+            for param in ["checkin", "checkout"]:
+                if param in request.parameters:
+                    kwargs[param] = request.parameters[param]
+            
+            # Call the details function
+            details_result = await get_airbnb_listing_details(listing_id, **kwargs)
+            
+            # Process the details result
+            if details_result.get("success", False):
+                formatted_output = details_result.get("formatted_output", "")
+                await send_timed(ctx, session_sender, create_text_chat(formatted_output))
+            else:
+                error_message = details_result.get("message", "An error occurred while getting listing details.")
+                await send_timed(ctx, session_sender, create_text_chat(f"Sorry, I couldn't get the listing details: {error_message}"))
+        
+        else:
+            await send_timed(ctx, session_sender, create_text_chat(f"I don't recognize the request type '{request.request_type}'. Please ask for a 'search' or 'details'."))
+    except Exception as e:
+        ctx.logger.error(f"Error processing request: {e}")
+        await send_timed(ctx, session_sender, create_text_chat(f"I encountered an error while processing your request: {str(e)}"))
+
 @struct_output_client_proto.on_message(StructuredOutputResponse)
 async def handle_structured_output_response(
     ctx: Context, sender: str, msg: StructuredOutputResponse
 ):
     """Handle structured output responses from the AI agent"""
+    current_request_id.set(str(ctx.session))
+    pending = None
     try:
         # Log basic information about the received response
         ctx.logger.info(f"Received structured output response from {sender}")
         ctx.logger.info(f"Output type: {type(msg.output)}")
         ctx.logger.info(f"Output content: {msg.output}")
         
-        # Get the session sender from storage
-        session_sender = ctx.storage.get(str(ctx.session))
-        if session_sender is None:
-            ctx.logger.error("Discarding message because no session sender found in storage")
+        # Resolve the pending request for this session
+        pending = pending_requests.resolve(str(ctx.session))
+        ai_response_deadlines.cancel(str(ctx.session))
+        if pending is None:
+            ctx.logger.error("Discarding message because no pending request found for this session")
             return
+        session_sender = pending.sender
+        intent_seconds.observe(pending.elapsed(), source="remote")
+        ctx.logger.info(f"Resolved pending request {pending.msg_id} after {pending.elapsed():.2f} seconds")
 
         # Check for unknown values in the output
         output_str = str(msg.output)
         if "<UNKNOWN>" in output_str:
-            await ctx.send(
-                session_sender,
-                create_text_chat(
-                    "Sorry, I couldn't understand what Airbnb information you're looking for. Please specify if you want to search for listings in a location or get details about a specific listing."
-                )
-            )
+            await send_timed(ctx, session_sender, create_text_chat("Sorry, I couldn't understand what Airbnb information you're looking for. Please specify if you want to search for listings in a location or get details about a specific listing."))
             return
 
-        # Check if we were waiting for this response
-        waiting_flag = ctx.storage.get("waiting_for_ai_response")
-        ctx.logger.info(f"Waiting flag status: {waiting_flag}")
-        
-        # Clear the waiting flag
-        if waiting_flag == "true":
-            ctx.storage.set("waiting_for_ai_response", "false")
-            ctx.logger.info("Cleared waiting flag")
-        
         # Parse the output to AirbnbRequest model
         try:
             ctx.logger.info("Parsing output to AirbnbRequest model")
             request = AirbnbRequest.parse_obj(msg.output)
+            pending.parsed_query = request.parameters
             ctx.logger.info(f"Successfully parsed request: {request.request_type} with parameters: {request.parameters}")
         except Exception as parse_err:
             ctx.logger.error(f"Error parsing output: {parse_err}")
-            await ctx.send(
-                session_sender,
-                create_text_chat(
-                    "I had trouble understanding the request. Please try rephrasing your question."
-                )
-            )
+            await send_timed(ctx, session_sender, create_text_chat("I had trouble understanding the request. Please try rephrasing your question."))
             return
         
         # Validate request has required fields
         if not request.request_type or not request.parameters:
-            await ctx.send(
-                session_sender,
-                create_text_chat(
-                    "I couldn't identify the request type or parameters. Please provide more details for your Airbnb query."
-                )
-            )
+            await send_timed(ctx, session_sender, create_text_chat("I couldn't identify the request type or parameters. Please provide more details for your Airbnb query."))
             return
 
-        try:
-            if request.request_type == "search":
-                ctx.logger.info("Processing search request")
-                # Get search parameters
-                location = request.parameters.get("location")
-                
-                if not location:
-                    ctx.logger.info("No location provided, asking for clarification")
-                    await ctx.send(
-                        session_sender,
-                        create_text_chat(
-                            "I need a location to search for Airbnb listings. Please specify where you want to stay."
-                        ),
-                    )
-                    return
-                
-                # Set default limit and extract optional parameters
-                limit = 4  # Show 4 listings by default
-                
-                # Get optional parameters
-                checkin = request.parameters.get("checkin")
-                checkout = request.parameters.get("checkout")
-                adults = request.parameters.get("adults", 2)
-                children = request.parameters.get("children")
-                infants = request.parameters.get("infants")
-                pets = request.parameters.get("pets")
-                min_price = request.parameters.get("minPrice")
-                max_price = request.parameters.get("maxPrice")
-                
-                # Build kwargs
-                kwargs = {}
-                if checkin: kwargs["checkin"] = checkin
-                if checkout: kwargs["checkout"] = checkout
-                if adults: kwargs["adults"] = adults
-                if children: kwargs["children"] = children
-                if infants: kwargs["infants"] = infants
-                if pets: kwargs["pets"] = pets
-                if min_price: kwargs["minPrice"] = min_price
-                if max_price: kwargs["maxPrice"] = max_price
-                
-                ctx.logger.info(f"Calling search_airbnb_listings with location: {location}, limit: {limit}, kwargs: {kwargs}")
-                
-                # Call the search function
-                search_result = await search_airbnb_listings(location, limit, **kwargs)
-                
-                # Process the search result
-                if search_result.get("success", False):
-                    formatted_output = search_result.get("formatted_output", "")
-                    ctx.logger.info(f"Sending successful search result (length: {len(formatted_output)})")
-                    await ctx.send(session_sender, create_text_chat(formatted_output))
-                    ctx.logger.info("Response sent successfully")
-                else:
-                    error_message = search_result.get("message", "An error occurred while searching for listings.")
-                    ctx.logger.error(f"Search failed: {error_message}")
-                    await ctx.send(session_sender, create_text_chat(f"Sorry, I couldn't find any listings: {error_message}"))
-            
-            elif request.request_type == "details":
-                # Get required listing ID parameter
-                listing_id = request.parameters.get("id")
-                if not listing_id:
-                    await ctx.send(
-                        session_sender,
-                        create_text_chat(
-                            "I need a listing ID to get details. Please provide the ID of the Airbnb listing you're interested in."
-                        )
-                    )
-                    return
-                
-                # Extract other parameters
-                kwargs = {}
-                for param in ["checkin", "checkout"]:
-                    if param in request.parameters:
-                        kwargs[param] = request.parameters[param]
-                
-                # Call the details function
-                details_result = await get_airbnb_listing_details(listing_id, **kwargs)
-                
-                # Process the details result
-                if details_result.get("success", False):
-                    formatted_output = details_result.get("formatted_output", "")
-                    await ctx.send(session_sender, create_text_chat(formatted_output))
-                else:
-                    error_message = details_result.get("message", "An error occurred while getting listing details.")
-                    await ctx.send(session_sender, create_text_chat(f"Sorry, I couldn't get the listing details: {error_message}"))
-            
-            else:
-                await ctx.send(
-                    session_sender,
-                    create_text_chat(
-                        f"I don't recognize the request type '{request.request_type}'. Please ask for a 'search' or 'details'."
-                    )
-                )
-        except Exception as e:
-            ctx.logger.error(f"Error processing request: {e}")
-            await ctx.send(
-                session_sender,
-                create_text_chat(
-                    f"I encountered an error while processing your request: {str(e)}"
-                )
+        if request.request_type in ("search", "details"):
+            intent_cache.set(
+                canonical_message_key(pending.query_text),
+                {"request_type": request.request_type, "parameters": dict(request.parameters)},
             )
+
+        await process_airbnb_request(ctx, session_sender, request, pending)
+        chat_turn_seconds.observe(pending.elapsed(), source="remote")
     except Exception as outer_err:
         ctx.logger.error(f"Outer exception in handle_structured_output_response: {outer_err}")
         import traceback
         ctx.logger.error(f"Error traceback: {traceback.format_exc()}")
         try:
-            session_sender = ctx.storage.get(str(ctx.session))
+            session_sender = pending.sender if pending else None
             if session_sender:
-                await ctx.send(
-                    session_sender,
-                    create_text_chat(
-                        "Sorry, I encountered an unexpected error while processing your request. Please try again later."
-                    )
-                )
+                await send_timed(ctx, session_sender, create_text_chat("Sorry, I encountered an unexpected error while processing your request. Please try again later."))
         except Exception as final_err:
             ctx.logger.error(f"Final error recovery failed: {final_err}")
+    finally:
+        # A speculative search nobody used must not keep an MCP session busy
+        if pending is not None and pending.cancel_speculation():
+            speculation_stats["cancelled"] += 1
 
 # Function to handle fallback search when AI agent doesn't respond
 async def handle_fallback_search(ctx: Context, session_sender: str, query_text: str):
     """Perform a direct search as fallback when AI agent doesn't respond"""
     try:
-        # Extract location from query text (simple approach)
-        location = "San Francisco"  # Default
-        if "near" in query_text.lower():
-            parts = query_text.lower().split("near")
-            if len(parts) > 1:
-                location_part = parts[1].strip()
-                location = location_part.split(",")[0].split(".")[0].split("and")[0].strip()
+        # Extract location and search filters with the local parser
+        intent = parse_intent(query_text)
+        search_params = dict(intent.parameters) if intent.request_type == "search" else {}
+        location = search_params.pop("location", None)
+        if not location:
+            await send_timed(ctx, session_sender, create_text_chat(
+                "Sorry, I couldn't reach my AI assistant and couldn't tell where you want to stay. "
+                "Please try again, naming the city.", end_session=True))
+            return
         
         # Set a reasonable limit
         limit = 2
@@ -539,56 +620,16 @@ async def handle_fallback_search(ctx: Context, session_sender: str, query_text:
         elif "4" in query_text or "four" in query_text.lower():
             limit = 4
         
-        ctx.logger.info(f"Calling search_airbnb_listings with location={location}, limit={limit}")
+        ctx.logger.info(f"Calling search_airbnb_listings with location={location}, limit={limit}, kwargs: {search_params}")
         
-        # Call the search function
-        result_dict = await search_airbnb_listings(location, limit)
-        
-        # Check if successful
-        if result_dict.get("success", False):
-            formatted_output = result_dict.get("formatted_output", "")
-            ctx.logger.info(f"Fallback search result: {result_dict}")
-            
-            # Send the formatted output to the user
-            ctx.logger.info(f"Sending formatted output to user (length: {len(formatted_output)})")
-            log_to_file(f"SENDING FORMATTED OUTPUT TO USER (length: {len(formatted_output)})")
-            log_to_file(f"OUTPUT SAMPLE: {formatted_output[:200]}...")
-            
-            # Use the exact same approach as the food-mcp implementation
-            try:
-                # Create a simple message for ASI1
-                result = f"Here are {limit} Airbnb rentals in {location}:\n\n"
-                
-                # Extract just the essential listing information
-                listings = result_dict.get("listings", [])
-                for i, listing in enumerate(listings[:limit], 1):
-                    result += f"{i}. {listing.get('name', 'Unnamed Listing')}\n"
-                    result += f"   Price: {listing.get('price', 'Price not available')}\n"
-                    result += f"   Rating: {listing.get('rating', 'Not rated')}\n\n"
-                
-                # Log the message we're about to send
-                ctx.logger.info(f"Creating chat message with text length: {len(result)}")
-                
-                # Use the create_text_chat function exactly as in food-mcp
-                chat_message = create_text_chat(result)
-                
-                # Send directly to ASI1 using the same pattern as food-mcp
-                ctx.logger.info(f"Sending message to ASI1: {session_sender}")
-                await ctx.send(session_sender, chat_message)
-                ctx.logger.info("Message sent successfully to ASI1")
-                
-                # Send a follow-up message to confirm receipt
-                await asyncio.sleep(1)  # Brief pause
-                await ctx.send(session_sender, create_text_chat("These are the best available Airbnb rentals I could find for your dates."))
-                ctx.logger.info("Sent follow-up message")
-            except Exception as send_err:
-                ctx.logger.error(f"Error sending results to user: {send_err}")
-                log_to_file(f"ERROR SENDING RESULTS TO USER: {str(send_err)}")
-        else:
+        # Send the short list for ASI1, each listing as soon as it is ready
+        try:
+            sent = await stream_search_to_chat(ctx, session_sender, location, limit, style="summary", **search_params)
+            ctx.logger.info(f"Sent {sent} fallback listings to {session_sender}")
+        except SearchFailed as search_err:
             # Send an error message
-            error_message = result_dict.get("message", "An error occurred while searching for listings.")
-            ctx.logger.error(f"Fallback search failed: {error_message}")
-            await ctx.send(session_sender, create_text_chat(f"Sorry, I couldn't find any listings: {error_message}"))
+            ctx.logger.error(f"Fallback search failed: {search_err}")
+            await send_timed(ctx, session_sender, create_text_chat(f"Sorry, I couldn't find any listings: {search_err}"))
     except Exception as e:
         ctx.logger.error(f"Error in fallback search: {e}")
-        await ctx.send(session_sender, create_text_chat("Sorry, I encountered an error while searching for listings. Please try again later."))
\ No newline at end of file
+        await send_timed(ctx, session_sender, create_text_chat("Sorry, I encountered an error while searching for listings. Please try again later."))
\ No newline at end of file
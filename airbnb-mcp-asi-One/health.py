@@ -0,0 +1,117 @@
+# health.py
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+import asyncio
+import logging
+import os
+import time
+
+import mcp_client
+from metrics import registry
+
+# The health check answers from the result of the last background probe, so a
+# HealthCheck never waits on the MCP servers. Each probe times a list_tools round
+# trip on every connected server; a server that does not answer in time is
+# restarted by its supervisor.
+HEALTH_PROBE_INTERVAL_SECONDS = float(os.getenv("HEALTH_PROBE_INTERVAL_SECONDS", "15"))
+HEALTH_PROBE_TIMEOUT_SECONDS = float(os.getenv("HEALTH_PROBE_TIMEOUT_SECONDS", "5"))
+HEALTH_SLOW_PROBE_SECONDS = float(os.getenv("HEALTH_SLOW_PROBE_SECONDS", "2"))  # slower probes report degraded
+# A probe result older than this (e.g. the probe loop is stuck) no longer counts as healthy
+HEALTH_MAX_PROBE_AGE_SECONDS = float(os.getenv("HEALTH_MAX_PROBE_AGE_SECONDS", str(4 * HEALTH_PROBE_INTERVAL_SECONDS)))
+
+HEALTHY = "healthy"
+DEGRADED = "degraded"
+UNHEALTHY = "unhealthy"
+
+logger = logging.getLogger("health")
+
+class HealthMonitor:
+    """Probes the MCP pool periodically and keeps the latest report"""
+
+    def __init__(self):
+        self.last_report: Optional[Dict[str, Any]] = None
+        self.last_probe_at = None  # time.monotonic() of the last finished probe
+        self._lock = asyncio.Lock()
+
+    async def probe(self) -> Dict[str, Any]:
+        """Probe every server and store the resulting report"""
+        # Overlapping interval runs would only probe the same servers twice
+        if self._lock.locked():
+            return self.report()
+        async with self._lock:
+            pool = mcp_client.mcp_pool
+            if pool is not None:
+                await asyncio.gather(*(
+                    conn.probe(HEALTH_PROBE_TIMEOUT_SECONDS) for conn in pool.connections if conn.connected
+                ))
+            self.last_report = self._build_report(pool)
+            self.last_probe_at = time.monotonic()
+
+        if self.last_report["status"] != HEALTHY:
+            logger.warning("Health probe: %s (%s)", self.last_report["status"], self.last_report["last_error"])
+        return self.last_report
+
+    @staticmethod
+    def _build_report(pool) -> Dict[str, Any]:
+        search_stats = mcp_client.search_cache.stats()
+        if pool is None:
+            return {
+                "status": UNHEALTHY,
+                "servers_connected": 0,
+                "servers_total": 0,
+                "probe_latency_ms": None,
+                "in_flight": 0,
+                "queue_depth": 0,
+                "cache_hit_rate": search_stats["hit_rate"],
+                "last_error": "MCP pool not started",
+                "checked_at": datetime.now(timezone.utc).isoformat(),
+            }
+
+        live = [conn for conn in pool.connections if conn.connected]
+        latencies = [conn.probe_latency for conn in live if conn.probe_latency is not None]
+        probe_latency = max(latencies) if latencies else None
+        in_flight = pool.in_flight()
+        queue_depth = max(0, in_flight - pool.capacity())
+        errors = [f"server #{conn.index}: {conn.last_error}" for conn in pool.connections if conn.last_error]
+
+        if not live:
+            status = UNHEALTHY
+        elif (len(live) < len(pool.connections) or probe_latency is None
+              or probe_latency > HEALTH_SLOW_PROBE_SECONDS or queue_depth > 0):
+            status = DEGRADED
+        else:
+            status = HEALTHY
+
+        return {
+            "status": status,
+            "servers_connected": len(live),
+            "servers_total": len(pool.connections),
+            "probe_latency_ms": round(probe_latency * 1000, 1) if probe_latency is not None else None,
+            "in_flight": in_flight,
+            "queue_depth": queue_depth,
+            "cache_hit_rate": search_stats["hit_rate"],
+            "last_error": "; ".join(errors) or None,
+            "checked_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+    def report(self) -> Dict[str, Any]:
+        """Latest probe report; unhealthy if there is none yet or it is too old"""
+        if self.last_report is None:
+            return {**self._build_report(None), "status": UNHEALTHY, "last_error": "No health probe has run yet"}
+        if time.monotonic() - self.last_probe_at > HEALTH_MAX_PROBE_AGE_SECONDS:
+            return {**self.last_report, "status": UNHEALTHY, "last_error": "Health probe result is stale"}
+        return self.last_report
+
+# Shared by the health protocol and the probe interval
+health_monitor = HealthMonitor()
+
+def _probe_latency_samples():
+    report = health_monitor.last_report
+    if report is None or report["probe_latency_ms"] is None:
+        return []
+    return [({}, report["probe_latency_ms"] / 1000)]
+
+registry.callback("airbnb_health_probe_seconds", "Slowest list_tools round trip in the last health probe", "gauge",
+                  _probe_latency_samples)
+registry.callback("airbnb_health_status", "Current health status (1 for the reported status)", "gauge",
+                  lambda: [({"status": health_monitor.report()["status"]}, 1)])
@@ -0,0 +1,379 @@
+# intent_parser.py
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import os
+import re
+
+# Rule-based parsing of chat messages into AirbnbRequest parameters. Messages it is
+# confident about skip the remote structured-output agent; everything else still
+# goes to the LLM. Confidence is a rough score in [0, 1].
+LOCAL_INTENT_CONFIDENCE = float(os.getenv("LOCAL_INTENT_CONFIDENCE", "0.8"))
+
+_NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+_MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+_MONTH = r"(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sept?(?:ember)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?"
+_DAY = r"(\d{1,2})(?:st|nd|rd|th)?"
+_YEAR = r"(?:,?\s*(\d{4}))?"
+_COUNT = r"(\d+|" + "|".join(_NUMBER_WORDS) + r")"
+_AMOUNT = r"\$?\s?(\d[\d,]*)"
+
+_iso_date = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+_month_day_range = re.compile(r"\b" + _MONTH + r"\s+" + _DAY + r"\s*(?:-|–|to|through|until)\s*" + _DAY + r"\b" + _YEAR, re.I)
+_day_range_month = re.compile(r"\b(?:the\s+)?" + _DAY + r"\s*(?:-|–|to|through|until)\s*(?:the\s+)?" + _DAY
+                              + r"\s+(?:of\s+)?" + _MONTH + r"\b" + _YEAR, re.I)
+_month_day = re.compile(r"\b" + _MONTH + r"\s+" + _DAY + r"\b" + _YEAR, re.I)
+_day_month = re.compile(r"\b" + _DAY + r"\s+(?:of\s+)?" + _MONTH + r"\b" + _YEAR, re.I)
+_relative_day = re.compile(r"\b(today|tonight|tomorrow)\b", re.I)
+_weekend = re.compile(r"\b(this|next)\s+weekend\b", re.I)
+_next_week = re.compile(r"\bnext\s+week\b", re.I)
+_nights = re.compile(r"\b" + _COUNT + r"\s+nights?\b", re.I)
+_month_mention = re.compile(r"\b" + _MONTH + r"\b", re.I)
+# Date-like text the patterns above do not resolve; any of it left unclaimed sends the message to the LLM
+_unhandled_dates = (
+    re.compile(r"\b\d{1,2}/\d{1,2}(?:/\d{2,4})?\b|\b\d{1,2}\.\d{1,2}\.\d{2,4}\b"),  # 12/05, 5.12.2026: day/month order is ambiguous
+    re.compile(r"\b(?:monday|tuesday|wednesday|thursday|friday|saturday|sunday)s?\b", re.I),
+    re.compile(r"\b(?:this|next|coming|following)\s+(?:month|year|summer|winter|spring|fall|autumn)\b", re.I),
+    re.compile(r"\b(?:in|after)\s+" + _COUNT + r"\s+(?:days?|weeks?|months?)\b|\b(?:from now|week after next|end of the month)\b", re.I),
+    re.compile(r"\b(?:christmas|xmas|new year'?s?|easter|thanksgiving|halloween|valentine'?s|labou?r day|memorial day|"
+               r"spring break|holidays)\b", re.I),
+    re.compile(r"\b\d{1,2}(?:st|nd|rd|th)\b", re.I),
+)
+_stay_length = re.compile(r"\b" + _COUNT + r"\s+(?:nights?|weeks?)\b", re.I)
+
+_guest_patterns = (
+    ("adults", re.compile(r"\b" + _COUNT + r"\s+(?:adults?|guests?|people|persons?|travell?ers|grown-?ups)\b", re.I)),
+    ("children", re.compile(r"\b" + _COUNT + r"\s+(?:children|child|kids?)\b", re.I)),
+    ("infants", re.compile(r"\b" + _COUNT + r"\s+(?:infants?|bab(?:y|ies)|toddlers?)\b", re.I)),
+    ("pets", re.compile(r"\b" + _COUNT + r"\s+(?:pets?|dogs?|cats?)\b", re.I)),
+)
+_family_of = re.compile(r"\b(?:family|group)\s+of\s+" + _COUNT + r"\b", re.I)
+_couple = re.compile(r"\b(?:couple|two of us|me and my (?:wife|husband|partner|girlfriend|boyfriend))\b", re.I)
+_solo = re.compile(r"\b(?:solo|just me|alone|by myself)\b", re.I)
+_single_pet = re.compile(r"\bwith\s+(?:my|a|our)\s+(?:dog|cat|pet|puppy)\b", re.I)
+
+_price_between = re.compile(r"\bbetween\s+" + _AMOUNT + r"\s*(?:and|-|–|to)\s*" + _AMOUNT, re.I)
+_price_range = re.compile(r"\$(\d[\d,]*)\s*(?:-|–|to)\s*\$?(\d[\d,]*)")
+_price_max = re.compile(r"\b(?:under|below|less than|max(?:imum)?|up to|no more than|cheaper than|at most|within)\s+" + _AMOUNT, re.I)
+_price_min = re.compile(r"\b(?:over|above|more than|at least|min(?:imum)?|starting at)\s+\$\s?(\d[\d,]*)", re.I)
+_rating_min = re.compile(r"\b(?:rated|rating|ratings?\s+of)\s+(?:of\s+|above\s+|over\s+|at least\s+)?(\d(?:\.\d+)?)\b", re.I)
+_rating_stars = re.compile(r"\b(\d(?:\.\d+)?)\s*\+?\s*(?:stars?|-star)\b", re.I)
+_sort_price = re.compile(r"\b(?:cheapest|lowest[- ]priced?|least expensive)\b", re.I)
+_sort_rating = re.compile(r"\b(?:best|highest|top)[- ]rated\b", re.I)
+
+_room_url = re.compile(r"airbnb\.[a-z.]+/rooms/(?:plus/)?(\d+)", re.I)
+_listing_id = re.compile(r"\b(?:listing|id|room|property)\s*(?:#|id|number|no\.?)?\s*:?\s*#?(\d{5,})\b", re.I)
+_bare_id = re.compile(r"\b(\d{6,})\b")
+_details_words = re.compile(r"\b(?:details?|amenities|more about|tell me about|info(?:rmation)? (?:on|about)|bedrooms|bathrooms)\b", re.I)
+_search_words = re.compile(r"\b(?:find|search|show|look(?:ing)? for|airbnbs?|rentals?|stays?|places?|listings?|apartments?|homes?|houses?|accommodations?)\b", re.I)
+_alternatives = re.compile(r"\b(?:or|either|compare|versus|vs\.?)\b", re.I)
+_question = re.compile(r"\?\s*$|^\s*(?:is|are|can|could|should|would|will|do|does|did|what|which|why|how|when|where|who)\b", re.I)
+_polite_request = re.compile(r"^\s*(?:can|could|would|will)\s+you\s+(?:please\s+)?(?:find|search|show|look|get|book)\b", re.I)
+
+# Lookahead so "want to go to New York" also yields the candidate after the second "to"
+_location = re.compile(r"\b(?:in|near|at|around|to|visiting)\s+(?=([A-Za-z][\w'.-]*(?:\s+[A-Za-z][\w'.-]*){0,5}))")
+_location_continuation = re.compile(r"\s*,\s*([A-Z][\w'.-]*(?:\s+[A-Z][\w'.-]*){0,2})")
+_location_stop_words = {
+    "for", "from", "with", "under", "below", "between", "next", "this", "on", "during",
+    "over", "and", "or", "by", "starting", "checking", "check", "tomorrow", "today", "tonight",
+    "weekend", "week", "that", "which", "please", "less", "more", "max", "min", "budget",
+    "cheap", "near", "in", "at", "around", "within", "until", "till", "through", "staying",
+    "arriving", "leaving", "is", "are", "was", "the", "i", "we", "me", "us", "it", "up",
+    "rated", "rating", "sorted", "cheapest",
+}
+_non_location_starts = {"the", "a", "an", "my", "our", "your", "this", "that", "least", "most", "all", "any"}
+
+class ParsedIntent:
+    """Result of parsing one chat message locally"""
+
+    __slots__ = ("request_type", "parameters", "confidence", "reasons")
+
+    def __init__(self, request_type: Optional[str], parameters: Dict[str, Any], confidence: float,
+                 reasons: List[str]):
+        self.request_type = request_type
+        self.parameters = parameters
+        self.confidence = confidence
+        self.reasons = reasons
+
+    @property
+    def confident(self) -> bool:
+        return self.request_type is not None and self.confidence >= LOCAL_INTENT_CONFIDENCE
+
+    def to_request_dict(self) -> Dict[str, Any]:
+        """The parse in AirbnbRequest form"""
+        return {"request_type": self.request_type, "parameters": dict(self.parameters)}
+
+def _to_int(token: str) -> Optional[int]:
+    token = token.lower()
+    if token.isdigit():
+        return int(token)
+    return _NUMBER_WORDS.get(token)
+
+def _to_amount(token: str) -> Optional[int]:
+    try:
+        return int(token.replace(",", ""))
+    except ValueError:
+        return None
+
+def _month_number(token: str) -> int:
+    return _MONTHS[token.lower()[:3]]
+
+def _resolve_date(year: Optional[str], month: int, day: int, today: date) -> Optional[date]:
+    """Build a date, rolling month/day without a year forward to the next occurrence"""
+    try:
+        if year:
+            return date(int(year), month, day)
+        candidate = date(today.year, month, day)
+        if candidate < today:
+            candidate = date(today.year + 1, month, day)
+        return candidate
+    except ValueError:
+        return None
+
+def _parse_dates(text: str, today: date) -> Tuple[List[Tuple[int, date]], Optional[date], bool]:
+    """Return (positioned dates, implied checkout, whether some date-like text was not understood)"""
+    found = []
+    implied_checkout = None
+    consumed = []
+
+    def claim(match):
+        consumed.append(match.span())
+
+    def overlaps(match):
+        start, end = match.span()
+        return any(start < c_end and c_start < end for c_start, c_end in consumed)
+
+    # Dates that are written out but impossible ("2026-02-30", "Oct 3-1")
+    invalid = False
+
+    for match in _iso_date.finditer(text):
+        try:
+            found.append((match.start(), date(int(match.group(1)), int(match.group(2)), int(match.group(3)))))
+        except ValueError:
+            invalid = True
+        claim(match)
+
+    for pattern, month_group, start_group, end_group, year_group in ((_month_day_range, 1, 2, 3, 4),
+                                                                     (_day_range_month, 3, 1, 2, 4)):
+        for match in pattern.finditer(text):
+            if overlaps(match):
+                continue
+            month = _month_number(match.group(month_group))
+            start = _resolve_date(match.group(year_group), month, int(match.group(start_group)), today)
+            end = _resolve_date(str(start.year) if start else match.group(year_group), month,
+                                int(match.group(end_group)), today)
+            if start and end and end > start:
+                found.append((match.start(), start))
+                found.append((match.start() + 1, end))
+            else:
+                invalid = True
+            claim(match)
+
+    for pattern, month_group, day_group, year_group in ((_month_day, 1, 2, 3), (_day_month, 2, 1, 3)):
+        for match in pattern.finditer(text):
+            if overlaps(match):
+                continue
+            parsed = _resolve_date(match.group(year_group), _month_number(match.group(month_group)),
+                                   int(match.group(day_group)), today)
+            if parsed:
+                found.append((match.start(), parsed))
+            else:
+                invalid = True
+            claim(match)
+
+    for match in _relative_day.finditer(text):
+        offset = 1 if match.group(1).lower() == "tomorrow" else 0
+        found.append((match.start(), today + timedelta(days=offset)))
+        claim(match)
+
+    for match in _weekend.finditer(text):
+        friday = today + timedelta(days=(4 - today.weekday()) % 7)
+        if match.group(1).lower() == "next":
+            friday += timedelta(days=7)
+        found.append((match.start(), friday))
+        implied_checkout = friday + timedelta(days=2)
+        claim(match)
+
+    for match in _next_week.finditer(text):
+        if overlaps(match):
+            continue
+        monday = today + timedelta(days=7 - today.weekday())
+        found.append((match.start(), monday))
+        implied_checkout = implied_checkout or monday + timedelta(days=7)
+        claim(match)
+
+    found.sort(key=lambda item: item[0])
+    nights = _nights.search(text)
+    if nights and found:
+        count = _to_int(nights.group(1))
+        if count:
+            implied_checkout = found[0][1] + timedelta(days=count)
+
+    # A month name that did not end up in any parsed date means we missed something,
+    # as do other date-like text left over and a stay length with nothing to start from
+    unparsed = invalid or any(not overlaps(match) for match in _month_mention.finditer(text)
+                              if match.group(1).lower() != "may" or re.search(r"\bmay\s+\d", text[match.start():], re.I))
+    unparsed = unparsed or any(not overlaps(match) for pattern in _unhandled_dates for match in pattern.finditer(text))
+    unparsed = unparsed or (not found and _stay_length.search(text) is not None)
+    return found, implied_checkout, unparsed
+
+def _parse_location(text: str) -> Tuple[Optional[str], bool]:
+    """Return (location, whether it looks like a proper place name)
+
+    The first proper-noun candidate wins; otherwise the first lowercase one is returned.
+    """
+    fallback = None
+    for match in _location.finditer(text):
+        words = []
+        for word in match.group(1).split():
+            bare = word.rstrip(".,!?;:")
+            if bare.lower() in _location_stop_words or _month_mention.fullmatch(bare) or _to_int(bare) is not None:
+                break
+            words.append(bare)
+            if bare != word:
+                break
+        if not words or words[0].lower() in _non_location_starts or _month_mention.fullmatch(words[0]):
+            continue
+
+        location = " ".join(words)
+        end = match.start(1) + len(location)
+        continuation = _location_continuation.match(text, end)
+        if continuation and continuation.group(1).split()[0].lower() not in _location_stop_words:
+            location += ", " + continuation.group(1)
+        proper = all(part[:1].isupper() for part in location.replace(",", " ").split()
+                     if part.lower() not in {"de", "del", "la", "le", "los", "las", "of", "da", "do", "di"})
+        if proper:
+            return location, True
+        fallback = fallback or location
+    return fallback, False
+
+def _parse_guests(text: str) -> Dict[str, int]:
+    guests = {}
+    for name, pattern in _guest_patterns:
+        match = pattern.search(text)
+        if match:
+            count = _to_int(match.group(1))
+            if count:
+                guests[name] = count
+    if "adults" not in guests:
+        family = _family_of.search(text)
+        if family and _to_int(family.group(1)):
+            guests["adults"] = _to_int(family.group(1))
+        elif _couple.search(text):
+            guests["adults"] = 2
+        elif _solo.search(text):
+            guests["adults"] = 1
+    if "pets" not in guests and _single_pet.search(text):
+        guests["pets"] = 1
+    return guests
+
+def _parse_price(text: str) -> Dict[str, int]:
+    price = {}
+    match = _price_between.search(text) or _price_range.search(text)
+    if match:
+        low, high = _to_amount(match.group(1)), _to_amount(match.group(2))
+        if low is not None and high is not None and low <= high:
+            return {"minPrice": low, "maxPrice": high}
+    match = _price_max.search(text)
+    if match and _to_amount(match.group(1)) is not None:
+        price["maxPrice"] = _to_amount(match.group(1))
+    match = _price_min.search(text)
+    if match and _to_amount(match.group(1)) is not None:
+        price["minPrice"] = _to_amount(match.group(1))
+    return price
+
+def _parse_rating(text: str) -> Dict[str, Any]:
+    rating = {}
+    match = _rating_min.search(text) or _rating_stars.search(text)
+    if match and 0 < float(match.group(1)) <= 5:
+        rating["minRating"] = float(match.group(1))
+    if _sort_rating.search(text):
+        rating["sort_by"] = "rating"
+    elif _sort_price.search(text):
+        rating["sort_by"] = "price"
+    return rating
+
+def _parse_listing_ids(text: str) -> List[str]:
+    ids = []
+    for pattern in (_room_url, _listing_id):
+        for match in pattern.finditer(text):
+            if match.group(1) not in ids:
+                ids.append(match.group(1))
+    if not ids and _details_words.search(text):
+        ids = [match.group(1) for match in _bare_id.finditer(text)]
+    return ids
+
+def parse_intent(text: str, today: date = None) -> ParsedIntent:
+    """Parse a chat message into an AirbnbRequest-shaped intent with a confidence score"""
+    today = today or date.today()
+    reasons = []
+
+    dates, implied_checkout, unparsed_dates = _parse_dates(text, today)
+    date_params = {}
+    if dates:
+        date_params["checkin"] = dates[0][1].isoformat()
+        checkout = dates[1][1] if len(dates) > 1 and dates[1][1] > dates[0][1] else implied_checkout
+        if checkout and checkout > dates[0][1]:
+            date_params["checkout"] = checkout.isoformat()
+
+    listing_ids = _parse_listing_ids(text)
+    if listing_ids:
+        parameters = {"id": listing_ids[0], **date_params}
+        confidence = 0.95 if len(listing_ids) == 1 else 0.5
+        if len(listing_ids) > 1:
+            reasons.append("several listing ids")
+        if unparsed_dates:
+            confidence -= 0.3
+            reasons.append("unparsed date text")
+        return ParsedIntent("details", parameters, round(confidence, 2), reasons)
+
+    location, proper = _parse_location(text)
+    if not location:
+        return ParsedIntent(None, {}, 0.0, ["no location or listing id"])
+
+    parameters = {"location": location, **date_params, **_parse_guests(text), **_parse_price(text),
+                  **_parse_rating(text)}
+    confidence = 0.9 if proper else 0.6
+    if not proper:
+        reasons.append("location is not a proper name")
+    if not _search_words.search(text):
+        confidence -= 0.1
+        reasons.append("no search wording")
+    if _details_words.search(text):
+        confidence -= 0.4
+        reasons.append("details wording without a listing id")
+    if unparsed_dates:
+        confidence -= 0.3
+        reasons.append("unparsed date text")
+    if _alternatives.search(text):
+        confidence -= 0.3
+        reasons.append("alternatives or comparisons")
+    if _question.search(text) and not _polite_request.search(text):
+        confidence -= 0.3
+        reasons.append("phrased as a question")
+    return ParsedIntent("search", parameters, round(max(confidence, 0.0), 2), reasons)
+
+class IntentStats:
+    """Counts how often the local parser answered instead of the remote agent"""
+
+    def __init__(self):
+        self.local = 0
+        self.remote = 0
+
+    def record(self, used_local: bool):
+        if used_local:
+            self.local += 1
+        else:
+            self.remote += 1
+
+    def hit_rate(self) -> float:
+        total = self.local + self.remote
+        return round(self.local / total, 4) if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"local": self.local, "remote": self.remote, "hit_rate": self.hit_rate()}
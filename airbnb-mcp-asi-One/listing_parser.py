@@ -0,0 +1,80 @@
+# listing_parser.py
+from typing import Any, List, Tuple
+import json
+import re
+
+# Incremental parsing of airbnb_search payloads. Only the first `limit` entries of
+# "searchResults" are decoded into Python objects; the remaining entries are run
+# through a decoder that throws every object away as soon as it is built, so they
+# are counted at C speed but never kept in memory.
+
+_decoder = json.JSONDecoder()
+_discarding_decoder = json.JSONDecoder(object_pairs_hook=lambda pairs: None)
+_whitespace = re.compile(r"\s*")
+
+def _skip_ws(text: str, pos: int) -> int:
+    return _whitespace.match(text, pos).end()
+
+def _skip_value(text: str, pos: int) -> int:
+    """Return the position just past the JSON value starting at pos, discarding the value"""
+    _, end = _discarding_decoder.raw_decode(text, pos)
+    return end
+
+def _scan_array(text: str, pos: int, limit: int) -> Tuple[List[Any], int]:
+    """Decode the first `limit` items of the array at pos and count the rest"""
+    items = []
+    count = 0
+    pos = _skip_ws(text, pos + 1)
+    if text[pos] == "]":
+        return items, count
+
+    while True:
+        if count < limit:
+            value, pos = _decoder.raw_decode(text, pos)
+            items.append(value)
+        else:
+            pos = _skip_value(text, pos)
+        count += 1
+
+        pos = _skip_ws(text, pos)
+        char = text[pos]
+        if char == ",":
+            pos = _skip_ws(text, pos + 1)
+        elif char == "]":
+            return items, count
+        else:
+            raise ValueError(f"Unexpected character {char!r} in array")
+
+def parse_search_results(text: str, limit: int) -> Tuple[List[Any], int]:
+    """Return the first `limit` search results and the total number of results
+
+    Raises json.JSONDecodeError if the payload is not valid JSON.
+    """
+    try:
+        pos = _skip_ws(text, 0)
+        if text[pos] != "{":
+            raise ValueError("Search payload is not a JSON object")
+        pos = _skip_ws(text, pos + 1)
+
+        while text[pos] != "}":
+            key, pos = _decoder.raw_decode(text, pos)
+            pos = _skip_ws(text, pos)
+            if text[pos] != ":":
+                raise ValueError("Expected ':' after object key")
+            pos = _skip_ws(text, pos + 1)
+
+            if key == "searchResults" and text[pos] == "[":
+                return _scan_array(text, pos, limit)
+
+            pos = _skip_ws(text, _skip_value(text, pos))
+            if text[pos] == ",":
+                pos = _skip_ws(text, pos + 1)
+            elif text[pos] != "}":
+                raise ValueError("Expected ',' or '}' in object")
+        return [], 0
+    except (ValueError, IndexError):
+        # Anything unexpected (including malformed JSON) goes through the regular parser,
+        # which either handles it or raises a JSONDecodeError for the caller
+        parsed_content = json.loads(text)
+        search_results = parsed_content.get("searchResults", []) if isinstance(parsed_content, dict) else []
+        return search_results[:limit], len(search_results)
@@ -0,0 +1,274 @@
+# listings.py
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import re
+
+# Compact records for Airbnb results and the one renderer that turns them into
+# the text sent to users. Search results memoize each rendering, so a result
+# served from the search cache carries its text instead of rebuilding it.
+
+# How many amenities a details lookup keeps, and how much of the description is shown
+DETAILS_MAX_AMENITIES = 5
+DETAILS_DESCRIPTION_CHARS = 200
+
+# "$642 for 5 nights, originally $710", "€85 per night", "4.93 out of 5 average rating, 412 reviews"
+PRICE_AMOUNT_RE = re.compile(r"([^\d\s,.]*)\s?(\d[\d,]*(?:\.\d+)?)\s?([A-Z]{3}\b)?")
+PRICE_NIGHTS_RE = re.compile(r"\bfor (\d+) nights?\b", re.IGNORECASE)
+RATING_RE = re.compile(r"(\d+(?:\.\d+)?) out of 5", re.IGNORECASE)
+REVIEWS_RE = re.compile(r"(\d[\d,]*) reviews?", re.IGNORECASE)
+MIN_RATING_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*\+?\s*(?:stars?)?\s*$", re.IGNORECASE)
+CURRENCY_SYMBOLS = {"$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY", "₹": "INR", "₩": "KRW", "R$": "BRL",
+                    "CA$": "CAD", "A$": "AUD", "MX$": "MXN", "CHF": "CHF"}
+
+def parse_price_label(label: str) -> Tuple[Optional[float], Optional[str]]:
+    """Nightly price and currency code from a price label
+
+    The first amount is the current price, for the whole stay when the label
+    says "for N nights" (then divided by N) and per night otherwise.
+    """
+    match = PRICE_AMOUNT_RE.search(label or "")
+    if match is None:
+        return None, None
+    symbol, amount, code = match.group(1), float(match.group(2).replace(",", "")), match.group(3)
+    nights = PRICE_NIGHTS_RE.search(label, match.end())
+    if nights and int(nights.group(1)) > 0:
+        amount /= int(nights.group(1))
+    return round(amount, 2), code or CURRENCY_SYMBOLS.get(symbol, symbol or None)
+
+def parse_rating_label(label: str) -> Tuple[Optional[float], Optional[int]]:
+    """Average rating and review count from a rating label ("Not rated" gives neither)"""
+    rating = RATING_RE.search(label or "")
+    reviews = REVIEWS_RE.search(label or "")
+    return (float(rating.group(1)) if rating else None,
+            int(reviews.group(1).replace(",", "")) if reviews else None)
+
+class Listing:
+    """One search result; the details fields are set once the listing is enriched"""
+
+    __slots__ = ("id", "name", "price", "rating", "url", "price_value", "currency", "rating_value", "review_count",
+                 "bedrooms", "bathrooms", "guests", "amenities", "search")
+
+    def __init__(self, id: str, name: str, price: str, rating: str, url: str, price_value: Optional[float] = None,
+                 currency: Optional[str] = None, rating_value: Optional[float] = None, review_count: Optional[int] = None,
+                 bedrooms: Any = None, bathrooms: Any = None, guests: Any = None,
+                 amenities: Optional[Tuple[str, ...]] = None, search: Optional[str] = None):
+        self.id = id
+        self.name = name
+        self.price = price  # labels as Airbnb shows them
+        self.rating = rating
+        self.url = url
+        self.price_value = price_value  # nightly price parsed from the label
+        self.currency = currency
+        self.rating_value = rating_value
+        self.review_count = review_count
+        self.bedrooms = bedrooms
+        self.bathrooms = bathrooms
+        self.guests = guests
+        self.amenities = amenities
+        self.search = search  # which search of a merged result the listing came from
+
+    @classmethod
+    def from_search_result(cls, result: Dict[str, Any]) -> "Listing":
+        """Build a listing from one entry of the airbnb_search payload"""
+        description = result.get("demandStayListing", {}).get("description", {})
+        price = result.get("structuredDisplayPrice", {}).get("primaryLine", {}).get("accessibilityLabel", "Price not available")
+        rating = result.get("avgRatingA11yLabel", "Not rated")
+        price_value, currency = parse_price_label(price)
+        rating_value, review_count = parse_rating_label(rating)
+        return cls(
+            id=result.get("id", "N/A"),
+            name=description.get("name", {}).get("localizedStringWithTranslationPreference", "Unnamed Listing"),
+            price=price,
+            rating=rating,
+            url=result.get("url", "N/A"),
+            price_value=price_value,
+            currency=currency,
+            rating_value=rating_value,
+            review_count=review_count,
+        )
+
+    @property
+    def enriched(self) -> bool:
+        return self.bedrooms is not None
+
+    @property
+    def max_guests(self) -> Optional[int]:
+        """Guest capacity, known once the listing is enriched"""
+        return self.guests if isinstance(self.guests, int) else None
+
+    def replace(self, **changes) -> "Listing":
+        """Copy of this listing with some fields changed"""
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return Listing(**values)
+
+    def with_details(self, details: "ListingDetails") -> "Listing":
+        """Copy of this listing with the room counts and amenities from its details"""
+        return self.replace(bedrooms=details.bedrooms, bathrooms=details.bathrooms, guests=details.guests,
+                            amenities=details.amenities)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None}
+
+    def __repr__(self) -> str:
+        return f"Listing(id={self.id!r}, name={self.name!r})"
+
+# Accepted spellings of the two sort orders
+SORT_ORDERS = {"price": "price", "cheapest": "price", "lowest price": "price",
+               "rating": "rating", "best rated": "rating", "top rated": "rating", "highest rated": "rating"}
+
+def normalize_sort_by(value: Any) -> Optional[str]:
+    """"price" or "rating" for a sort_by value, None if it is unset; ValueError for anything else"""
+    if value is None or value == "":
+        return None
+    key = " ".join(str(value).replace("-", " ").replace("_", " ").split()).lower()
+    if key not in SORT_ORDERS:
+        raise ValueError(f'Unknown sort order {value!r}, use "price" or "rating"')
+    return SORT_ORDERS[key]
+
+def normalize_min_rating(value: Any) -> Optional[float]:
+    """Minimum rating from 4.5, "4.5", "4.5+" or "4.5 stars", None if it is unset; ValueError otherwise"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        rating = float(value)
+    else:
+        match = MIN_RATING_RE.match(str(value))
+        rating = float(match.group(1)) if match else None
+    if rating is None or not 0 <= rating <= 5:
+        raise ValueError(f"Invalid minRating {value!r}, use a number from 0 to 5")
+    return rating
+
+def rank_listings(listings: Sequence[Listing], sort_by: str = "price") -> List[Listing]:
+    """Cheapest nightly price first, or best rating first; listings without a number go last"""
+    if sort_by == "rating":
+        return sorted(listings, key=lambda listing: (listing.rating_value is None, -(listing.rating_value or 0),
+                                                     -(listing.review_count or 0)))
+    if sort_by != "price":
+        raise ValueError(f"Unknown sort order: {sort_by}")
+    return sorted(listings, key=lambda listing: (listing.price_value is None, listing.price_value or 0))
+
+class ListingDetails:
+    """The parts of an airbnb_listing_details payload shown to users"""
+
+    __slots__ = ("name", "description", "bedrooms", "bathrooms", "guests", "price", "amenities")
+
+    def __init__(self, name: str = "N/A", description: str = "No description available", bedrooms: Any = "N/A",
+                 bathrooms: Any = "N/A", guests: Any = "N/A", price: Any = "N/A", amenities: Iterable[str] = ()):
+        self.name = name
+        self.description = description
+        self.bedrooms = bedrooms
+        self.bathrooms = bathrooms
+        self.guests = guests
+        self.price = price
+        self.amenities = tuple(amenities)
+
+    @classmethod
+    def from_payload(cls, details: Dict[str, Any]) -> "ListingDetails":
+        """Build the record from the decoded airbnb_listing_details payload"""
+        amenities = details.get("amenities", [])[:DETAILS_MAX_AMENITIES]
+        return cls(
+            name=details.get("name", "N/A"),
+            description=details.get("description", "No description available"),
+            bedrooms=details.get("bedrooms", "N/A"),
+            bathrooms=details.get("bathrooms", "N/A"),
+            guests=details.get("maxGuests", "N/A"),
+            price=details.get("price", {}).get("rate", "N/A"),
+            amenities=[amenity.get("name", "Unknown Amenity") for amenity in amenities],
+        )
+
+    @classmethod
+    def from_dict(cls, values: Dict[str, Any]) -> "ListingDetails":
+        """Rebuild the record from to_dict() output, e.g. a details cache entry"""
+        return cls(**{name: values[name] for name in cls.__slots__ if name in values})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: list(self.amenities) if name == "amenities" else getattr(self, name) for name in self.__slots__}
+
+    def render(self) -> str:
+        """Text shown to the user for a details lookup"""
+        parts = [
+            f"DETAILS FOR LISTING: {self.name}\n\n",
+            f"Bedrooms: {self.bedrooms}\n",
+            f"Bathrooms: {self.bathrooms}\n",
+            f"Max Guests: {self.guests}\n",
+            f"Price: {self.price}\n\n",
+        ]
+        if self.amenities:
+            parts.append("Top Amenities:\n")
+            parts.extend(f"- {amenity}\n" for amenity in self.amenities)
+        description = self.description
+        if len(description) > DETAILS_DESCRIPTION_CHARS:
+            description = description[:DETAILS_DESCRIPTION_CHARS] + "..."
+        parts.append(f"\nDescription: {description}\n")
+        return "".join(parts)
+
+# Search renderings by style: a header and the block repeated for each listing.
+# "full" is the chat answer; "summary" is the shorter list sent to ASI:One and
+# used by the fallback searches.
+SEARCH_TEMPLATES = {
+    "full": (
+        "AIRBNB LISTINGS IN {location_upper}\n\nFound {total} listings. Showing top {shown}:\n\n",
+        "{index}. {name}\n   Price: {price}\n   Rating: {rating}\n{search}{extra}   ID: {id}\n   URL: {url}\n\n",
+    ),
+    "summary": (
+        "Here are {limit} Airbnb rentals in {location}:\n\n",
+        "{index}. {name}\n   Price: {price}\n   Rating: {rating}\n{search}\n",
+    ),
+}
+
+def _search_line(listing: Listing) -> str:
+    return f"   Search: {listing.search}\n" if listing.search else ""
+
+def _details_lines(listing: Listing) -> str:
+    lines = []
+    if listing.enriched:
+        lines.append(f"   Bedrooms: {listing.bedrooms}, Bathrooms: {listing.bathrooms}, Max Guests: {listing.guests}\n")
+    if listing.amenities:
+        lines.append(f"   Amenities: {', '.join(listing.amenities)}\n")
+    return "".join(lines)
+
+class SearchResults:
+    """Listings returned for a location, with their renderings memoized per style and limit"""
+
+    __slots__ = ("location", "total", "listings", "_rendered")
+
+    def __init__(self, location: str, total: int, listings: Iterable[Listing]):
+        self.location = location
+        self.total = total
+        self.listings = tuple(listings)
+        self._rendered = {}
+
+    def with_listings(self, listings: Iterable[Listing]) -> "SearchResults":
+        """Same search with different listings (e.g. enriched ones); renderings start empty"""
+        return SearchResults(self.location, self.total, listings)
+
+    def render(self, style: str = "full", limit: int = None) -> str:
+        key = (style, limit)
+        text = self._rendered.get(key)
+        if text is None:
+            text = self._rendered[key] = self._render(style, limit)
+        return text
+
+    def _render(self, style: str, limit: Optional[int]) -> str:
+        listings = self.listings if limit is None else self.listings[:limit]
+        return self.render_header(style, limit) + self.render_listings(listings, style)
+
+    def render_header(self, style: str = "full", limit: int = None) -> str:
+        """Header of a rendering, for sending the listings in several parts"""
+        shown = len(self.listings) if limit is None else min(limit, len(self.listings))
+        return SEARCH_TEMPLATES[style][0].format(
+            location=self.location,
+            location_upper=self.location.upper(),
+            total=self.total,
+            shown=shown,
+            limit=shown if limit is None else limit,
+        )
+
+    def render_listings(self, listings: Iterable[Listing], style: str = "full", start: int = 1) -> str:
+        """Blocks for listings numbered from start; not memoized"""
+        block = SEARCH_TEMPLATES[style][1]
+        return "".join(
+            block.format(index=index, name=listing.name, price=listing.price, rating=listing.rating,
+                         id=listing.id, url=listing.url, search=_search_line(listing), extra=_details_lines(listing))
+            for index, listing in enumerate(listings, start)
+        )
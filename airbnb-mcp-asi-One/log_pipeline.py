@@ -0,0 +1,240 @@
+# log_pipeline.py
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+from uuid import uuid4
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+
+# Log files live next to the agent code, one rotating file per component
+log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+log_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_FLUSH_RECORDS = int(os.getenv("LOG_FLUSH_RECORDS", "256"))  # flush after this many buffered records
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))  # or after this many idle seconds
+
+# LOG_LEVEL picks the minimum level; LOG_FORMAT=json switches to structured records.
+# LOG_MODE=production is shorthand for INFO-level JSON logs.
+LOG_MODE = os.getenv("LOG_MODE", "development").lower()
+LOG_LEVEL = logging.getLevelName(os.getenv("LOG_LEVEL", "INFO" if LOG_MODE == "production" else "DEBUG").upper())
+if not isinstance(LOG_LEVEL, int):
+    LOG_LEVEL = logging.DEBUG
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json" if LOG_MODE == "production" else "text").lower()
+
+# Id of the request being handled, attached to every record logged while handling it
+current_request_id = ContextVar("current_request_id", default=None)
+
+def new_request_id() -> str:
+    """Start a new request id for the current task unless one is already set"""
+    request_id = current_request_id.get()
+    if request_id is None:
+        request_id = uuid4().hex[:12]
+        current_request_id.set(request_id)
+    return request_id
+
+def log_event(logger: logging.Logger, message: str, level: int = logging.INFO, **fields):
+    """Log a structured record; fields become JSON keys (or key=value pairs in text mode)"""
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={"fields": fields})
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the request id of the task that logged them"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = current_request_id.get()
+        return True
+
+class TextFormatter(logging.Formatter):
+    """Plain text formatter that appends structured fields as key=value pairs"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            text += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return text
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+def create_formatter(with_name: bool = True) -> logging.Formatter:
+    if LOG_FORMAT == "json":
+        return JsonFormatter()
+    if with_name:
+        return TextFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    return TextFormatter('%(asctime)s - %(levelname)s - %(message)s')
+
+def configure_logging():
+    """Configure the console log handler from LOG_LEVEL and LOG_FORMAT"""
+    root = logging.getLogger()
+    if not root.handlers:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(create_formatter(with_name=False))
+        console_handler.addFilter(RequestIdFilter())
+        root.addHandler(console_handler)
+    root.setLevel(LOG_LEVEL)
+
+class BufferedRotatingFileHandler(RotatingFileHandler):
+    """Rotating file handler that leaves flushing to the background writer"""
+
+    def flush(self):
+        pass
+
+    def force_flush(self):
+        super().flush()
+
+    def close(self):
+        self.force_flush()
+        super().close()
+
+_exception_formatter = logging.Formatter()
+
+class QueueingHandler(logging.Handler):
+    """Hands records to the background writer, which formats and writes them
+
+    The message is merged with its args here, like QueueHandler.prepare, so
+    arguments the caller mutates afterwards are logged as they were; disabled
+    levels never reach emit and cost nothing. Layout and I/O happen on the
+    writer thread. When the queue is full the record is dropped rather than
+    blocking the caller.
+    """
+
+    def __init__(self, writer: "LogWriter", target: logging.Handler):
+        super().__init__(level=target.level)
+        self.writer = writer
+        self.target = target
+
+    def emit(self, record: logging.LogRecord):
+        # Capture the request id now; the writer thread does not share our context
+        if not hasattr(record, "request_id"):
+            record.request_id = current_request_id.get()
+        # A copy, so other handlers still see the original record
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        try:
+            self.writer.queue.put_nowait((self.target, record))
+        except queue.Full:
+            self.writer.dropped += 1
+
+class LogWriter:
+    """Background thread that drains queued records into their file handlers in batches"""
+
+    def __init__(self, max_queue: int = LOG_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.written = 0
+        self._handlers = set()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        pending = 0
+        while True:
+            try:
+                item = self.queue.get(timeout=LOG_FLUSH_INTERVAL)
+            except queue.Empty:
+                if pending:
+                    self._flush()
+                    pending = 0
+                continue
+
+            if item is None:
+                self._flush()
+                return
+
+            target, record = item
+            self._handlers.add(target)
+            try:
+                target.handle(record)
+                self.written += 1
+            except Exception:
+                target.handleError(record)
+            pending += 1
+            if pending >= LOG_FLUSH_RECORDS:
+                self._flush()
+                pending = 0
+
+    def _flush(self):
+        for handler in list(self._handlers):
+            try:
+                handler.force_flush()
+            except Exception:
+                pass
+
+    def stop(self):
+        """Write out everything still queued and stop the thread"""
+        with self._lock:
+            if self._thread is None:
+                return
+            self.queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+        for handler in list(self._handlers):
+            handler.close()
+
+# Shared writer for every component's log file
+log_writer = LogWriter()
+atexit.register(log_writer.stop)
+
+def create_file_handler(component: str) -> BufferedRotatingFileHandler:
+    """Create the rotating log file handler for one component"""
+    os.makedirs(log_dir, exist_ok=True)
+    log_file = os.path.join(log_dir, f"{component}_{log_timestamp}.log")
+    handler = BufferedRotatingFileHandler(
+        log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, delay=True
+    )
+    handler.setLevel(LOG_LEVEL)
+    handler.setFormatter(create_formatter())
+    return handler
+
+def attach_file_logging(logger: logging.Logger, component: str) -> logging.Logger:
+    """Route a logger to its component's log file through the background writer
+
+    Returns a file-only child logger (it does not propagate to the console) that
+    replaces the old per-line log_to_file helpers.
+    """
+    log_writer.start()
+    file_handler = create_file_handler(component)
+    logger.addHandler(QueueingHandler(log_writer, file_handler))
+
+    file_logger = logger.getChild("file")
+    file_logger.propagate = False
+    file_logger.setLevel(LOG_LEVEL)
+    file_logger.addHandler(QueueingHandler(log_writer, file_handler))
+    return file_logger
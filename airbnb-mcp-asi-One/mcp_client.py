@@ -1,116 +1,654 @@
 # mcp_client.py
-from contextlib import AsyncExitStack
+from contextlib import AsyncExitStack, asynccontextmanager
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
-from typing import Dict, Any
+from mcp.shared.exceptions import McpError
+from typing import AsyncIterator, Dict, Any, List, Optional, Sequence, Tuple, Union
+import anyio
+import asyncio
 import json
 import logging
 import traceback  # Added for detailed error tracing
 import os
-from datetime import datetime
+import re
+import shutil
+import time
+from datetime import date, datetime
 
-# Configure logging - increase level for more details
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+from listing_parser import parse_search_results
+from log_pipeline import attach_file_logging, configure_logging, log_event, new_request_id
+from listings import (
+    Listing, ListingDetails, SearchResults, normalize_min_rating, normalize_sort_by, rank_listings
+)
+from search_index import SEARCH_INDEX_ENABLED, SEARCH_INDEX_LISTINGS, filter_listings, search_index
+from cache import PersistentCache, PopularityCounter, TTLCache, canonical_params, canonical_search_key, details_cache_key
+from metrics import format_seconds, mcp_call_seconds, parse_seconds, registry
+
+# Configure logging - level and format come from LOG_LEVEL / LOG_FORMAT (see log_pipeline)
+configure_logging()
 logger = logging.getLogger("mcp_client")
 
-# Add file logging
-log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
-os.makedirs(log_dir, exist_ok=True)
-log_file = os.path.join(log_dir, f"mcp_client_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
-
-# Create file handler
-file_handler = logging.FileHandler(log_file)
-file_handler.setLevel(logging.DEBUG)
-file_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(file_formatter)
-logger.addHandler(file_handler)
-
-# Function to log to file directly
-def log_to_file(message):
-    """Write a message directly to the log file"""
-    with open(log_file, 'a') as f:
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
-        f.write(f"[{timestamp}] {message}\n")
-
-# Global variable to store MCP session
-mcp_session = None
-mcp_exit_stack = None
+# Add file logging through the background log writer
+file_logger = attach_file_logging(logger, "mcp_client")
+
+# Function to log to the file only
+def log_to_file(message, *args):
+    """Queue a debug trace for the log file; it is only formatted when DEBUG is enabled"""
+    file_logger.debug(message, *args)
+
+# Data directory for persistent state (caches, pinned MCP server install)
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# MCP server pool configuration (overridable via environment variables)
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", str(min(os.cpu_count() or 1, 4))))
+MCP_POOL_MAX_IN_FLIGHT = int(os.getenv("MCP_POOL_MAX_IN_FLIGHT", "4"))
+MCP_POOL_STRATEGY = os.getenv("MCP_POOL_STRATEGY", "least_busy")  # "least_busy" or "round_robin"
+
+# Supervision of the MCP server processes
+MCP_RESTART_BASE_DELAY = float(os.getenv("MCP_RESTART_BASE_DELAY", "0.5"))
+MCP_RESTART_MAX_DELAY = float(os.getenv("MCP_RESTART_MAX_DELAY", "30"))
+MCP_PING_INTERVAL_SECONDS = float(os.getenv("MCP_PING_INTERVAL_SECONDS", "30"))
+MCP_PING_TIMEOUT_SECONDS = float(os.getenv("MCP_PING_TIMEOUT_SECONDS", "10"))
+MCP_CALL_RETRIES = int(os.getenv("MCP_CALL_RETRIES", "1"))  # replays of a call that hit a broken transport
+MCP_LATENCY_SMOOTHING = float(os.getenv("MCP_LATENCY_SMOOTHING", "0.2"))  # weight of the newest call in the latency average
+
+# MCP server installation. The server is launched from a pinned local install when
+# one exists (or can be installed once), so boots skip npx package resolution
+AIRBNB_MCP_PACKAGE = "@openbnb/mcp-server-airbnb"
+AIRBNB_MCP_SERVER_VERSION = os.getenv("AIRBNB_MCP_SERVER_VERSION", "latest")
+AIRBNB_MCP_SERVER_PATH = os.getenv("AIRBNB_MCP_SERVER_PATH")  # explicit server entry point, if pinned manually
+AIRBNB_MCP_SERVER_PREFIX = os.getenv("AIRBNB_MCP_SERVER_PREFIX", os.path.join(data_dir, "mcp-server"))
+AIRBNB_MCP_AUTO_INSTALL = os.getenv("AIRBNB_MCP_AUTO_INSTALL", "true").lower() == "true"
+AIRBNB_MCP_INSTALL_TIMEOUT = float(os.getenv("AIRBNB_MCP_INSTALL_TIMEOUT", "120"))
+
+# Resolved (command, args) used to launch each server; None until resolved
+server_command = None
+
+def _entry_point_command(path: str):
+    if path.endswith((".js", ".mjs", ".cjs")):
+        return "node", [path]
+    return path, []
+
+def _installed_entry_point(prefix: str):
+    """Return the bin script of the MCP server package installed under prefix, if any"""
+    package_dir = os.path.join(prefix, "node_modules", *AIRBNB_MCP_PACKAGE.split("/"))
+    try:
+        with open(os.path.join(package_dir, "package.json")) as f:
+            package = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    bin_entry = package.get("bin")
+    if isinstance(bin_entry, dict):
+        bin_entry = next(iter(bin_entry.values()), None)
+    if not bin_entry:
+        return None
+    entry_point = os.path.join(package_dir, bin_entry)
+    return entry_point if os.path.exists(entry_point) else None
+
+async def _install_server(prefix: str) -> bool:
+    """Install the pinned MCP server package under prefix with npm"""
+    if not shutil.which("npm"):
+        return False
+    logger.info("Installing %s@%s into %s", AIRBNB_MCP_PACKAGE, AIRBNB_MCP_SERVER_VERSION, prefix)
+    os.makedirs(prefix, exist_ok=True)
+    process = await asyncio.create_subprocess_exec(
+        "npm", "install", "--prefix", prefix, "--no-audit", "--no-fund",
+        f"{AIRBNB_MCP_PACKAGE}@{AIRBNB_MCP_SERVER_VERSION}",
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        _, stderr = await asyncio.wait_for(process.communicate(), timeout=AIRBNB_MCP_INSTALL_TIMEOUT)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        logger.error("npm install timed out after %ss", AIRBNB_MCP_INSTALL_TIMEOUT)
+        return False
+    if process.returncode != 0:
+        logger.error("npm install failed: %s", stderr.decode(errors='replace')[-500:])
+        return False
+    return True
+
+async def resolve_server_command():
+    """Resolve the MCP server launch command once, preferring a pinned local install over npx"""
+    global server_command
+    if server_command is not None:
+        return server_command
+
+    if AIRBNB_MCP_SERVER_PATH:
+        server_command = _entry_point_command(AIRBNB_MCP_SERVER_PATH)
+    else:
+        entry_point = _installed_entry_point(AIRBNB_MCP_SERVER_PREFIX)
+        if entry_point is None and AIRBNB_MCP_AUTO_INSTALL:
+            try:
+                if await _install_server(AIRBNB_MCP_SERVER_PREFIX):
+                    entry_point = _installed_entry_point(AIRBNB_MCP_SERVER_PREFIX)
+            except Exception as e:
+                logger.error("Error installing MCP server locally: %s", str(e))
+        if entry_point:
+            server_command = _entry_point_command(entry_point)
+        else:
+            logger.warning("No local MCP server install found, falling back to npx")
+            server_command = ("npx", ["-y", AIRBNB_MCP_PACKAGE])
+
+    logger.info("Resolved MCP server command: %s %s", server_command[0], ' '.join(server_command[1]))
+    return server_command
+
+def get_server_params():
+    """Build the stdio parameters used to launch one Airbnb MCP server process"""
+    command, args = server_command or ("npx", ["-y", AIRBNB_MCP_PACKAGE])
+    return StdioServerParameters(
+        command=command,
+        args=[*args, "--ignore-robots-txt"],
+        env={}
+    )
+
+def is_transport_error(error: BaseException) -> bool:
+    """Whether an exception means the MCP server connection itself is broken"""
+    if isinstance(error, (ConnectionError, EOFError, BrokenPipeError,
+                          anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream)):
+        return True
+    return isinstance(error, McpError) and "connection closed" in str(error).lower()
+
+class MCPServerConnection:
+    """A single supervised Airbnb MCP server subprocess and its client session
+
+    A supervisor task keeps the server running: when the transport breaks (the
+    process exits, a call fails with a transport error or a ping goes unanswered)
+    the server is restarted with exponential backoff and re-initialized.
+    """
+
+    def __init__(self, index: int, max_in_flight: int):
+        self.index = index
+        self.max_in_flight = max_in_flight
+        self.session = None
+        self.in_flight = 0
+        self.tools = []
+        self.restarts = 0
+        self.last_error = None
+        self.probe_latency = None  # seconds taken by the last successful health probe
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._closing = asyncio.Event()
+        self._stop_run = asyncio.Event()  # set when the current server run should end
+        self._task = None
+
+    @property
+    def connected(self) -> bool:
+        return self.session is not None
+
+    async def connect(self) -> bool:
+        """Start the supervised server and wait for its first connection attempt"""
+        ready = asyncio.get_running_loop().create_future()
+        self._closing.clear()
+        self._task = asyncio.create_task(self._supervise(ready))
+        try:
+            await ready
+            return True
+        except Exception as e:
+            logger.error("Error connecting MCP server #%s: %s", self.index, str(e))
+            logger.error(traceback.format_exc())
+            return False
+
+    def mark_broken(self, error: BaseException = None):
+        """Flag the transport as broken so the supervisor restarts the server"""
+        if self.session is not None:
+            logger.warning("MCP server #%s transport broken: %s", self.index, error)
+        self.last_error = str(error) if error else self.last_error
+        self.session = None
+        self._stop_run.set()
+
+    async def _supervise(self, first_ready):
+        delay = MCP_RESTART_BASE_DELAY
+        ready = first_ready
+        while not self._closing.is_set():
+            started = time.monotonic()
+            await self._run(ready)
+            if self._closing.is_set():
+                break
+
+            # A server that stayed up for a while gets a fresh backoff
+            if time.monotonic() - started > MCP_RESTART_MAX_DELAY:
+                delay = MCP_RESTART_BASE_DELAY
+            self.restarts += 1
+            logger.warning("Restarting MCP server #%s in %.1fs (restart %s)", self.index, delay, self.restarts)
+            try:
+                await asyncio.wait_for(self._closing.wait(), timeout=delay)
+                break
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, MCP_RESTART_MAX_DELAY)
+            ready = asyncio.get_running_loop().create_future()
+
+    async def _run(self, ready):
+        # The stdio transport must be opened and closed by the same task, so the
+        # supervisor task keeps the context open until the server is stopped or breaks
+        self._stop_run.clear()
+        try:
+            async with AsyncExitStack() as exit_stack:
+                stdio, write = await exit_stack.enter_async_context(stdio_client(get_server_params()))
+                session = await exit_stack.enter_async_context(ClientSession(stdio, write))
+
+                # Initialize the session and list tools to verify the connection
+                await session.initialize()
+                response = await session.list_tools()
+                self.tools = [tool.name for tool in response.tools]
+                self.session = session
+                self.last_error = None
+
+                logger.info("MCP server #%s connected with tools: %s", self.index, self.tools)
+                if not ready.done():
+                    ready.set_result(True)
+                await self._watch(session)
+        except Exception as e:
+            self.last_error = str(e)
+            if not ready.done():
+                ready.set_exception(e)
+            elif not self._closing.is_set():
+                logger.error("MCP server #%s stopped unexpectedly: %s", self.index, str(e))
+        finally:
+            self.session = None
+
+    async def _watch(self, session):
+        """Wait until the server is closed or broken, pinging it while idle"""
+        while not self._stop_run.is_set():
+            try:
+                await asyncio.wait_for(self._stop_run.wait(), timeout=MCP_PING_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                try:
+                    await asyncio.wait_for(session.send_ping(), timeout=MCP_PING_TIMEOUT_SECONDS)
+                except Exception as e:
+                    self.mark_broken(e if str(e) else "ping timed out")
+
+    async def probe(self, timeout: float) -> bool:
+        """Time a list_tools round trip; a server that does not answer is restarted
+
+        The probe bypasses the call slots so it measures the server itself rather
+        than the queue in front of it.
+        """
+        session = self.session
+        if session is None:
+            return False
+        start_time = time.perf_counter()
+        try:
+            await asyncio.wait_for(session.list_tools(), timeout=timeout)
+        except Exception as e:
+            self.probe_latency = None
+            self.mark_broken(e if str(e) else "health probe timed out")
+            return False
+        self.probe_latency = time.perf_counter() - start_time
+        return True
+
+    async def close(self):
+        """Stop the server process and wait for its transport to close"""
+        self._closing.set()
+        self._stop_run.set()
+        if self._task:
+            try:
+                await self._task
+            except Exception as e:
+                logger.error("Error closing MCP server #%s: %s", self.index, str(e))
+        self._task = None
+        self.session = None
+
+class MCPSessionPool:
+    """Pool of Airbnb MCP server sessions with per-session in-flight limits"""
+
+    def __init__(self, size: int = None, max_in_flight: int = None, strategy: str = None):
+        size = MCP_POOL_SIZE if size is None else size
+        max_in_flight = MCP_POOL_MAX_IN_FLIGHT if max_in_flight is None else max_in_flight
+        strategy = strategy or MCP_POOL_STRATEGY
+        if strategy not in ("least_busy", "round_robin"):
+            raise ValueError(f"Unknown MCP pool strategy: {strategy}")
+        self.strategy = strategy
+        self.connections = [MCPServerConnection(i, max(1, max_in_flight)) for i in range(max(1, size))]
+        self._next = 0
+        # Exponentially weighted average duration of successful tool calls, None until the first one
+        self.latency_estimate = None
+
+    def is_connected(self) -> bool:
+        return any(conn.connected for conn in self.connections)
+
+    def in_flight(self) -> int:
+        return sum(conn.in_flight for conn in self.connections)
+
+    def restarts(self) -> int:
+        return sum(conn.restarts for conn in self.connections)
+
+    def capacity(self) -> int:
+        """Tool calls the live servers can run at once"""
+        return sum(conn.max_in_flight for conn in self.connections if conn.connected)
+
+    def record_latency(self, seconds: float):
+        if self.latency_estimate is None:
+            self.latency_estimate = seconds
+        else:
+            self.latency_estimate += MCP_LATENCY_SMOOTHING * (seconds - self.latency_estimate)
+
+    async def start(self) -> bool:
+        """Start every server in the pool concurrently; succeeds if at least one connects"""
+        results = await asyncio.gather(*(conn.connect() for conn in self.connections))
+        logger.info("MCP pool started with %s/%s servers", sum(results), len(self.connections))
+        return any(results)
+
+    def _pick(self):
+        live = [conn for conn in self.connections if conn.connected]
+        if not live:
+            return None
+        if self.strategy == "round_robin":
+            conn = live[self._next % len(live)]
+            self._next += 1
+            return conn
+        return min(live, key=lambda c: c.in_flight)
+
+    @asynccontextmanager
+    async def session(self):
+        """Check a session out of the pool for the duration of one tool call"""
+        conn = self._pick()
+        if conn is None:
+            raise ConnectionError("Not connected to Airbnb MCP server")
+        # Count the call before waiting so least-busy dispatch sees queued work too
+        conn.in_flight += 1
+        try:
+            async with conn._slots:
+                if not conn.connected:
+                    raise ConnectionError(f"MCP server #{conn.index} is not connected")
+                try:
+                    yield conn.session
+                except Exception as e:
+                    if is_transport_error(e):
+                        conn.mark_broken(e)
+                    raise
+        finally:
+            conn.in_flight -= 1
+
+    async def close(self):
+        await asyncio.gather(*(conn.close() for conn in self.connections))
+
+# Global MCP session pool and the seconds it took to become ready
+mcp_pool = None
+mcp_time_to_ready = None
+
+# Cache of successful airbnb_search results
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "300"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "256"))
+search_cache = TTLCache(max_entries=SEARCH_CACHE_MAX_ENTRIES, ttl_seconds=SEARCH_CACHE_TTL_SECONDS)
+
+# How often each search is asked for, by search cache key; prewarm.py keeps the most popular ones cached
+SEARCH_POPULARITY_HALF_LIFE_SECONDS = float(os.getenv("SEARCH_POPULARITY_HALF_LIFE_SECONDS", "3600"))
+search_popularity = PopularityCounter(max_entries=4 * SEARCH_CACHE_MAX_ENTRIES,
+                                      half_life_seconds=SEARCH_POPULARITY_HALF_LIFE_SECONDS)
+
+# Persistent cache of listing details, kept next to the logs directory so restarts start warm
+DETAILS_CACHE_PATH = os.getenv("DETAILS_CACHE_PATH", os.path.join(data_dir, "listing_details.sqlite3"))
+DETAILS_CACHE_FRESH_SECONDS = float(os.getenv("DETAILS_CACHE_FRESH_SECONDS", str(6 * 3600)))
+DETAILS_CACHE_MAX_STALE_SECONDS = float(os.getenv("DETAILS_CACHE_MAX_STALE_SECONDS", str(7 * 86400)))
+
+# Details lookups running at once when a search is enriched
+ENRICH_CONCURRENCY = int(os.getenv("ENRICH_CONCURRENCY", "4"))
+
+# Searches over several locations and/or date windows run one airbnb_search per
+# combination, FANOUT_CONCURRENCY at a time; a branch slower than the timeout is
+# dropped from the merged result instead of holding up the others
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "4"))
+FANOUT_BRANCH_TIMEOUT_SECONDS = float(os.getenv("FANOUT_BRANCH_TIMEOUT_SECONDS", "20"))
+FANOUT_MAX_BRANCHES = int(os.getenv("FANOUT_MAX_BRANCHES", "12"))
+details_cache = PersistentCache(
+    DETAILS_CACHE_PATH,
+    fresh_seconds=DETAILS_CACHE_FRESH_SECONDS,
+    max_stale_seconds=DETAILS_CACHE_MAX_STALE_SECONDS,
+)
+details_refresh_tasks = {}  # cache key -> background refresh task
 
 async def connect_to_airbnb_mcp():
-    """Connect to the Airbnb MCP server"""
-    global mcp_session, mcp_exit_stack
+    """Connect to the Airbnb MCP server pool"""
+    global mcp_pool, mcp_time_to_ready
+
+    start_time = time.monotonic()
+    await resolve_server_command()
+    logger.info("Connecting to Airbnb MCP server pool (size=%s, strategy=%s)", MCP_POOL_SIZE, MCP_POOL_STRATEGY)
+    # The pool stays installed even if no server came up: its supervisors keep
+    # restarting the servers and calls fail fast until one is connected
+    mcp_pool = MCPSessionPool()
+    if await mcp_pool.start():
+        mcp_time_to_ready = time.monotonic() - start_time
+        logger.info("Airbnb MCP server pool ready in %.2fs", mcp_time_to_ready)
+        return True
+
+    logger.error("Error connecting to Airbnb MCP server: no server in the pool connected yet")
+    return False
+
+class SingleFlight:
+    """Coalesces concurrent identical calls so they share one in-flight result"""
+
+    def __init__(self):
+        self.coalesced = 0
+        self.abandoned = 0
+        self._calls = {}  # key -> [task, caller count, callers still waiting]
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key, func, *args):
+        call = self._calls.get(key)
+        if call is not None:
+            call[1] += 1
+            call[2] += 1
+            self.coalesced += 1
+        else:
+            # Run the call in its own task so one caller being cancelled
+            # does not cancel the result the other callers are waiting on
+            call = [asyncio.create_task(func(*args)), 1, 1]
+            self._calls[key] = call
+            call[0].add_done_callback(lambda _: self._finish(key, call))
+        try:
+            return await asyncio.shield(call[0])
+        except asyncio.CancelledError:
+            # Once every caller has given up there is nobody left to use the result
+            call[2] -= 1
+            if call[2] == 0 and not call[0].done():
+                call[0].cancel()
+                self.abandoned += 1
+            raise
+
+    def _finish(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if call[1] > 1:
+            logger.info("Coalesced %s duplicate callers onto MCP call %s", call[1] - 1, key[0])
+        # Avoid "exception was never retrieved" warnings when every caller was cancelled
+        if not call[0].cancelled():
+            call[0].exception()
+
+# Shared single-flight group for MCP tool calls
+mcp_single_flight = SingleFlight()
+
+# State counted elsewhere in this module, read when the metrics endpoint is scraped
+registry.callback("airbnb_cache_lookups_total", "Cache lookups by cache and result", "counter", lambda: [
+    ({"cache": "search", "result": "hit"}, search_cache.hits),
+    ({"cache": "search", "result": "miss"}, search_cache.misses),
+    ({"cache": "details", "result": "hit"}, details_cache.hits),
+    ({"cache": "details", "result": "stale"}, details_cache.stale_hits),
+    ({"cache": "details", "result": "miss"}, details_cache.misses),
+])
+registry.callback("airbnb_mcp_in_flight", "MCP tool calls checked out of the pool", "gauge",
+                  lambda: [({}, mcp_pool.in_flight() if mcp_pool else 0)])
+registry.callback("airbnb_mcp_restarts_total", "MCP server restarts", "counter",
+                  lambda: [({}, mcp_pool.restarts() if mcp_pool else 0)])
+registry.callback("airbnb_mcp_coalesced_calls_total", "Callers served by an identical in-flight MCP call", "counter",
+                  lambda: [({}, mcp_single_flight.coalesced)])
+
+async def _call_pooled_tool(tool_name: str, params: Dict[str, Any]):
+    # Tool calls are read-only, so a call that hit a broken transport is replayed
+    # on another live session; with none left it fails fast with ConnectionError
+    start_time = time.perf_counter()
+    outcome = "cancelled"
+    try:
+        for attempt in range(MCP_CALL_RETRIES + 1):
+            try:
+                async with mcp_pool.session() as session:
+                    call_start = time.perf_counter()  # after any wait for a free slot
+                    result = await session.call_tool(tool_name, params)
+                    outcome = "ok"
+                    mcp_pool.record_latency(time.perf_counter() - call_start)
+                    return result
+            except Exception as e:
+                outcome = "error"
+                if attempt >= MCP_CALL_RETRIES or not is_transport_error(e) or not mcp_pool.is_connected():
+                    raise
+                logger.warning("Replaying %s after transport error: %s", tool_name, str(e))
+    finally:
+        mcp_call_seconds.observe(time.perf_counter() - start_time, tool=tool_name, outcome=outcome)
+
+async def call_mcp_tool(tool_name: str, params: Dict[str, Any]):
+    """Call an MCP tool on a pooled session, sharing the result with identical in-flight calls"""
+    if not mcp_pool:
+        raise ConnectionError("Not connected to Airbnb MCP server")
+    key = (tool_name, canonical_params(params))
+    return await mcp_single_flight.do(key, _call_pooled_tool, tool_name, params)
+
+def is_search_cached(location: str, limit: int = 4, params: Dict[str, Any] = None) -> bool:
+    """Whether search_airbnb_listings would answer these arguments from the cache"""
+    return search_cache.contains(canonical_search_key(location, limit, params or {}))
+
+def format_search_output(results: SearchResults) -> str:
+    """Text shown to the user for a search; enriched listings also list bedrooms and amenities"""
+    with format_seconds.time(kind="search"):
+        return results.render()
+
+def search_result_dict(results: SearchResults, **extra) -> Dict[str, Any]:
+    """Result dict for a successful search, with its text rendered once"""
+    return {
+        "success": True,
+        "message": "Successfully retrieved listings",
+        "formatted_output": format_search_output(results),
+        "results": results,
+        "listings": results.listings,
+        "total_listings": results.total,
+        **extra,
+    }
+
+async def enrich_listing(listing: Listing, details_params: Dict[str, Any], semaphore: asyncio.Semaphore) -> Listing:
+    """The listing with its details merged in, or unchanged if they cannot be fetched"""
+    if listing.id in (None, "N/A"):
+        return listing
+    async with semaphore:
+        try:
+            details_result = await get_airbnb_listing_details(str(listing.id), **details_params)
+        except Exception as e:
+            logger.error("Error enriching listing %s: %s", listing.id, str(e))
+            return listing
+    if not details_result.get("success", False):
+        return listing
+    return listing.with_details(details_result["details"])
+
+async def enrich_search_result(location: str, result_dict: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a copy of a search result with each listing's details merged in
+
+    Details are fetched through get_airbnb_listing_details, so they come from and
+    populate the details cache. A listing whose details fail is kept as it is.
+    """
+    semaphore = asyncio.Semaphore(ENRICH_CONCURRENCY)
+    details_params = {key: params[key] for key in ("checkin", "checkout") if params.get(key)}
+
+    start_time = time.perf_counter()
+    results = result_dict["results"]
+    listings = await asyncio.gather(*(
+        enrich_listing(listing, details_params, semaphore) for listing in results.listings
+    ))
+    enriched = sum(1 for listing in listings if listing.enriched)
+    log_event(logger, "airbnb_search enriched", tool="airbnb_listing_details", location=location,
+              duration_ms=round((time.perf_counter() - start_time) * 1000, 1),
+              result_count=enriched, total_results=len(listings))
+    return search_result_dict(results.with_listings(listings), enriched=enriched)
+
+async def search_airbnb_listings(location: Union[str, Sequence[str]], limit: int = 4, enrich: bool = False,
+                                 date_windows: Sequence[Any] = None, sort_by: str = None, refresh: bool = False,
+                                 **kwargs):
+    """Search for Airbnb listings with detailed logging
+
+    With enrich=True the details of the returned listings are fetched concurrently
+    and merged into them (bedrooms, bathrooms, guests, amenities). A list of
+    locations or date_windows runs search_airbnb_fanout and returns one merged,
+    ranked result instead.
+
+    minRating and sort_by are applied locally, and a search that only narrows a
+    recently indexed one is answered from search_index without an MCP call.
+    refresh=True skips both and replaces the cached result (used by the prewarmer).
+    """
+    if not isinstance(location, str) or date_windows:
+        locations = [location] if isinstance(location, str) else list(location)
+        return await search_airbnb_fanout(locations, date_windows, limit, sort_by or "price", enrich, **kwargs)
     
-    mcp_exit_stack = AsyncExitStack()
+    new_request_id()
+    debug = logger.isEnabledFor(logging.DEBUG)
     
-    try:
-        logger.info("Connecting to Airbnb MCP server")
-        
-        # Configure the MCP server connection using NPX
-        server_params = StdioServerParameters(
-            command="npx",
-            args=["-y", "@openbnb/mcp-server-airbnb", "--ignore-robots-txt"],
-            env={}
-        )
+    # Log to both console and file
+    if debug:
+        logger.debug("==== SEARCH REQUEST STARTED ====")
+        logger.debug("Location: %s", location)
+        logger.debug("Additional parameters: %s", kwargs)
         
-        # Connect to the server
-        stdio_transport = await mcp_exit_stack.enter_async_context(stdio_client(server_params))
-        stdio, write = stdio_transport
-        mcp_session = await mcp_exit_stack.enter_async_context(ClientSession(stdio, write))
+        # Direct file logging
+        log_to_file("==== SEARCH REQUEST STARTED ====")
+        log_to_file("Location: %s", location)
+        log_to_file("Additional parameters: %s", kwargs)
+        log_to_file("Current time: %s", datetime.now().isoformat())
+        log_to_file("MCP pool connected: %s", mcp_pool is not None and mcp_pool.is_connected())
+    
+    try:
+        # Filters the airbnb_search tool does not have are applied to the parsed page
+        min_rating = normalize_min_rating(kwargs.pop("minRating", None))
+        sort_by = normalize_sort_by(sort_by)
         
-        # Initialize the session
-        await mcp_session.initialize()
+        # Serve repeat searches from the in-process cache
+        cache_key = canonical_search_key(location, limit, {**kwargs, "minRating": min_rating, "sort_by": sort_by})
+        if not refresh:
+            search_popularity.record(cache_key, {"location": location, "limit": limit, "sort_by": sort_by,
+                                                 "minRating": min_rating, **kwargs})
+        cached_result = None if refresh else search_cache.get(cache_key)
+        if cached_result is not None:
+            log_event(logger, "airbnb_search served from cache", tool="airbnb_search", location=location,
+                      cache="hit", result_count=len(cached_result.get("listings", [])))
+            if enrich:
+                return await enrich_search_result(location, cached_result, kwargs)
+            return cached_result
         
-        # Get available tools to verify connection
-        response = await mcp_session.list_tools()
-        tools = response.tools
+        # Refinements of a recent search are filtered and sorted from its indexed page
+        use_index = SEARCH_INDEX_ENABLED and not refresh
+        indexed_results = search_index.query(location, limit, kwargs, min_rating, sort_by) if use_index else None
+        if indexed_results is not None:
+            result_dict = search_result_dict(indexed_results, source="index")
+            search_cache.set(cache_key, result_dict)
+            log_event(logger, "airbnb_search served from index", tool="airbnb_search", location=location,
+                      cache="index", result_count=len(indexed_results.listings), total_results=indexed_results.total)
+            if enrich:
+                return await enrich_search_result(location, result_dict, kwargs)
+            return result_dict
         
-        logger.info(f"Connected to Airbnb MCP server with tools: {[tool.name for tool in tools]}")
-        return True
+        if not mcp_pool:
+            logger.error("No MCP session available")
+            return {"success": False, "message": "Not connected to Airbnb MCP server"}
         
-    except Exception as e:
-        if mcp_exit_stack:
-            await mcp_exit_stack.aclose()
-        logger.error(f"Error connecting to Airbnb MCP server: {str(e)}")
-        logger.error(traceback.format_exc())  # Print full stack trace
-        return False
-
-async def search_airbnb_listings(location: str, limit: int = 4, **kwargs):
-    """Search for Airbnb listings with detailed logging"""
-    global mcp_session
-    
-    # Log to both console and file
-    logger.debug(f"==== SEARCH REQUEST STARTED ====")
-    logger.debug(f"Location: {location}")
-    logger.debug(f"Additional parameters: {kwargs}")
-    
-    # Direct file logging
-    log_to_file(f"==== SEARCH REQUEST STARTED ====")
-    log_to_file(f"Location: {location}")
-    log_to_file(f"Additional parameters: {kwargs}")
-    log_to_file(f"Current time: {datetime.now().isoformat()}")
-    log_to_file(f"MCP session exists: {mcp_session is not None}")
-    
-    if not mcp_session:
-        logger.error("No MCP session available")
-        return {"success": False, "message": "Not connected to Airbnb MCP server"}
-    
-    try:
         # Prepare parameters
         params = {"location": location, **kwargs}
-        logger.info(f"Searching for listings in {location} with params: {params}")
+        logger.info("Searching for listings in %s with params: %s", location, params)
         
         # Call the airbnb_search tool with detailed logging
-        logger.debug("About to call airbnb_search tool")
-        log_to_file(f"CALLING MCP TOOL: airbnb_search with params: {params}")
+        if debug:
+            logger.debug("About to call airbnb_search tool")
+            log_to_file("CALLING MCP TOOL: airbnb_search with params: %s", params)
         
         try:
-            start_time = datetime.now()
-            log_to_file(f"MCP CALL START TIME: {start_time.isoformat()}")
+            start_time = time.perf_counter()
+            if debug:
+                log_to_file("MCP CALL START TIME: %s", datetime.now().isoformat())
             
-            result = await mcp_session.call_tool("airbnb_search", params)
+            result = await call_mcp_tool("airbnb_search", params)
             
-            end_time = datetime.now()
-            duration = (end_time - start_time).total_seconds()
+            duration = time.perf_counter() - start_time
+            # CPU spent parsing and formatting below, on this thread, with no awaits in between
+            cpu_start = time.thread_time()
             
         except Exception as call_error:
             raise  # Re-raise the exception for normal error handling
@@ -119,79 +657,66 @@ async def search_airbnb_listings(location: str, limit: int = 4, **kwargs):
         if hasattr(result.content, '__iter__') and not isinstance(result.content, str):
             
             for i, item in enumerate(result.content):
-                logger.debug(f"Processing item {i} of type: {type(item)}")
+                if debug:
+                    logger.debug("Processing item %s of type: %s", i, type(item))
                 
                 if hasattr(item, 'text'):
-                    logger.debug(f"Item has text attribute of length: {len(item.text) if hasattr(item.text, '__len__') else 'unknown'}")
-                    logger.debug(f"Text sample: {item.text[:100]}..." if hasattr(item.text, '__len__') else "Cannot display text")
+                    if debug:
+                        logger.debug("Item has text attribute of length: %s", len(item.text) if hasattr(item.text, '__len__') else 'unknown')
+                        logger.debug("Text sample: %s...", item.text[:100] if hasattr(item.text, '__len__') else "Cannot display text")
                     
                     try:
-                        # Parse the JSON response
-                        logger.debug("Attempting to parse JSON")
-                        parsed_content = json.loads(item.text)
-                        logger.debug(f"JSON parsed successfully with keys: {list(parsed_content.keys())}")
-                        
-                        search_results = parsed_content.get("searchResults", [])
-                        logger.debug(f"Found {len(search_results)} search results")
-                        
-                        # Limit results
-                        limited_results = search_results[:limit]
-                        logger.debug(f"Limited to {len(limited_results)} results")
+                        # Parse only the first `limit` results (the whole page when it is filtered or
+                        # sorted locally, or likely to be refined from the index); the rest are just counted
+                        refinable = SEARCH_INDEX_ENABLED and any(kwargs.get(name) for name in ("minPrice", "maxPrice"))
+                        parse_limit = max(limit, SEARCH_INDEX_LISTINGS) if refinable or min_rating or sort_by else limit
+                        with parse_seconds.time(tool="airbnb_search"):
+                            limited_results, total_results = parse_search_results(item.text, parse_limit)
+                        if debug:
+                            logger.debug("Found %s search results, limited to %s", total_results, len(limited_results))
                         
                         # Extract only essential information for each listing
-                        simplified_listings = []
+                        listings = []
                         for j, listing in enumerate(limited_results):
-                            logger.debug(f"Processing listing {j+1} with ID: {listing.get('id', 'N/A')}")
+                            if debug:
+                                logger.debug("Processing listing %s with ID: %s", j+1, listing.get('id', 'N/A'))
                             
                             try:
-                                listing_name = listing.get("demandStayListing", {}).get("description", {}).get("name", {}).get("localizedStringWithTranslationPreference", "Unnamed Listing")
-                                listing_price = listing.get("structuredDisplayPrice", {}).get("primaryLine", {}).get("accessibilityLabel", "Price not available")
-                                
-                                listing_info = {
-                                    "id": listing.get("id", "N/A"),
-                                    "name": listing_name,
-                                    "price": listing_price,
-                                    "rating": listing.get("avgRatingA11yLabel", "Not rated"),
-                                    "url": listing.get("url", "N/A")
-                                }
-                                logger.debug(f"Extracted listing info: {listing_info}")
-                                simplified_listings.append(listing_info)
+                                listings.append(Listing.from_search_result(listing))
                             except Exception as listing_err:
-                                logger.error(f"Error processing listing {j+1}: {str(listing_err)}")
+                                logger.error("Error processing listing %s: %s", j+1, str(listing_err))
                         
-                        # Create a simple formatted output
-                        logger.debug("Creating formatted output")
-                        log_to_file("CREATING FORMATTED OUTPUT FOR SEARCH RESULTS")
-                        formatted_output = f"AIRBNB LISTINGS IN {location.upper()}\n\n"
-                        formatted_output += f"Found {len(search_results)} listings. Showing top {len(simplified_listings)}:\n\n"
+                        # Only a page parsed as deep as the index keeps can stand in for later searches
+                        if SEARCH_INDEX_ENABLED and len(listings) >= min(total_results, SEARCH_INDEX_LISTINGS):
+                            search_index.add(location, kwargs, total_results, listings)
+                        if min_rating is not None:
+                            listings = filter_listings(listings, min_rating=min_rating)
+                            total_results = len(listings)
+                        if sort_by:
+                            listings = rank_listings(listings, sort_by)
                         
-                        for j, listing in enumerate(simplified_listings, 1):
-                            formatted_output += f"{j}. {listing['name']}\n"
-                            formatted_output += f"   Price: {listing['price']}\n"
-                            formatted_output += f"   Rating: {listing['rating']}\n"
-                            formatted_output += f"   ID: {listing['id']}\n"
-                            formatted_output += f"   URL: {listing['url']}\n\n"
+                        # The rendered text is cached along with the listings
+                        result_dict = search_result_dict(SearchResults(location, total_results, listings[:limit]))
                         
-                        logger.debug("Returning successful result")
-                        log_to_file(f"FORMATTED OUTPUT CREATED (length: {len(formatted_output)})")
-                        log_to_file(f"FORMATTED OUTPUT SAMPLE: {formatted_output[:200]}...")
-                        
-                        result_dict = {
-                            "success": True,
-                            "message": "Successfully retrieved listings",
-                            "formatted_output": formatted_output,
-                            "listings": simplified_listings,
-                            "total_listings": len(search_results)
-                        }
+                        if debug:
+                            log_to_file("FORMATTED OUTPUT CREATED (length: %s)", len(result_dict["formatted_output"]))
+                            log_to_file("FORMATTED OUTPUT SAMPLE: %s...", result_dict["formatted_output"][:200])
                         
+                        search_cache.set(cache_key, result_dict)
+                        log_event(logger, "airbnb_search completed", tool="airbnb_search", location=location,
+                                  cache="miss", duration_ms=round(duration * 1000, 1),
+                                  parse_cpu_ms=round((time.thread_time() - cpu_start) * 1000, 3),
+                                  result_count=len(listings), total_results=total_results)
+                        if enrich:
+                            return await enrich_search_result(location, result_dict, kwargs)
                         return result_dict
                         
                     except json.JSONDecodeError as json_err:
-                        logger.error(f"JSON decode error: {str(json_err)}")
-                        logger.error(f"Text that failed to parse: {item.text[:500]}...")
+                        logger.error("JSON decode error: %s", str(json_err))
+                        logger.error("Text that failed to parse: %s...", item.text[:500])
                         return {"success": False, "message": "Error parsing JSON response"}
-                else:
-                    logger.debug(f"Item does not have text attribute")
+                elif debug:
+                    logger.debug("Item does not have text attribute")
             
             return {"success": False, "message": "No valid content found in response"}
         else:
@@ -199,135 +724,314 @@ async def search_airbnb_listings(location: str, limit: int = 4, **kwargs):
     
     except Exception as e:
         error_msg = f"Error searching for Airbnb listings: {str(e)}"
+        log_event(logger, "airbnb_search failed", level=logging.ERROR, tool="airbnb_search",
+                  location=location, error=str(e))
         return {"success": False, "message": error_msg}
 
+DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+def _window_date(value: Any, name: str, number: int) -> Optional[str]:
+    if value is None or value == "":
+        return None
+    try:
+        if not isinstance(value, str) or not DATE_RE.match(value):
+            raise ValueError
+        date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Date window {number}: {name} {value!r} is not a YYYY-MM-DD date") from None
+    return value
+
+def normalize_date_windows(date_windows: Optional[Sequence[Any]]) -> List[Tuple[Optional[str], Optional[str]]]:
+    """(checkin, checkout) pairs from dicts with checkin/checkout keys or two-item lists
+
+    Raises ValueError for anything else, including dates that are not YYYY-MM-DD
+    or a checkout that is not after the checkin.
+    """
+    if date_windows is None:
+        return []
+    if isinstance(date_windows, (str, bytes, dict)) or not isinstance(date_windows, Sequence):
+        raise ValueError("date_windows must be a list of date windows")
+    windows = []
+    for number, window in enumerate(date_windows, 1):
+        if isinstance(window, dict):
+            checkin, checkout = window.get("checkin"), window.get("checkout")
+        elif isinstance(window, (list, tuple)) and len(window) == 2:
+            checkin, checkout = window
+        else:
+            raise ValueError(f'Date window {number} must be {{"checkin": ..., "checkout": ...}} or [checkin, checkout]')
+        checkin = _window_date(checkin, "checkin", number)
+        checkout = _window_date(checkout, "checkout", number)
+        if checkin is None:
+            raise ValueError(f"Date window {number} has no checkin")
+        if checkout is not None and checkout <= checkin:
+            raise ValueError(f"Date window {number}: checkout {checkout} is not after checkin {checkin}")
+        windows.append((checkin, checkout))
+    return windows
+
+async def search_airbnb_fanout(locations: Sequence[str], date_windows: Sequence[Any] = None, limit: int = 4,
+                               sort_by: str = "price", enrich: bool = False, **kwargs):
+    """Search every location and date window concurrently and merge the results into one ranked list
+
+    Each branch is an ordinary cached, coalesced search_airbnb_listings call bounded
+    by FANOUT_CONCURRENCY and FANOUT_BRANCH_TIMEOUT_SECONDS that ranks its whole
+    page by sort_by. The merged result keeps the best `limit` listings across all
+    branches, each labelled with the search it came from; "branches" reports how
+    every branch did.
+    """
+    try:
+        windows = normalize_date_windows(date_windows) or [(kwargs.get("checkin"), kwargs.get("checkout"))]
+        sort_by = normalize_sort_by(sort_by) or "price"
+    except ValueError as err:
+        return {"success": False, "message": str(err)}
+    base_params = {key: value for key, value in kwargs.items() if key not in ("checkin", "checkout")}
+    branches = [(location, checkin, checkout) for location in locations for checkin, checkout in windows]
+    if not branches:
+        return {"success": False, "message": "No location to search"}
+    if len(branches) > FANOUT_MAX_BRANCHES:
+        return {"success": False, "message": f"Too many searches at once ({len(branches)}, at most {FANOUT_MAX_BRANCHES})"}
+    
+    semaphore = asyncio.Semaphore(FANOUT_CONCURRENCY)
+    
+    async def run_branch(location: str, checkin: Optional[str], checkout: Optional[str]):
+        params = dict(base_params)
+        if checkin: params["checkin"] = checkin
+        if checkout: params["checkout"] = checkout
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(search_airbnb_listings(location, limit, sort_by=sort_by, **params),
+                                              FANOUT_BRANCH_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                return {"success": False, "message": f"timed out after {FANOUT_BRANCH_TIMEOUT_SECONDS:g}s"}
+            except Exception as err:
+                # One failing branch is reported, not allowed to discard the others
+                return {"success": False, "message": f"Error searching for Airbnb listings: {err}"}
+    
+    start_time = time.perf_counter()
+    branch_results = await asyncio.gather(*(run_branch(*branch) for branch in branches))
+    
+    listings, seen, total, report = [], set(), 0, []
+    for (location, checkin, checkout), branch_result in zip(branches, branch_results):
+        label = location if not (checkin or checkout) else f"{location}, {checkin or '?'} to {checkout or '?'}"
+        success = branch_result.get("success", False)
+        report.append({"search": label, "success": success, "message": branch_result.get("message", "")})
+        if not success:
+            continue
+        results = branch_result["results"]
+        total += results.total
+        for listing in results.listings:
+            # The same listing can turn up for several date windows; each stay is kept
+            key = (listing.id, checkin, checkout)
+            if key not in seen:
+                seen.add(key)
+                listings.append(listing.replace(search=label))
+    
+    failed = [branch for branch in report if not branch["success"]]
+    log_event(logger, "airbnb_search fan-out completed", tool="airbnb_search", branches=len(branches),
+              failed=len(failed), duration_ms=round((time.perf_counter() - start_time) * 1000, 1),
+              result_count=len(listings))
+    if len(failed) == len(report):
+        return {"success": False, "message": "; ".join(f"{b['search']}: {b['message']}" for b in failed),
+                "branches": report}
+    
+    title = locations[0] if len(locations) == 1 else f"{', '.join(locations[:-1])} or {locations[-1]}"
+    message = "Successfully retrieved listings"
+    if failed:
+        message += f" ({len(failed)} of {len(report)} searches failed)"
+    result_dict = search_result_dict(SearchResults(title, total, rank_listings(listings, sort_by)[:limit]),
+                                     message=message, branches=report)
+    if enrich:
+        return {**await enrich_search_result(title, result_dict, {}), "message": message, "branches": report}
+    return result_dict
+
+class SearchFailed(Exception):
+    """Raised by stream_search_listings with the message search_airbnb_listings would return"""
+
+async def stream_search_listings(
+    location: str, limit: int = 4, enrich: bool = False, **kwargs
+) -> AsyncIterator[Tuple[SearchResults, Tuple[Listing, ...]]]:
+    """Yield a search's listings in order as soon as they are ready
+
+    Each item is (results, chunk): the plain SearchResults of the search, for its
+    header and listing count, and the next run of consecutive listings that are
+    ready. Without enrichment that is every listing at once; with enrichment each
+    listing is yielded when its details (and those of the listings before it)
+    have arrived, so the first one does not wait for the slowest lookup.
+    """
+    result_dict = await search_airbnb_listings(location, limit, **kwargs)
+    if not result_dict.get("success", False):
+        raise SearchFailed(result_dict.get("message", "Unknown error"))
+    results = result_dict["results"]
+    if not enrich or not results.listings:
+        yield results, results.listings
+        return
+
+    semaphore = asyncio.Semaphore(ENRICH_CONCURRENCY)
+    details_params = {key: kwargs[key] for key in ("checkin", "checkout") if kwargs.get(key)}
+    tasks = [asyncio.create_task(enrich_listing(listing, details_params, semaphore)) for listing in results.listings]
+    try:
+        index = 0
+        while index < len(tasks):
+            chunk = [await tasks[index]]
+            index += 1
+            # Listings whose details are already in go out with this one
+            while index < len(tasks) and tasks[index].done():
+                chunk.append(tasks[index].result())
+                index += 1
+            yield results, tuple(chunk)
+    finally:
+        # The consumer stopped early (or was cancelled): drop the remaining lookups
+        for task in tasks:
+            task.cancel()
+
 async def get_airbnb_listing_details(listing_id: str, **kwargs):
-    """Get details for a specific Airbnb listing with detailed logging"""
-    global mcp_session
+    """Get details for a specific Airbnb listing, serving cached details while refreshing stale ones"""
+    cache_key = details_cache_key(listing_id, kwargs)
+    try:
+        cached = details_cache.get(cache_key)
+    except Exception as e:
+        logger.error("Error reading details cache: %s", str(e))
+        cached = None
+
+    if cached is not None:
+        result_dict, is_fresh = cached
+        # Entries are stored as JSON; the text rendered when they were fetched is reused
+        result_dict["details"] = ListingDetails.from_dict(result_dict["details"])
+        if not is_fresh:
+            _schedule_details_refresh(cache_key, listing_id, kwargs)
+        logger.info("Details cache %s for listing %s", 'hit' if is_fresh else 'stale hit', listing_id)
+        return result_dict
+
+    result_dict = await fetch_airbnb_listing_details(listing_id, **kwargs)
+    _store_listing_details(cache_key, result_dict)
+    return result_dict
+
+def _store_listing_details(cache_key: str, result_dict: Dict[str, Any]):
+    if not result_dict.get("success", False):
+        return
+    try:
+        details_cache.set(cache_key, {**result_dict, "details": result_dict["details"].to_dict()})
+    except Exception as e:
+        logger.error("Error writing details cache: %s", str(e))
+
+def _schedule_details_refresh(cache_key: str, listing_id: str, params: Dict[str, Any]):
+    """Refresh a stale details entry in the background, at most once per key at a time"""
+    if cache_key in details_refresh_tasks:
+        return
+
+    async def refresh():
+        try:
+            _store_listing_details(cache_key, await fetch_airbnb_listing_details(listing_id, **params))
+        finally:
+            details_refresh_tasks.pop(cache_key, None)
+
+    details_refresh_tasks[cache_key] = asyncio.create_task(refresh())
+
+async def fetch_airbnb_listing_details(listing_id: str, **kwargs):
+    """Fetch details for a specific Airbnb listing from the MCP server with detailed logging"""
+    new_request_id()
+    debug = logger.isEnabledFor(logging.DEBUG)
     
-    logger.debug(f"==== DETAILS REQUEST STARTED ====")
-    logger.debug(f"Listing ID: {listing_id}")
-    logger.debug(f"Additional parameters: {kwargs}")
+    if debug:
+        logger.debug("==== DETAILS REQUEST STARTED ====")
+        logger.debug("Listing ID: %s", listing_id)
+        logger.debug("Additional parameters: %s", kwargs)
     
-    if not mcp_session:
+    if not mcp_pool:
         logger.error("No MCP session available")
         return {"success": False, "message": "Not connected to Airbnb MCP server"}
     
     try:
         # Prepare parameters
         params = {"id": listing_id, **kwargs}
-        logger.info(f"Getting details for listing {listing_id} with params: {params}")
+        logger.info("Getting details for listing %s with params: %s", listing_id, params)
         
         # Call the airbnb_listing_details tool
-        logger.debug("About to call airbnb_listing_details tool")
-        result = await mcp_session.call_tool("airbnb_listing_details", params)
-        logger.debug(f"Tool call completed - Result type: {type(result)}")
+        start_time = time.perf_counter()
+        result = await call_mcp_tool("airbnb_listing_details", params)
+        duration = time.perf_counter() - start_time
+        cpu_start = time.thread_time()
         
         # Debug the content structure
-        logger.debug(f"Content type: {type(result.content)}")
-        if hasattr(result.content, '__iter__') and not isinstance(result.content, str):
-            logger.debug(f"Content is iterable with {len(result.content)} items")
+        if debug:
+            logger.debug("Tool call completed - Result type: %s", type(result))
+            logger.debug("Content type: %s", type(result.content))
+            if hasattr(result.content, '__iter__') and not isinstance(result.content, str):
+                logger.debug("Content is iterable with %s items", len(result.content))
         
         # Extract text content from the response
         if hasattr(result.content, '__iter__') and not isinstance(result.content, str):
-            logger.debug("Processing iterable content")
-            
             for i, item in enumerate(result.content):
-                logger.debug(f"Processing item {i} of type: {type(item)}")
+                if debug:
+                    logger.debug("Processing item %s of type: %s", i, type(item))
                 
                 if hasattr(item, 'text'):
-                    logger.debug(f"Item has text attribute of length: {len(item.text) if hasattr(item.text, '__len__') else 'unknown'}")
-                    logger.debug(f"Text sample: {item.text[:100]}..." if hasattr(item.text, '__len__') else "Cannot display text")
+                    if debug:
+                        logger.debug("Item has text attribute of length: %s", len(item.text) if hasattr(item.text, '__len__') else 'unknown')
+                        logger.debug("Text sample: %s...", item.text[:100] if hasattr(item.text, '__len__') else "Cannot display text")
                     
                     try:
                         # Parse the JSON response
-                        logger.debug("Attempting to parse JSON")
-                        details = json.loads(item.text)
-                        logger.debug(f"JSON parsed successfully with keys: {list(details.keys())}")
+                        with parse_seconds.time(tool="airbnb_listing_details"):
+                            details = json.loads(item.text)
+                        if debug:
+                            logger.debug("JSON parsed successfully with keys: %s", list(details.keys()))
                         
                         # Extract only essential information
-                        logger.debug("Extracting essential details")
-                        simplified_details = {
-                            "name": details.get("name", "N/A"),
-                            "description": details.get("description", "No description available"),
-                            "bedrooms": details.get("bedrooms", "N/A"),
-                            "bathrooms": details.get("bathrooms", "N/A"),
-                            "guests": details.get("maxGuests", "N/A"),
-                            "price": details.get("price", {}).get("rate", "N/A")
-                        }
-                        
-                        # Extract amenities
-                        amenities = details.get("amenities", [])
-                        logger.debug(f"Found {len(amenities)} amenities")
-                        
-                        amenity_names = []
-                        for j, amenity in enumerate(amenities[:5]):
-                            amenity_name = amenity.get("name", "Unknown Amenity")
-                            logger.debug(f"Amenity {j+1}: {amenity_name}")
-                            amenity_names.append(amenity_name)
+                        simplified_details = ListingDetails.from_payload(details)
+                        if debug:
+                            logger.debug("Keeping amenities %s", simplified_details.amenities)
                         
-                        simplified_details["amenities"] = amenity_names
+                        with format_seconds.time(kind="details"):
+                            formatted_output = simplified_details.render()
                         
-                        # Create a simple formatted output
-                        logger.debug("Creating formatted output")
-                        formatted_output = f"DETAILS FOR LISTING: {simplified_details['name']}\n\n"
-                        formatted_output += f"Bedrooms: {simplified_details['bedrooms']}\n"
-                        formatted_output += f"Bathrooms: {simplified_details['bathrooms']}\n"
-                        formatted_output += f"Max Guests: {simplified_details['guests']}\n"
-                        formatted_output += f"Price: {simplified_details['price']}\n\n"
-                        
-                        if simplified_details['amenities']:
-                            formatted_output += "Top Amenities:\n"
-                            for j, amenity in enumerate(simplified_details['amenities'], 1):
-                                formatted_output += f"- {amenity}\n"
-                        
-                        # Add a short description
-                        desc = simplified_details['description']
-                        short_desc = desc[:200] + "..." if len(desc) > 200 else desc
-                        formatted_output += f"\nDescription: {short_desc}\n"
-                        
-                        logger.debug("Returning successful result")
                         result_dict = {
                             "success": True,
                             "message": "Successfully retrieved listing details",
                             "formatted_output": formatted_output,
                             "details": simplified_details
                         }
-                        logger.debug("==== DETAILS REQUEST COMPLETED SUCCESSFULLY ====")
+                        log_event(logger, "airbnb_listing_details completed", tool="airbnb_listing_details",
+                                  listing_id=listing_id, duration_ms=round(duration * 1000, 1),
+                                  parse_cpu_ms=round((time.thread_time() - cpu_start) * 1000, 3), result_count=1)
                         return result_dict
                         
                     except json.JSONDecodeError as json_err:
-                        logger.error(f"JSON decode error: {str(json_err)}")
-                        logger.error(f"Text that failed to parse: {item.text[:500]}...")
+                        logger.error("JSON decode error: %s", str(json_err))
+                        logger.error("Text that failed to parse: %s...", item.text[:500])
                         return {"success": False, "message": "Error parsing JSON response"}
-                else:
-                    logger.debug(f"Item does not have text attribute")
+                elif debug:
+                    logger.debug("Item does not have text attribute")
             
             logger.error("No valid content found in response")
             return {"success": False, "message": "No valid content found in response"}
         else:
-            logger.error(f"Unexpected response format: {type(result.content)}")
+            logger.error("Unexpected response format: %s", type(result.content))
             if isinstance(result.content, str):
-                logger.error(f"Content (string): {result.content[:500]}...")
+                logger.error("Content (string): %s...", result.content[:500])
             return {"success": False, "message": f"Unexpected response format: {type(result.content)}"}
     
     except Exception as e:
         error_msg = f"Error getting Airbnb listing details: {str(e)}"
-        logger.error(error_msg)
-        logger.error(traceback.format_exc())  # Print full stack trace
+        log_event(logger, "airbnb_listing_details failed", level=logging.ERROR, tool="airbnb_listing_details",
+                  listing_id=listing_id, error=str(e))
+        if debug:
+            logger.debug(traceback.format_exc())  # Print full stack trace
         return {"success": False, "message": error_msg}
 
 async def cleanup_mcp_connection():
-    """Clean up MCP connection"""
-    global mcp_session, mcp_exit_stack
+    """Clean up MCP connections"""
+    global mcp_pool
+    
+    # Stop background refreshes before their sessions go away
+    for task in list(details_refresh_tasks.values()):
+        task.cancel()
     
-    if mcp_exit_stack:
+    if mcp_pool:
         try:
-            await mcp_exit_stack.aclose()
-            logger.info("MCP connection closed")
+            await mcp_pool.close()
+            logger.info("MCP connections closed")
         except Exception as e:
-            logger.error(f"Error closing MCP connection: {str(e)}")
+            logger.error("Error closing MCP connections: %s", str(e))
             logger.error(traceback.format_exc())  # Print full stack trace
     
-    mcp_session = None
-    mcp_exit_stack = None
\ No newline at end of file
+    mcp_pool = None
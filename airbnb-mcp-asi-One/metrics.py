@@ -0,0 +1,214 @@
+# metrics.py
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+import asyncio
+import bisect
+import logging
+import os
+import time
+
+# In-process metrics rendered in the Prometheus text format. Stages record into
+# histograms and counters; state that other modules already count (cache hits,
+# pool in-flight, ...) is read through callbacks when the endpoint is scraped.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))  # 0 disables the endpoint
+
+# Seconds; covers cache hits (milliseconds) up to slow scrapes and LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0, 60.0)
+
+logger = logging.getLogger("metrics")
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """Cumulative-bucket histogram of observed values (seconds for latencies)"""
+
+    def __init__(self, name: str, documentation: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, List[float]] = {}  # key -> bucket counts + [sum, count]
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * (len(self.buckets) + 2)
+        # Counts are stored per bucket and accumulated when rendered
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(_label_key(labels))
+        return series[-1] if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+class CallbackMetric:
+    """Counter or gauge whose samples are read from a callback at scrape time
+
+    The callback returns a list of (labels dict, value) pairs.
+    """
+
+    def __init__(self, name: str, documentation: str, metric_type: str,
+                 callback: Callable[[], List[Tuple[Dict[str, Any], float]]]):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for labels, value in self.callback():
+            lines.append(f"{self.name}{_format_labels(_label_key(labels))} {_format_value(value)}")
+        return lines
+
+class MetricsRegistry:
+    """Named collection of metrics that renders them all for the endpoint"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            # Re-importing a module must not reset or duplicate its metrics
+            if type(existing) is not type(metric):
+                raise ValueError(f"Metric {metric.name} is already registered as {type(existing).__name__}")
+            if isinstance(metric, CallbackMetric):
+                existing.callback = metric.callback
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._register(Counter(name, documentation))
+
+    def histogram(self, name: str, documentation: str, buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, buckets))
+
+    def callback(self, name: str, documentation: str, metric_type: str,
+                 callback: Callable[[], List[Tuple[Dict[str, Any], float]]]) -> CallbackMetric:
+        return self._register(CallbackMetric(name, documentation, metric_type, callback))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger.error("Error rendering metric %s: %s", metric.name, str(e))
+        return "\n".join(lines) + "\n"
+
+# Shared registry for the whole agent
+registry = MetricsRegistry()
+
+# Per-stage latency of a chat turn
+intent_seconds = registry.histogram(
+    "airbnb_intent_seconds", "Time to turn a chat message into an AirbnbRequest, by source (local, cached, remote)")
+mcp_call_seconds = registry.histogram(
+    "airbnb_mcp_call_seconds", "Duration of MCP tool calls, by tool and outcome")
+parse_seconds = registry.histogram(
+    "airbnb_parse_seconds", "Time spent decoding MCP tool payloads, by tool")
+format_seconds = registry.histogram(
+    "airbnb_format_seconds", "Time spent building the text shown to the user, by kind")
+send_seconds = registry.histogram(
+    "airbnb_send_seconds", "Duration of ctx.send calls, by message type")
+chat_turn_seconds = registry.histogram(
+    "airbnb_chat_turn_seconds", "Time from receiving a chat message to sending its answer, by intent source")
+
+# Events
+ai_timeouts_total = registry.counter(
+    "airbnb_ai_timeouts_total", "Chat requests whose structured-output reply missed the deadline")
+fallbacks_total = registry.counter(
+    "airbnb_fallbacks_total", "Direct searches run without a parsed intent, by reason")
+
+async def _handle_metrics_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        # Drain the headers; the request body (if any) is ignored
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+            pass
+
+        parts = request_line.decode("latin-1").split()
+        path = parts[1].split("?", 1)[0] if len(parts) > 1 else ""
+        if len(parts) > 1 and parts[0] == "GET" and path == "/metrics":
+            status, body = "200 OK", registry.render().encode()
+        else:
+            status, body = "404 Not Found", b"Not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def start_metrics_server(host: str = None, port: int = None):
+    """Serve GET /metrics over plain HTTP; returns the asyncio server, or None when disabled"""
+    host = METRICS_HOST if host is None else host
+    port = METRICS_PORT if port is None else port
+    if not port:
+        return None
+    server = await asyncio.start_server(_handle_metrics_request, host, port)
+    logger.info("Serving metrics on http://%s:%s/metrics", host, port)
+    return server
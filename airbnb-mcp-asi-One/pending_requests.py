@@ -0,0 +1,175 @@
+# pending_requests.py
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+logger = logging.getLogger("pending_requests")
+
+class PendingRequest:
+    """A chat request waiting for the structured-output agent to parse it"""
+
+    __slots__ = ("session_id", "msg_id", "sender", "query_text", "created_at", "deadline", "parsed_query",
+                 "speculation")
+
+    def __init__(self, session_id: str, msg_id: str, sender: str, query_text: str, timeout_seconds: float):
+        self.session_id = session_id
+        self.msg_id = msg_id
+        self.sender = sender
+        self.query_text = query_text
+        self.created_at = time.time()
+        self.deadline = self.created_at + timeout_seconds
+        self.parsed_query: Optional[Dict[str, Any]] = None
+        # (search key, task) for a search started before the AI agent answered
+        self.speculation: Optional[Tuple[Hashable, asyncio.Task]] = None
+
+    def elapsed(self) -> float:
+        return time.time() - self.created_at
+
+    def expired(self, now: float = None) -> bool:
+        return (now or time.time()) >= self.deadline
+
+    def cancel_speculation(self) -> bool:
+        """Cancel the speculative search unless it already finished"""
+        if self.speculation is None:
+            return False
+        task = self.speculation[1]
+        self.speculation = None
+        if task.done():
+            return False
+        task.cancel()
+        return True
+
+class PendingRequestRegistry:
+    """In-memory table of pending chat requests keyed by session id
+
+    Each session has at most one pending request; a new message in the same
+    session replaces the previous one. Resolving or expiring a request removes it,
+    so a late structured-output reply or a stale timeout for an older message
+    cannot act on the wrong request.
+    """
+
+    def __init__(self):
+        self._requests: Dict[str, PendingRequest] = {}
+        self.resolved = 0
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self._requests)
+
+    def register(self, session_id: str, msg_id: str, sender: str, query_text: str,
+                 timeout_seconds: float) -> PendingRequest:
+        request = PendingRequest(session_id, msg_id, sender, query_text, timeout_seconds)
+        replaced = self._requests.get(session_id)
+        if replaced is not None:
+            replaced.cancel_speculation()
+        self._requests[session_id] = request
+        return request
+
+    def get(self, session_id: str) -> Optional[PendingRequest]:
+        return self._requests.get(session_id)
+
+    def resolve(self, session_id: str) -> Optional[PendingRequest]:
+        """Remove and return the pending request for a session once its reply arrived"""
+        request = self._requests.pop(session_id, None)
+        if request is not None:
+            self.resolved += 1
+        return request
+
+    def expire(self, session_id: str, msg_id: str) -> Optional[PendingRequest]:
+        """Remove and return the session's request if it is still the one for msg_id"""
+        request = self._requests.get(session_id)
+        if request is None or request.msg_id != msg_id:
+            return None
+        del self._requests[session_id]
+        self.expired += 1
+        return request
+
+class DeadlineScheduler:
+    """Single-task timer that runs a callback for keys whose deadline has passed
+
+    Deadlines live in a heap ordered by expiry time, so scheduling is O(log n) and
+    cancelling is O(1) (cancelled entries are dropped lazily when they reach the top).
+    One background task sleeps until the earliest deadline instead of one sleeping
+    task per request. Each key has at most one deadline; rescheduling replaces it.
+    """
+
+    def __init__(self, callback: Callable[[Hashable, Any], Awaitable[None]]):
+        self._callback = callback
+        self._heap = []
+        self._entries = {}  # key -> [deadline, seq, key, payload, active]
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._task = None
+        self._running = set()
+        self.fired = 0
+
+    def __len__(self) -> int:
+        """Number of pending (not yet fired or cancelled) deadlines"""
+        return len(self._entries)
+
+    def schedule(self, key: Hashable, deadline: float, payload: Any = None):
+        """Run the callback for key at the given time.time() deadline unless cancelled first"""
+        self.cancel(key)
+        entry = [deadline, next(self._seq), key, payload, True]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        elif self._heap[0] is entry:
+            # The new deadline is the earliest one, so the timer has to wake up sooner
+            self._wakeup.set()
+
+    def cancel(self, key: Hashable) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        entry[4] = False
+        return True
+
+    async def _run(self):
+        while True:
+            while self._heap and not self._heap[0][4]:
+                heapq.heappop(self._heap)
+
+            if not self._heap:
+                timeout = None
+            else:
+                timeout = self._heap[0][0] - time.time()
+
+            if timeout is None or timeout > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            entry = heapq.heappop(self._heap)
+            entry[4] = False
+            key, payload = entry[2], entry[3]
+            del self._entries[key]
+            self.fired += 1
+
+            # Run callbacks as their own tasks so a slow one cannot delay later deadlines
+            task = asyncio.create_task(self._callback(key, payload))
+            self._running.add(task)
+            task.add_done_callback(self._callback_done)
+
+    def _callback_done(self, task: asyncio.Task):
+        self._running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Deadline callback failed: %s", task.exception())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
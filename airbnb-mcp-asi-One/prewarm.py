@@ -0,0 +1,114 @@
+# prewarm.py
+from datetime import date
+from typing import Any, Dict, List, Tuple
+import asyncio
+import logging
+import os
+
+import mcp_client
+from admission import admission
+from cache import canonical_search_key
+from metrics import registry
+
+# A background job that keeps the most requested searches in the search cache,
+# so popular destinations do not pay the full scrape latency when their cache
+# entry runs out. Each run refreshes the PREWARM_TOP_K most requested searches
+# whose entry is missing or expires within PREWARM_REFRESH_AHEAD_SECONDS, one at
+# a time. A run stops as soon as live traffic needs the MCP servers: more than
+# PREWARM_MAX_POOL_LOAD of the pool's call slots busy, or less than
+# PREWARM_MIN_HEADROOM of the admission bucket left.
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "true").lower() == "true"
+PREWARM_INTERVAL_SECONDS = float(os.getenv("PREWARM_INTERVAL_SECONDS", "60"))
+PREWARM_TOP_K = int(os.getenv("PREWARM_TOP_K", "8"))
+PREWARM_MIN_SCORE = float(os.getenv("PREWARM_MIN_SCORE", "2"))  # decayed requests before a search is kept warm
+PREWARM_REFRESH_AHEAD_SECONDS = float(os.getenv("PREWARM_REFRESH_AHEAD_SECONDS", str(2 * PREWARM_INTERVAL_SECONDS)))
+PREWARM_MAX_REFRESHES = int(os.getenv("PREWARM_MAX_REFRESHES", "2"))  # per run
+PREWARM_MAX_POOL_LOAD = float(os.getenv("PREWARM_MAX_POOL_LOAD", "0.25"))
+PREWARM_MIN_HEADROOM = float(os.getenv("PREWARM_MIN_HEADROOM", "0.5"))
+# Searches kept warm whatever their popularity, as "location:limit" (e.g. "Paris:4"). Each one
+# costs a scrape every cache TTL even without traffic, so none by default
+PREWARM_SEARCHES = [entry.strip() for entry in os.getenv("PREWARM_SEARCHES", "").split(",") if entry.strip()]
+
+logger = logging.getLogger("prewarm")
+
+refreshes_total = registry.counter("airbnb_prewarm_refreshes_total", "Search cache refreshes by the prewarmer, by result")
+skipped_runs_total = registry.counter("airbnb_prewarm_skipped_total", "Prewarm runs stopped early, by reason")
+
+def _seed_searches() -> List[Dict[str, Any]]:
+    searches = []
+    for entry in PREWARM_SEARCHES:
+        location, _, limit = entry.rpartition(":")
+        if not location or not limit.isdigit():
+            location, limit = entry, "4"
+        searches.append({"location": location, "limit": int(limit)})
+    return searches
+
+class CachePrewarmer:
+    """Refreshes popular search cache entries while the MCP servers have room to spare"""
+
+    def __init__(self):
+        self.last_run: Dict[str, Any] = {}
+        self._lock = asyncio.Lock()
+
+    def candidates(self) -> List[Tuple[Any, Dict[str, Any]]]:
+        """(cache key, search arguments) worth refreshing now, configured searches first"""
+        today = date.today().isoformat()
+        searches = [(canonical_search_key(args["location"], args["limit"], {}), args) for args in _seed_searches()]
+        searches += [(key, args) for key, args, _ in mcp_client.search_popularity.top(PREWARM_TOP_K, PREWARM_MIN_SCORE)]
+
+        candidates, seen = [], set()
+        for key, args in searches:
+            if key in seen:
+                continue
+            seen.add(key)
+            # Searches for dates that have started cannot be booked any more
+            if args.get("checkin") and str(args["checkin"]) < today:
+                continue
+            expires_in = mcp_client.search_cache.expires_in(key)
+            if expires_in is None or expires_in <= PREWARM_REFRESH_AHEAD_SECONDS:
+                candidates.append((key, args))
+        return candidates
+
+    @staticmethod
+    def busy_reason():
+        """Why live traffic needs the MCP servers right now, or None if they have room"""
+        pool = mcp_client.mcp_pool
+        if pool is None or not pool.is_connected():
+            return "disconnected"
+        if pool.in_flight() > PREWARM_MAX_POOL_LOAD * pool.capacity():
+            return "pool_busy"
+        if admission.headroom() < PREWARM_MIN_HEADROOM:
+            return "admission"
+        return None
+
+    async def run(self) -> Dict[str, Any]:
+        """Refresh up to PREWARM_MAX_REFRESHES candidates, stopping if live traffic picks up"""
+        if not PREWARM_ENABLED or self._lock.locked():
+            return self.last_run
+        async with self._lock:
+            refreshed, failed, skipped = 0, 0, None
+            candidates = self.candidates()
+            for key, args in candidates[:PREWARM_MAX_REFRESHES]:
+                skipped = self.busy_reason()
+                if skipped:
+                    skipped_runs_total.inc(reason=skipped)
+                    break
+                try:
+                    result = await mcp_client.search_airbnb_listings(**args, refresh=True)
+                except Exception as err:
+                    result = {"success": False, "message": str(err)}
+                if result.get("success", False):
+                    refreshed += 1
+                    refreshes_total.inc(result="refreshed")
+                else:
+                    failed += 1
+                    refreshes_total.inc(result="failed")
+                    logger.warning("Prewarm of %s failed: %s", args["location"], result.get("message"))
+
+            self.last_run = {"candidates": len(candidates), "refreshed": refreshed, "failed": failed, "skipped": skipped}
+            if refreshed or failed:
+                logger.info("Prewarmed %s searches (%s failed, %s candidates)", refreshed, failed, len(candidates))
+            return self.last_run
+
+# Run on the agent's prewarm interval and once the MCP servers are up
+cache_prewarmer = CachePrewarmer()
@@ -0,0 +1,135 @@
+# search_index.py
+from typing import Any, Dict, Optional, Sequence, Tuple
+import os
+
+from cache import TTLCache
+from listings import Listing, SearchResults, rank_listings
+
+# Listings from recent airbnb_search pages, indexed by location and dates, so a
+# refinement of a search the user just ran ("under $150", "rated 4.8+", "sort by
+# rating") is answered by filtering and sorting locally instead of scraping again.
+# Only filters that can be decided from the indexed page are answered: a price
+# range inside the original one, a minimum rating, and more guests when the
+# listings' capacity is known. Anything else goes to the MCP server. Searches
+# that already filter or sort parse up to SEARCH_INDEX_LISTINGS of their page,
+# since those are the ones users go on refining, and only such fully parsed
+# pages are indexed; plain searches keep parsing just `limit` results.
+SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX_ENABLED", "true").lower() == "true"
+SEARCH_INDEX_LISTINGS = int(os.getenv("SEARCH_INDEX_LISTINGS", "50"))  # listings parsed and kept per filtered search
+SEARCH_INDEX_MAX_ENTRIES = int(os.getenv("SEARCH_INDEX_MAX_ENTRIES", "256"))
+SEARCH_INDEX_TTL_SECONDS = float(os.getenv("SEARCH_INDEX_TTL_SECONDS", os.getenv("SEARCH_CACHE_TTL_SECONDS", "300")))
+
+# Parameters that must match the indexed search exactly
+EXACT_PARAMS = ("infants", "pets")
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+def _guests(params: Dict[str, Any]) -> int:
+    return int(_number(params.get("adults", 2)) or 0) + int(_number(params.get("children")) or 0)
+
+def filter_listings(listings: Sequence[Listing], min_price: float = None, max_price: float = None,
+                    min_rating: float = None, guests: int = None) -> list:
+    """Listings whose parsed price, rating and capacity pass the filters; unknown values fail them"""
+    matches = []
+    for listing in listings:
+        if min_price is not None and (listing.price_value is None or listing.price_value < min_price):
+            continue
+        if max_price is not None and (listing.price_value is None or listing.price_value > max_price):
+            continue
+        if min_rating is not None and (listing.rating_value is None or listing.rating_value < min_rating):
+            continue
+        if guests is not None and (listing.max_guests is None or listing.max_guests < guests):
+            continue
+        matches.append(listing)
+    return matches
+
+class IndexEntry:
+    """One indexed search page and the parameters it was fetched with"""
+
+    __slots__ = ("params", "total", "listings")
+
+    def __init__(self, params: Dict[str, Any], total: int, listings: Sequence[Listing]):
+        self.params = params
+        self.total = total
+        self.listings = tuple(listings)
+
+class SearchIndex:
+    """Recent search pages by (location, checkin, checkout), answering narrower searches locally"""
+
+    def __init__(self, max_entries: int = SEARCH_INDEX_MAX_ENTRIES, ttl_seconds: float = SEARCH_INDEX_TTL_SECONDS):
+        self._entries = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.answered = 0
+
+    @staticmethod
+    def _key(location: str, params: Dict[str, Any]) -> Tuple[str, Any, Any]:
+        return " ".join(location.split()).casefold(), params.get("checkin"), params.get("checkout")
+
+    def add(self, location: str, params: Dict[str, Any], total: int, listings: Sequence[Listing]):
+        """Index the page a search returned; params are the airbnb_search arguments it used"""
+        key = self._key(location, params)
+        existing = self._entries.get(key)
+        # Keep the broadest page for the dates: one without price filters answers more refinements
+        if existing is not None and self._covers(existing.params, params) and not self._covers(params, existing.params):
+            return
+        self._entries.set(key, IndexEntry(dict(params), total, listings[:SEARCH_INDEX_LISTINGS]))
+
+    @staticmethod
+    def _covers(indexed: Dict[str, Any], wanted: Dict[str, Any]) -> bool:
+        """Whether every listing wanted could be in the indexed page (price range and party inside it)"""
+        if any(_number(indexed.get(name)) != _number(wanted.get(name)) for name in EXACT_PARAMS):
+            return False
+        indexed_min, wanted_min = _number(indexed.get("minPrice")), _number(wanted.get("minPrice"))
+        indexed_max, wanted_max = _number(indexed.get("maxPrice")), _number(wanted.get("maxPrice"))
+        if indexed_min is not None and (wanted_min is None or wanted_min < indexed_min):
+            return False
+        if indexed_max is not None and (wanted_max is None or wanted_max > indexed_max):
+            return False
+        # Airbnb only returns listings that fit the party; a smaller party may see listings the page lacks
+        return _guests(wanted) >= _guests(indexed)
+
+    def query(self, location: str, limit: int, params: Dict[str, Any], min_rating: float = None,
+              sort_by: str = None) -> Optional[SearchResults]:
+        """Answer a search from an indexed page, or None if it needs the MCP server
+
+        At least `limit` listings must match (or the whole page), otherwise the
+        page is too thin to stand in for a real search with these filters,
+        unless the page holds every result of the indexed search.
+        """
+        entry = self._entries.get(self._key(location, params))
+        if entry is None or not self._covers(entry.params, params):
+            return None
+
+        guests = _guests(params)
+        more_guests = guests > _guests(entry.params)
+        # A larger party can only be checked against listings whose capacity is known
+        if more_guests and any(listing.max_guests is None for listing in entry.listings):
+            return None
+        matches = filter_listings(
+            entry.listings,
+            min_price=_number(params.get("minPrice")),
+            max_price=_number(params.get("maxPrice")),
+            min_rating=min_rating,
+            guests=guests if more_guests else None,
+        )
+        complete = entry.total <= len(entry.listings)
+        if not complete and len(matches) < min(limit, len(entry.listings)):
+            return None
+        if sort_by:
+            matches = rank_listings(matches, sort_by)
+        self.answered += 1
+        # The page's total no longer applies once it is filtered
+        filtered = len(matches) != len(entry.listings)
+        return SearchResults(location, len(matches) if filtered else entry.total, matches[:limit])
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._entries.stats(), "answered": self.answered}
+
+# Shared by every search
+search_index = SearchIndex()
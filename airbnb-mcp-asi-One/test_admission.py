@@ -0,0 +1,91 @@
+# test_admission.py
+import pytest
+
+import admission
+import mcp_client
+from admission import AdmissionController, TokenBucket
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class FakePool:
+    def __init__(self, slots: int = 1, in_flight: int = 0, latency: float = 1.0):
+        self.slots = slots
+        self.calls = in_flight
+        self.latency_estimate = latency
+
+    def capacity(self) -> int:
+        return self.slots
+
+    def in_flight(self) -> int:
+        return self.calls
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, "monotonic", clock)
+    return clock
+
+@pytest.fixture
+def pool(monkeypatch, clock):
+    pool = FakePool()
+    monkeypatch.setattr(mcp_client, "mcp_pool", pool)
+    monkeypatch.setattr(admission, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(admission, "ADMISSION_SENDER_BURST", 2)
+    monkeypatch.setattr(admission, "ADMISSION_SENDER_RATE_PER_MINUTE", 6)
+    monkeypatch.setattr(admission, "ADMISSION_EXEMPT_SENDERS", {"relay"})
+    return pool
+
+def test_bucket_refills_at_its_rate_up_to_capacity(clock):
+    bucket = TokenBucket(rate=2.0, capacity=4.0)
+    assert bucket.try_take(4.0)
+    assert not bucket.try_take(1.0)
+    assert bucket.wait_time(1.0) == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert bucket.try_take(1.0)
+    clock.now += 60
+    assert bucket.try_take(4.0)
+    assert not bucket.try_take(0.5)
+
+def test_wait_time_is_capped_at_the_bucket_size(clock):
+    bucket = TokenBucket(rate=1.0, capacity=2.0)
+    bucket.try_take(2.0)
+    assert bucket.wait_time(10.0) == pytest.approx(2.0)
+
+def test_shed_request_refunds_the_senders_allowance(pool):
+    controller = AdmissionController()
+    # One slot at one second per call: a bucket of two tokens refilling at one per second
+    assert controller.admit("user", cost=2).reason == "admitted"
+    decision = controller.admit("user")
+    assert (decision.admitted, decision.reason) == (False, "rate")
+    assert decision.retry_after == pytest.approx(1.0)
+
+    # Without the refund the second request would have used up the allowance of two
+    assert controller.admit("user", cached=True).reason == "cached"
+    assert controller.admit("user", cached=True).reason == "sender_rate"
+
+def test_deep_pool_queue_sheds_and_refunds(pool):
+    controller = AdmissionController()
+    pool.calls = admission.ADMISSION_MAX_QUEUE_FACTOR * pool.slots
+    assert controller.admit("user").reason == "queue_full"
+    pool.calls = 0
+    assert controller.admit("user").admitted
+    assert controller.admit("user", cached=True).admitted
+
+def test_new_sessions_do_not_reset_a_senders_allowance(pool):
+    controller = AdmissionController()
+    reasons = [controller.admit("user", cached=True, session=session).reason for session in "abc"]
+    assert reasons == ["cached", "cached", "sender_rate"]
+
+def test_relays_get_an_allowance_per_session(pool):
+    controller = AdmissionController()
+    reasons = [controller.admit("relay", cached=True, session=session).reason for session in "aab"]
+    assert reasons == ["cached", "cached", "cached"]
+    assert controller.admit("relay", cached=True, session="a").reason == "sender_rate"
+    # Relay requests without a session are not limited per sender
+    assert all(controller.admit("relay", cached=True).admitted for _ in range(5))
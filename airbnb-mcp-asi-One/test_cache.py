@@ -0,0 +1,66 @@
+# test_cache.py
+import pytest
+
+import cache
+from cache import TTLCache
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    return clock
+
+def test_entries_expire_after_their_ttl(clock):
+    entries = TTLCache(max_entries=4, ttl_seconds=10)
+    entries.set("a", 1)
+    entries.set("b", 2, ttl_seconds=30)
+
+    clock.now += 9
+    assert entries.get("a") == 1
+    assert entries.expires_in("a") == pytest.approx(1)
+
+    clock.now += 1
+    assert entries.get("a") is None
+    assert not entries.contains("a")
+    assert entries.expires_in("a") is None
+    assert entries.get("b") == 2
+    assert len(entries) == 1
+
+def test_least_recently_used_entry_is_evicted(clock):
+    entries = TTLCache(max_entries=2, ttl_seconds=10)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    entries.get("a")
+    entries.set("c", 3)
+
+    assert entries.get("b") is None
+    assert entries.get("a") == 1
+    assert entries.get("c") == 3
+
+def test_contains_and_expires_in_leave_lru_order_and_stats_alone(clock):
+    entries = TTLCache(max_entries=2, ttl_seconds=10)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    assert entries.contains("a") and entries.expires_in("a") == pytest.approx(10)
+    entries.set("c", 3)
+
+    assert not entries.contains("a")
+    assert entries.stats() == {"entries": 2, "hits": 0, "misses": 0, "hit_rate": 0.0}
+
+def test_setting_again_refreshes_the_ttl(clock):
+    entries = TTLCache(max_entries=2, ttl_seconds=10)
+    entries.set("a", 1)
+    clock.now += 8
+    entries.set("a", 2)
+    clock.now += 8
+
+    assert entries.get("a") == 2
+    assert entries.get("missing", "default") == "default"
+    assert entries.stats()["hit_rate"] == 0.5
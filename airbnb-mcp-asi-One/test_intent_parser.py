@@ -0,0 +1,76 @@
+# test_intent_parser.py
+from datetime import date
+
+import pytest
+
+from intent_parser import parse_intent
+
+TODAY = date(2026, 10, 17)
+
+# message -> (request type, parameters, whether it bypasses the AI agent)
+CASES = [
+    ("Find me a place in Barcelona June 5 to June 8 for 3 people",
+     ("search", {"location": "Barcelona", "checkin": "2027-06-05", "checkout": "2027-06-08", "adults": 3}, True)),
+    ("Find a place in Paris July 10-12",
+     ("search", {"location": "Paris", "checkin": "2027-07-10", "checkout": "2027-07-12"}, True)),
+    ("Airbnb in Denver August 1",
+     ("search", {"location": "Denver", "checkin": "2027-08-01"}, True)),
+    ("Stays in Rome Sept. 3-6",
+     ("search", {"location": "Rome", "checkin": "2027-09-03", "checkout": "2027-09-06"}, True)),
+    ("Find an airbnb in Lisbon from 2026-11-02 to 2026-11-05",
+     ("search", {"location": "Lisbon", "checkin": "2026-11-02", "checkout": "2026-11-05"}, True)),
+    ("find rentals in Cape Town, South Africa",
+     ("search", {"location": "Cape Town, South Africa"}, True)),
+    ("show me apartments in New York under $200 for 2 adults and a dog",
+     ("search", {"location": "New York", "adults": 2, "pets": 1, "maxPrice": 200}, True)),
+    ("rentals in Miami between $100 and $250 for a family of 4",
+     ("search", {"location": "Miami", "adults": 4, "minPrice": 100, "maxPrice": 250}, True)),
+    ("find the cheapest places in Lisbon under $150 rated 4.8+",
+     ("search", {"location": "Lisbon", "maxPrice": 150, "minRating": 4.8, "sort_by": "price"}, True)),
+    ("find rentals in Paris rated 4.8",
+     ("search", {"location": "Paris", "minRating": 4.8}, True)),
+    ("Find a place in Lisbon from the 3rd to the 6th of June",
+     ("search", {"location": "Lisbon", "checkin": "2027-06-03", "checkout": "2027-06-06"}, True)),
+    ("Find a place in Rome June 3 for 3 nights",
+     ("search", {"location": "Rome", "checkin": "2027-06-03", "checkout": "2027-06-06"}, True)),
+    ("Can you find me a place in Paris?",
+     ("search", {"location": "Paris"}, True)),
+    ("best-rated airbnbs in Kyoto",
+     ("search", {"location": "Kyoto", "sort_by": "rating"}, True)),
+    ("details for listing 12345678",
+     ("details", {"id": "12345678"}, True)),
+    ("tell me about https://www.airbnb.com/rooms/987654321",
+     ("details", {"id": "987654321"}, True)),
+    ("search places in Lisbon or Porto",
+     ("search", {"location": "Lisbon"}, False)),
+    ("what's the weather like?",
+     (None, {}, False)),
+]
+
+# Messages whose dates (or intent) the rules cannot pin down; they must go to the AI agent
+NOT_CONFIDENT = [
+    "Find a place in Paris from 12/05 to 12/08",
+    "Rentals in Rome 5/12-5/15",
+    "Airbnb in Madrid, 3 nights starting next friday",
+    "Find a place in Rome for 3 nights",
+    "Find a place in Berlin on the 5th",
+    "Find a place in Oslo next month",
+    "Find a place in Vienna in 2 weeks",
+    "Find a rental in Prague for Christmas",
+    "flying to London on Friday, find me a place",
+    "Find a place in Paris 2026-02-30",
+    "Find a rental in Tokyo Oct 3-1",
+    "Is it safe to stay in Paris?",
+]
+
+@pytest.mark.parametrize("text, expected", CASES, ids=[text for text, _ in CASES])
+def test_parse_intent(text, expected):
+    request_type, parameters, confident = expected
+    intent = parse_intent(text, today=TODAY)
+    assert intent.request_type == request_type
+    assert intent.parameters == parameters
+    assert intent.confident == confident
+
+@pytest.mark.parametrize("text", NOT_CONFIDENT)
+def test_unclear_messages_go_to_the_ai_agent(text):
+    assert not parse_intent(text, today=TODAY).confident
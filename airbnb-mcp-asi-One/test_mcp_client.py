@@ -0,0 +1,88 @@
+# test_mcp_client.py
+import asyncio
+
+import pytest
+
+from mcp_client import SingleFlight
+
+def test_concurrent_identical_calls_share_one_result():
+    calls = []
+
+    async def fetch(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def main():
+        group = SingleFlight()
+        results = await asyncio.gather(*(group.do(("search", 1), fetch, 21) for _ in range(5)))
+        other = await group.do(("search", 2), fetch, 1)
+        return group, results, other
+
+    group, results, other = asyncio.run(main())
+    assert results == [42] * 5
+    assert other == 2
+    assert calls == [21, 1]
+    assert group.coalesced == 4
+    assert group.in_flight() == 0
+
+def test_errors_reach_every_caller_and_are_not_cached():
+    attempts = 0
+
+    async def fail():
+        nonlocal attempts
+        attempts += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def main():
+        group = SingleFlight()
+        results = await asyncio.gather(group.do("key", fail), group.do("key", fail), return_exceptions=True)
+        with pytest.raises(RuntimeError):
+            await group.do("key", fail)
+        return results
+
+    results = asyncio.run(main())
+    assert [str(result) for result in results] == ["boom", "boom"]
+    assert attempts == 2
+
+def test_one_cancelled_caller_does_not_cancel_the_others():
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "listings"
+
+    async def main():
+        group = SingleFlight()
+        first = asyncio.create_task(group.do("key", fetch))
+        second = asyncio.create_task(group.do("key", fetch))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return group, await second, first
+
+    group, result, first = asyncio.run(main())
+    assert result == "listings"
+    assert first.cancelled()
+    assert group.abandoned == 0
+
+def test_call_is_cancelled_once_every_caller_gave_up():
+    finished = False
+
+    async def fetch():
+        nonlocal finished
+        await asyncio.sleep(0.05)
+        finished = True
+
+    async def main():
+        group = SingleFlight()
+        callers = [asyncio.create_task(group.do("key", fetch)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0.06)
+        return group
+
+    group = asyncio.run(main())
+    assert not finished
+    assert group.abandoned == 1
+    assert group.in_flight() == 0
@@ -0,0 +1,70 @@
+# test_pending_requests.py
+import asyncio
+import time
+
+from pending_requests import DeadlineScheduler, PendingRequestRegistry
+
+def run_scheduler(setup, wait: float = 0.1):
+    """Fired (key, payload) pairs, in order, after setup(scheduler) and `wait` seconds"""
+    fired = []
+
+    async def callback(key, payload):
+        fired.append((key, payload))
+
+    async def main():
+        scheduler = DeadlineScheduler(callback)
+        setup(scheduler, time.time())
+        await asyncio.sleep(wait)
+        await scheduler.close()
+        return scheduler
+
+    return asyncio.run(main()), fired
+
+def test_deadlines_fire_in_order_of_expiry():
+    def setup(scheduler, now):
+        scheduler.schedule("late", now + 0.06, 3)
+        scheduler.schedule("early", now + 0.02, 1)
+        scheduler.schedule("middle", now + 0.04, 2)
+
+    scheduler, fired = run_scheduler(setup)
+    assert fired == [("early", 1), ("middle", 2), ("late", 3)]
+    assert scheduler.fired == 3
+    assert len(scheduler) == 0
+
+def test_rescheduling_replaces_the_deadline():
+    def setup(scheduler, now):
+        scheduler.schedule("a", now + 0.01, "old")
+        scheduler.schedule("b", now + 0.03, "b")
+        scheduler.schedule("a", now + 0.05, "new")
+
+    _, fired = run_scheduler(setup)
+    assert fired == [("b", "b"), ("a", "new")]
+
+def test_cancelled_deadlines_do_not_fire():
+    def setup(scheduler, now):
+        scheduler.schedule("a", now + 0.02)
+        scheduler.schedule("b", now + 0.03)
+        assert scheduler.cancel("a")
+        assert not scheduler.cancel("missing")
+
+    scheduler, fired = run_scheduler(setup)
+    assert fired == [("b", None)]
+    assert scheduler.fired == 1
+
+def test_deadline_not_yet_due_stays_pending():
+    def setup(scheduler, now):
+        scheduler.schedule("a", now + 60)
+
+    scheduler, fired = run_scheduler(setup, wait=0.02)
+    assert fired == []
+    assert len(scheduler) == 1
+
+def test_stale_message_cannot_expire_the_newer_request():
+    requests = PendingRequestRegistry()
+    requests.register("session", "msg-1", "user", "first", 30)
+    newer = requests.register("session", "msg-2", "user", "second", 30)
+
+    assert requests.expire("session", "msg-1") is None
+    assert requests.expire("session", "msg-2") is newer
+    assert requests.resolve("session") is None
+    assert (requests.expired, requests.resolved) == (1, 0)
@@ -0,0 +1,81 @@
+# test_search_index.py
+import pytest
+
+from listings import Listing, normalize_min_rating, normalize_sort_by
+from search_index import SearchIndex
+
+DATES = {"checkin": "2027-06-05", "checkout": "2027-06-08"}
+
+def listing(number: int, price: float = None, rating: float = None, reviews: int = 0, guests: int = None) -> Listing:
+    return Listing(str(number), f"Home {number}", f"${price} night", f"{rating} out of 5", f"https://airbnb.com/rooms/{number}",
+                   price_value=price, rating_value=rating, review_count=reviews, guests=guests)
+
+PAGE = [
+    listing(1, price=180, rating=4.9, reviews=10),
+    listing(2, price=90, rating=4.6, reviews=50),
+    listing(3, price=120, rating=4.9, reviews=200),
+    listing(4, price=60, rating=None),
+    listing(5, price=None, rating=4.8),
+]
+
+@pytest.fixture
+def index():
+    index = SearchIndex(max_entries=8, ttl_seconds=60)
+    index.add("Lisbon", dict(DATES), len(PAGE), PAGE)
+    return index
+
+def ids(results):
+    return [item.id for item in results.listings]
+
+def test_price_and_rating_filters_are_answered_locally(index):
+    results = index.query(" lisbon ", 5, {**DATES, "maxPrice": 150}, min_rating=4.5)
+    assert ids(results) == ["2", "3"]
+    assert results.total == 2
+    assert index.answered == 1
+
+def test_sorting_puts_listings_without_a_value_last(index):
+    assert ids(index.query("Lisbon", 5, dict(DATES), sort_by="price")) == ["4", "2", "3", "1", "5"]
+    assert ids(index.query("Lisbon", 5, dict(DATES), sort_by="rating")) == ["3", "1", "5", "2", "4"]
+
+def test_unfiltered_query_keeps_the_page_total(index):
+    results = index.query("Lisbon", 2, dict(DATES), sort_by="price")
+    assert ids(results) == ["4", "2"]
+    assert results.total == len(PAGE)
+
+def test_searches_the_page_cannot_answer_go_to_the_server(index):
+    # Other dates, a wider price range than the page, a different pet count, and guests of unknown capacity
+    assert index.query("Lisbon", 5, {"checkin": "2027-07-01"}) is None
+    assert index.query("Porto", 5, dict(DATES)) is None
+    index.add("Porto", {**DATES, "maxPrice": 100}, 2, PAGE[1:2] + PAGE[3:4])
+    assert index.query("Porto", 1, {**DATES, "maxPrice": 200}) is None
+    assert index.query("Lisbon", 5, {**DATES, "pets": 1}) is None
+    assert index.query("Lisbon", 5, {**DATES, "adults": 4}) is None
+
+def test_thin_pages_are_not_used_for_incomplete_searches():
+    index = SearchIndex(max_entries=8, ttl_seconds=60)
+    index.add("Lisbon", dict(DATES), 100, PAGE)
+    assert index.query("Lisbon", 3, dict(DATES), min_rating=4.85) is None
+    assert ids(index.query("Lisbon", 2, dict(DATES), min_rating=4.85)) == ["1", "3"]
+
+@pytest.mark.parametrize("value, expected", [
+    (None, None), ("", None), (4.5, 4.5), (4, 4.0), ("4.5", 4.5), ("4.5+", 4.5), ("4.8 stars", 4.8), ("0", 0.0),
+])
+def test_normalize_min_rating(value, expected):
+    assert normalize_min_rating(value) == expected
+
+@pytest.mark.parametrize("value", ["high", "5.5", -1, True, "4.5 out of 5", [4.5]])
+def test_invalid_min_rating_is_rejected(value):
+    with pytest.raises(ValueError, match="minRating"):
+        normalize_min_rating(value)
+
+@pytest.mark.parametrize("value, expected", [
+    (None, None), ("price", "price"), ("Cheapest", "price"), ("lowest_price", "price"),
+    ("rating", "rating"), ("best-rated", "rating"), ("Top Rated", "rating"),
+])
+def test_normalize_sort_by(value, expected):
+    assert normalize_sort_by(value) == expected
+
+@pytest.mark.parametrize("value", ["bogus", "newest", 3])
+def test_invalid_sort_by_is_rejected(value):
+    with pytest.raises(ValueError, match="sort order"):
+        normalize_sort_by(value)